@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import platform
+import argparse
+import tempfile
+import subprocess
+
+DEFAULT_SIZES = (10, 1000, 10000)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous):
+    print('\n%-40s %12s %12s %8s' % ('benchmark', 'previous', 'current', 'ratio'))
+    for name, result in sorted(results.items()):
+        old = previous.get('results', {}).get(name)
+        if 'median' not in result or old is None or 'median' not in old:
+            continue
+        ratio = result['median'] / old['median'] if old['median'] else float('inf')
+        print('%-40s %9.2f ms %9.2f ms %7.2fx' % (name, old['median'] * 1000, result['median'] * 1000, ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Caribou benchmarks')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='Synthetic route file sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per benchmark, the median is reported')
+    parser.add_argument('--only', action='append', help='Only run the benchmarks whose name contains this')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='Results file of a previous run to compare with')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='caribou-benchmarks-')
+    # storage, history and caches are created under ~/.caribou, keep them out of the real one
+    os.environ['HOME'] = workdir
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    from .server import PayloadServer
+    from .suite import BenchmarkSuite
+
+    server = PayloadServer().start()
+    try:
+        sizes = [int(size) for size in args.sizes.split(',')]
+        results = BenchmarkSuite(workdir, sizes, args.repeat, server, args.only).run()
+    finally:
+        server.stop()
+
+    output = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sizes': sizes,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from .synthetic import json_payload
+
+
+class PayloadHandler(BaseHTTPRequestHandler):
+    # GET /payload?size=<bytes>&latency=<ms>&type=json|text
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate sends on a keep-alive connection, with
+    # Nagle's algorithm the body would wait for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def _respond(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        size = int(query.get('size', ['1024'])[0])
+        latency = float(query.get('latency', ['0'])[0])
+        content_type = query.get('type', ['json'])[0]
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        body = self.server.payload(size, content_type)
+        if latency:
+            time.sleep(latency / 1000)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json' if content_type == 'json' else 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PayloadServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), PayloadHandler)
+        self.payloads = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%s' % self.server_address[:2]
+
+    def payload(self, size, content_type):
+        key = (size, content_type)
+        with self.lock:
+            body = self.payloads.get(key)
+            if body is None:
+                if content_type == 'json':
+                    body = json_payload(size).encode()
+                else:
+                    body = (b'lorem ipsum dolor sit amet\n' * (size // 27 + 1))[:size]
+                self.payloads[key] = body
+        return body
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
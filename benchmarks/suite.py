@@ -0,0 +1,180 @@
+import os
+import time
+import shutil
+import statistics
+
+from caribou import loader, storage
+from caribou.loader import load_file
+from caribou.models import Request
+from caribou.storage import (
+    get_parameter_values_for_route, save_parameter, flush_storage, load_storage
+)
+from caribou.response import ResponseBody, format_response
+from caribou.execute import execute_request
+from caribou.transport import get_transport
+from caribou import highlight
+
+from .synthetic import write_route_file, storage_values, json_payload
+
+PAYLOAD_SIZES = (1024, 1024 * 1024, 8 * 1024 * 1024)
+LATENCIES = (0, 20)
+
+
+def measure(func, repeat, setup=None):
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return {
+        'runs': repeat,
+        'min': min(durations),
+        'median': statistics.median(durations),
+        'mean': statistics.mean(durations),
+        'max': max(durations),
+    }
+
+
+class BenchmarkSuite:
+    def __init__(self, workdir, sizes, repeat, server, only=None):
+        self.workdir = workdir
+        self.sizes = sizes
+        self.repeat = repeat
+        self.server = server
+        self.only = only
+        self.results = {}
+        self.routes = {}
+        # flushed explicitly by the storage benchmarks
+        storage.FLUSH_DELAY = 3600
+
+    def _enabled(self, name):
+        return self.only is None or any(part in name for part in self.only)
+
+    def add(self, name, func, repeat=None, setup=None):
+        if not self._enabled(name):
+            return
+        self.results[name] = measure(func, repeat or self.repeat, setup)
+        print('%-40s %10.2f ms' % (name, self.results[name]['median'] * 1000))
+
+    def skip(self, name, reason):
+        if self._enabled(name):
+            self.results[name] = {'skipped': reason}
+            print('%-40s %13s' % (name, 'skipped'))
+
+    def route_file(self, size):
+        path = os.path.join(self.workdir, 'routes_%s.py' % size)
+        if not os.path.exists(path):
+            write_route_file(path, size, groups=max(1, size // 100), base_url=self.server.url)
+        return path
+
+    def load_routes(self, size):
+        if size not in self.routes:
+            self.routes[size] = load_file(self.route_file(size))
+        return self.routes[size]
+
+    def bench_loader(self):
+        for size in self.sizes:
+            path = self.route_file(size)
+
+            def clear_caches():
+                loader._code_cache.clear()
+                shutil.rmtree(str(loader.BYTECODE_PATH), ignore_errors=True)
+
+            self.add('load_file.cold[%s]' % size, lambda: load_file(path), setup=clear_caches)
+            self.add('load_file.warm[%s]' % size, lambda: load_file(path))
+
+    def bench_storage(self):
+        for size in self.sizes:
+            routes = self.load_routes(size)
+            storage.GLOBAL_STORAGE.update(storage_values(routes))
+
+            def get_values():
+                for route in routes:
+                    get_parameter_values_for_route(route)
+
+            self.add('get_parameter_values_for_route[%s]' % size, get_values)
+
+            generation = [0]
+
+            def save_all():
+                generation[0] += 1
+                for route in routes:
+                    for parameter in route.parameters:
+                        save_parameter(route.storage_prefix, parameter, 'value %s' % generation[0])
+                flush_storage()
+
+            self.add('persist_storage[%s]' % size, save_all)
+            self.add('load_storage[%s]' % size, load_storage)
+
+    def bench_response(self):
+        for size in PAYLOAD_SIZES:
+            text = json_payload(size)
+            body = ResponseBody(text, len(text), is_json=True)
+            self.add('format_response[%s]' % size, lambda: format_response(body))
+            # larger results are only highlighted line by line
+            if size <= highlight.max_highlight_size():
+                formatted = format_response(body)
+                self.add('highlight[%s]' % size, lambda: highlight.document_spans(formatted))
+
+    def bench_http(self):
+        transport = get_transport()
+        for latency in LATENCIES:
+            for size in PAYLOAD_SIZES:
+                url = '%s/payload?size=%s&latency=%s' % (self.server.url, size, latency)
+                request = Request(url, 'GET')
+                self.add('execute_request[%s,%sms]' % (size, latency), lambda: execute_request(request))
+        transport.close()
+
+    def bench_widgets(self):
+        try:
+            from PySide2.QtWidgets import QApplication
+            from caribou.ui import MainWidget, ParameterWidget, ResultWidget
+        except ImportError as e:
+            for name in ('MainWidget', 'ParameterWidget', 'ResultWidget.set_result'):
+                self.skip(name, str(e))
+            return
+
+        app = QApplication.instance() or QApplication(['caribou-benchmarks'])
+
+        for size in self.sizes:
+            routes = self.load_routes(size)
+
+            def main_widget():
+                widget = MainWidget(routes)
+                app.processEvents()
+                widget.deleteLater()
+
+            self.add('MainWidget[%s]' % size, main_widget)
+
+        route = self.load_routes(self.sizes[0])[0]
+
+        def parameter_widget():
+            widget = ParameterWidget(route)
+            app.processEvents()
+            widget.deleteLater()
+
+        self.add('ParameterWidget', parameter_widget)
+
+        for size in PAYLOAD_SIZES:
+            text = format_response(ResponseBody(json_payload(size), size, is_json=True))
+            widget = ResultWidget(route)
+
+            def set_result():
+                widget.set_result(text, 200, 0.1)
+                # the text is appended over several event loop ticks
+                while widget.pending_text:
+                    app.processEvents()
+
+            self.add('ResultWidget.set_result[%s]' % size, set_result)
+            widget.deleteLater()
+        app.processEvents()
+
+    def run(self):
+        self.bench_loader()
+        self.bench_storage()
+        self.bench_response()
+        self.bench_http()
+        self.bench_widgets()
+        return self.results
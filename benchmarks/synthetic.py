@@ -0,0 +1,116 @@
+import random
+
+PARAM_TYPES = ('text', 'choice', 'list', 'text_field', 'generated')
+
+HEADER = '''import uuid
+import caribou
+
+BASE_URL = %(base_url)r
+
+
+def _generate_uuid():
+    return str(uuid.uuid4())
+
+'''
+
+GROUP = '''
+@caribou.group('group %(index)s')
+%(params)s
+def group_%(index)s(ctx, %(args)s):
+    ctx['base_url'] = BASE_URL
+'''
+
+ROUTE = '''
+@group_%(group)s.route()
+%(params)s
+def %(name)s(ctx, %(args)s):
+    return caribou.request.%(method)s(
+        ctx['base_url'] + %(path)r,
+        params={%(values)s},
+    )
+'''
+
+
+def param_name(index):
+    return 'param_%s' % index
+
+
+def _param(name, kind):
+    if kind == 'choice':
+        return '@caribou.param(%r, type=caribou.Choice(["a", "b", "c"]))' % name
+    if kind == 'list':
+        return '@caribou.param(%r, type=caribou.List())' % name
+    if kind == 'text_field':
+        return '@caribou.param(%r, type=caribou.TextField(), required=False)' % name
+    if kind == 'generated':
+        return '@caribou.param(%r, generator=_generate_uuid)' % name
+    return '@caribou.param(%r, default="value")' % name
+
+
+def _params(count):
+    names = [param_name(i) for i in range(count)]
+    decorators = '\n'.join(_param(name, PARAM_TYPES[i % len(PARAM_TYPES)]) for i, name in enumerate(names))
+    return names, decorators
+
+
+def route_name(index):
+    return 'route_%05d' % index
+
+
+def route_file(routes, groups=10, params=5, group_params=3, base_url='http://127.0.0.1:8080'):
+    # `routes` routes spread over `groups` groups, deterministic for a given size
+    parts = [HEADER % {'base_url': base_url}]
+
+    group_names, group_decorators = _params(group_params)
+    for index in range(groups):
+        parts.append(GROUP % {'index': index, 'params': group_decorators, 'args': ', '.join(group_names)})
+
+    names, decorators = _params(params)
+    for index in range(routes):
+        parts.append(ROUTE % {
+            'group': index % groups,
+            'name': route_name(index),
+            'params': decorators,
+            'args': ', '.join(names),
+            'method': 'get' if index % 2 else 'post',
+            'path': '/payload/%s' % index,
+            'values': ', '.join('%r: %s' % (name, name) for name in names),
+        })
+    return ''.join(parts)
+
+
+def write_route_file(path, routes, **kwargs):
+    with open(path, 'w') as f:
+        f.write(route_file(routes, **kwargs))
+    return path
+
+
+def storage_values(routes, seed=0):
+    # saved values for every parameter of `routes`, keyed like the storage
+    generator = random.Random(seed)
+    values = {}
+    for route in routes:
+        parameters = [(route.storage_prefix, parameter) for parameter in route.parameters]
+        if route.group is not None:
+            parameters += [(route.group.storage_prefix, parameter) for parameter in route.group.parameters]
+        for prefix, parameter in parameters:
+            if parameter.type is not None and hasattr(parameter.type, 'options'):
+                value = generator.choice(parameter.type.options)
+            else:
+                value = '%x' % generator.getrandbits(64)
+            values[parameter.storage_path(prefix)] = value
+    return values
+
+
+def json_payload(size, seed=0):
+    # a JSON document of about `size` bytes, nested like a typical API response
+    generator = random.Random(seed)
+    items = []
+    length = 2
+    while length < size:
+        item = '{"id": %d, "name": "item %x", "active": %s, "score": %.3f, "tags": ["a", "b"]}' % (
+            len(items), generator.getrandbits(32), 'true' if generator.random() > 0.5 else 'false', generator.random()
+        )
+        items.append(item)
+        length += len(item) + 2
+    return '[%s]' % ', '.join(items)
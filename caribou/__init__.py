@@ -1,5 +1,5 @@
 from .decorators import group, param, route, request
-from .models import Route, Parameter, Group, Choice, List, TextField
+from .models import Route, Parameter, Group, Choice, List, TextField, File
 from .exceptions import CaribouException
 from packaging import version
 
@@ -0,0 +1,468 @@
+import io
+import os
+import ssl
+import time
+import socket
+import zlib
+import asyncio
+import http.client
+from collections import defaultdict
+from threading import Thread, Lock, Event
+from typing import NamedTuple
+from urllib.parse import urlsplit, urljoin
+from urllib.request import getproxies
+
+import certifi
+import requests
+from requests.cookies import MockRequest, MockResponse, get_cookie_header
+from requests.utils import get_encoding_from_headers
+
+from . import __version__
+from .storage import load_setting
+from .exceptions import CaribouException
+from .transport import get_transport, resolve_timeout
+from .response import CHUNK_SIZE, BodyReader, is_json_response
+from .execute import request_kwargs, timed_result
+from .upload import UploadStream
+from .download import DownloadReader, download_target
+from .timing import TimingRecorder
+
+DEFAULT_POOL_SIZE = 100
+MAX_REDIRECTS = 30
+MAX_HEADER_SIZE = 1024 * 1024
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'caribou/%s' % __version__,
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept': '*/*',
+    'Connection': 'keep-alive',
+}
+
+
+class AsyncResponse(NamedTuple):
+    url: str
+    status_code: int
+    headers: http.client.HTTPMessage
+    connection: object
+    read_timeout: float = None
+
+
+class _StaleConnection(Exception):
+    pass
+
+
+class _Connection:
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.reusable = True
+
+    def close(self):
+        self.reusable = False
+        self.writer.close()
+
+
+def _decompressor(headers):
+    encoding = headers.get('Content-Encoding', '').strip().lower()
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    return None
+
+
+async def _with_timeout(awaitable, timeout, error):
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise error('Timed out after %ss' % timeout) from None
+
+
+def _connection_key(url):
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    return parts.scheme, parts.hostname, port
+
+
+class AsyncEngine:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, cookies=None):
+        self.pool_size = pool_size
+        self.cookies = cookies
+        self.loop = None
+        self.thread = None
+        self.ready = Event()
+        self.lock = Lock()
+
+        self.idle = defaultdict(list)
+        self.semaphores = {}
+        self.ssl_context = ssl.create_default_context(cafile=certifi.where())
+
+    # event loop thread
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(target=self._run_loop, name='caribou-asyncio', daemon=True)
+                self.thread.start()
+        self.ready.wait()
+
+    def submit(self, coroutine):
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def close(self):
+        if self.loop is None:
+            return
+        self.submit(self._close_connections()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def _close_connections(self):
+        for connections in self.idle.values():
+            for connection in connections:
+                connection.close()
+        self.idle.clear()
+
+    # connections
+
+    def _semaphore(self, key):
+        semaphore = self.semaphores.get(key)
+        if semaphore is None:
+            semaphore = self.semaphores[key] = asyncio.Semaphore(self.pool_size)
+        return semaphore
+
+    async def _open_connection(self, key, timing):
+        scheme, host, port = key
+        ssl_context = self.ssl_context if scheme == 'https' else None
+        if timing is None:
+            return await asyncio.open_connection(host, port, ssl=ssl_context, limit=MAX_HEADER_SIZE)
+
+        # resolve here so DNS is timed apart, the TLS handshake is part of connect
+        start = time.perf_counter()
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        resolved = time.perf_counter()
+        timing.dns += resolved - start
+
+        error = None
+        try:
+            for address in dict.fromkeys(info[4][0] for info in infos):
+                try:
+                    return await asyncio.open_connection(
+                        address, port,
+                        ssl=ssl_context,
+                        server_hostname=host if ssl_context is not None else None,
+                        limit=MAX_HEADER_SIZE,
+                    )
+                except OSError as e:
+                    error = e
+            raise error
+        finally:
+            timing.connect += time.perf_counter() - resolved
+
+    async def _acquire(self, key, fresh=False, connect_timeout=None, timing=None):
+        await self._semaphore(key).acquire()
+        try:
+            idle = self.idle[key]
+            while idle and not fresh:
+                connection = idle.pop()
+                if not connection.reader.at_eof() and not connection.writer.is_closing():
+                    return connection, True
+                connection.close()
+
+            reader, writer = await _with_timeout(
+                self._open_connection(key, timing), connect_timeout, requests.ConnectTimeout
+            )
+            return _Connection(key, reader, writer), False
+        except BaseException:
+            self._semaphore(key).release()
+            raise
+
+    def _release(self, connection):
+        if connection.reusable and not connection.reader.at_eof():
+            self.idle[connection.key].append(connection)
+        else:
+            connection.close()
+        self._semaphore(connection.key).release()
+
+    def _discard(self, response):
+        # for a response whose body will never be read
+        response.connection.reusable = False
+        self._release(response.connection)
+
+    # HTTP/1.1
+
+    def _request_head(self, method, url, headers, body):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        all_headers = requests.structures.CaseInsensitiveDict(DEFAULT_HEADERS)
+        all_headers['Host'] = parts.netloc.rpartition('@')[2]
+        all_headers.update(headers)
+        if body is not None and 'Content-Length' not in all_headers and 'Transfer-Encoding' not in all_headers:
+            all_headers['Content-Length'] = str(len(body))
+
+        lines = ['%s %s HTTP/1.1' % (method, path)]
+        lines += ['%s: %s' % (name, value) for name, value in all_headers.items() if value is not None]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _read_head(self, reader):
+        while True:
+            data = await reader.readuntil(b'\r\n\r\n')
+            status_line, _, rest = data.partition(b'\r\n')
+            version, status, *_ = status_line.decode('latin-1').split(' ', 2)
+            status = int(status)
+            if status != 100:
+                return version, status, http.client.parse_headers(io.BytesIO(rest))
+
+    async def _write_stream(self, writer, body, chunked):
+        # file reads run on the executor, the loop keeps serving other requests
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, body.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+            await writer.drain()
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+
+    async def _send_once(self, method, url, headers, body, timeout, timing=None, fresh=False):
+        connect_timeout, read_timeout = timeout
+        key = _connection_key(url)
+        if isinstance(body, UploadStream) and body.tell():
+            # sent again after a redirect or a stale connection
+            body.seek(0)
+        connection, reused = await self._acquire(key, fresh, connect_timeout, timing)
+        try:
+            start = time.perf_counter()
+            connection.writer.write(self._request_head(method, url, headers, body))
+            if hasattr(body, 'read'):
+                chunked = 'chunked' in requests.structures.CaseInsensitiveDict(headers).get('Transfer-Encoding', '')
+                await self._write_stream(connection.writer, body, chunked)
+            elif body:
+                connection.writer.write(body)
+            await connection.writer.drain()
+            sent = time.perf_counter()
+            version, status, response_headers = await _with_timeout(
+                self._read_head(connection.reader), read_timeout, requests.ReadTimeout
+            )
+            if timing is not None:
+                timing.send += sent - start
+                timing.wait += time.perf_counter() - sent
+        except BaseException as e:
+            connection.close()
+            self._release(connection)
+            if reused and isinstance(e, (ConnectionError, asyncio.IncompleteReadError)):
+                raise _StaleConnection() from e
+            raise
+
+        if version == 'HTTP/1.0' or response_headers.get('Connection', '').lower() == 'close':
+            connection.reusable = False
+        return AsyncResponse(url, status, response_headers, connection, read_timeout), reused
+
+    async def _send(self, method, url, headers, body, timeout, timing=None):
+        try:
+            return await self._send_once(method, url, headers, body, timeout, timing)
+        except _StaleConnection:
+            # the server closed the idle keep-alive connection, retry on a new one
+            return await self._send_once(method, url, headers, body, timeout, timing, fresh=True)
+
+    async def iter_body(self, method, response):
+        connection = response.connection
+        reader = connection.reader
+        headers = response.headers
+        decompressor = _decompressor(headers)
+
+        def decode(data):
+            return decompressor.decompress(data) if decompressor is not None else data
+
+        def read(awaitable):
+            return _with_timeout(awaitable, response.read_timeout, requests.ReadTimeout)
+
+        try:
+            if method == 'HEAD' or response.status_code in (204, 304) or response.status_code < 200:
+                return
+
+            if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+                while True:
+                    line = await read(reader.readuntil(b'\r\n'))
+                    size = int(line.split(b';')[0].strip(), 16)
+                    if size == 0:
+                        while await read(reader.readuntil(b'\r\n')) != b'\r\n':
+                            pass
+                        break
+                    while size > 0:
+                        data = await read(reader.read(min(size, CHUNK_SIZE)))
+                        if not data:
+                            raise asyncio.IncompleteReadError(b'', size)
+                        size -= len(data)
+                        yield decode(data)
+                    await read(reader.readexactly(2))
+            elif headers.get('Content-Length') is not None:
+                remaining = int(headers['Content-Length'])
+                while remaining > 0:
+                    data = await read(reader.read(min(remaining, CHUNK_SIZE)))
+                    if not data:
+                        raise asyncio.IncompleteReadError(b'', remaining)
+                    remaining -= len(data)
+                    yield decode(data)
+            else:
+                connection.reusable = False
+                while True:
+                    data = await read(reader.read(CHUNK_SIZE))
+                    if not data:
+                        break
+                    yield decode(data)
+
+            if decompressor is not None:
+                yield decompressor.flush()
+        except BaseException:
+            connection.reusable = False
+            raise
+        finally:
+            self._release(connection)
+
+    async def _drain(self, method, response):
+        async for _ in self.iter_body(method, response):
+            pass
+
+    async def _read_body(self, method, response, reader):
+        chunks = self.iter_body(method, response)
+        try:
+            async for chunk in chunks:
+                reader.feed(chunk)
+        except BaseException:
+            reader.abort()
+            raise
+        finally:
+            # releases the connection when `feed` raised mid-body
+            await chunks.aclose()
+        return reader.close()
+
+    async def open(self, request, timing=None, on_upload_progress=None):
+        # sends the request, following redirects like requests does, and
+        # returns the final response with its body still to be read
+        prepared = requests.Request(
+            request.method, request.url, **request_kwargs(request, on_upload_progress)
+        ).prepare()
+        method = prepared.method
+        url = prepared.url
+        headers = dict(prepared.headers)
+        body = prepared.body.encode('utf-8') if isinstance(prepared.body, str) else prepared.body
+        timeout = resolve_timeout(request.timeout)
+
+        for _ in range(MAX_REDIRECTS + 1):
+            prepared.url = url
+            request_headers = dict(headers)
+            if self.cookies is not None:
+                cookie = get_cookie_header(self.cookies, prepared)
+                if cookie:
+                    request_headers['Cookie'] = cookie
+
+            response, reused = await self._send(method, url, request_headers, body, timeout, timing)
+            try:
+                if self.cookies is not None:
+                    self.cookies.extract_cookies(MockResponse(response.headers), MockRequest(prepared))
+                location = response.headers.get('Location')
+            except BaseException:
+                self._discard(response)
+                raise
+            if response.status_code not in REDIRECT_STATUSES or location is None:
+                return response, reused
+
+            await self._drain(method, response)
+            new_url = urljoin(url, location)
+            if urlsplit(new_url).netloc != urlsplit(url).netloc:
+                headers.pop('Authorization', None)
+            if response.status_code == 303 and method != 'HEAD' or \
+                    response.status_code in (301, 302) and method == 'POST':
+                method = 'GET'
+                body = None
+                headers.pop('Content-Length', None)
+                headers.pop('Content-Type', None)
+            url = new_url
+
+        raise requests.TooManyRedirects('Exceeded %s redirects.' % MAX_REDIRECTS)
+
+    async def send(self, request):
+        response, _ = await self.open(request)
+        await self._drain(request.method, response)
+        return response.status_code
+
+    async def execute(self, request, on_connection=None, on_chunk=None, on_progress=None, on_upload_progress=None):
+        recorder = TimingRecorder()
+        start = time.perf_counter()
+        response, reused = await self.open(request, recorder, on_upload_progress)
+        try:
+            if on_connection is not None:
+                on_connection(reused)
+
+            target = download_target(request, response.status_code, response.headers, response.url)
+            if target is not None:
+                reader = DownloadReader(target, response.headers.get('Content-Type'), request.checksum, on_progress)
+            else:
+                reader = BodyReader(
+                    get_encoding_from_headers(response.headers),
+                    is_json_response(response.headers),
+                    on_chunk=on_chunk,
+                    on_progress=on_progress,
+                    checksum=request.checksum,
+                )
+        except BaseException:
+            self._discard(response)
+            raise
+        download_start = time.perf_counter()
+        body = await self._read_body(request.method, response, reader)
+        recorder.download = time.perf_counter() - download_start
+
+        # decoding large bodies would stall every other request on the loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, timed_result, body, response.status_code, start, recorder, reused
+        )
+
+
+_engine = None
+_engine_lock = Lock()
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncEngine(
+                pool_size=int(load_setting('engine_pool_size') or DEFAULT_POOL_SIZE),
+                cookies=get_transport().cookies,
+            )
+        return _engine
+
+
+def unsupported_reason():
+    # the engine connects directly with certifi's CA bundle, it doesn't
+    # go through proxies or use a custom CA bundle like requests does
+    proxies = {scheme: url for scheme, url in getproxies().items() if scheme in ('http', 'https', 'all')}
+    if proxies:
+        return 'a proxy is configured (%s)' % ', '.join(sorted(proxies))
+    for name in ('REQUESTS_CA_BUNDLE', 'CURL_CA_BUNDLE'):
+        if os.environ.get(name):
+            return '%s is set' % name
+    return None
+
+
+def check_supported():
+    reason = unsupported_reason()
+    if reason is not None:
+        raise CaribouException('The asyncio engine can not be used: %s' % reason)
+
+
+def use_asyncio():
+    return load_setting('engine') == 'asyncio' and unsupported_reason() is None
@@ -1,8 +1,222 @@
-from caribou.ui import run
+import sys
+import json
+import argparse
+import traceback
 
+from caribou.exceptions import CaribouException
 
-def main():
-    run()
+
+def parse_params(values):
+    params = {}
+    for value in values:
+        name, sep, param_value = value.partition('=')
+        if not sep:
+            raise CaribouException('Invalid parameter "%s", expected name=value' % value)
+        params[name] = param_value
+    return params
+
+
+def find_route(routes, name):
+    # `name` is a route name or a qualified `module.group.route` name, a
+    # bare name shared by several modules has to be qualified
+    for route in routes:
+        if route.qualified_name == name:
+            return route
+    matches = [
+        route for route in routes
+        if route.name == name or (route.module is not None and '%s.%s' % (route.module, route.name) == name)
+    ]
+    if len(matches) > 1:
+        raise CaribouException('Ambiguous route name %s: %s' % (name, ', '.join(route.qualified_name for route in matches)))
+    if not matches:
+        raise CaribouException('Route not found: %s' % name)
+    return matches[0]
+
+
+def load_route(args):
+    from caribou.loader import load_routes
+    from caribou.storage import load_storage, get_parameter_values_for_route
+    from caribou.generators import generate_value
+
+    load_storage()
+    route = find_route(load_routes(args.path), args.route)
+    group_values, route_values = get_parameter_values_for_route(route, parse_params(args.param), generate_value)
+    return route, group_values, route_values
+
+
+def run_command(args):
+    from caribou.execute import execute_request
+
+    route, group_values, route_values = load_route(args)
+    request = route.get_request(group_values, route_values)
+    if args.output is not None:
+        request = request._replace(download=args.output)
+    # max_result_size only protects the GUI, the whole body is printed here
+    result = execute_request(request, max_size=sys.maxsize)
+    body = result.body
+
+    if args.raw:
+        sys.stdout.write(result.text + '\n')
+    else:
+        json.dump({
+            'route': route.name,
+            'method': request.method,
+            'url': request.url,
+            'status': result.status_code,
+            'elapsed': result.elapsed,
+            'timing': result.timing.to_dict(),
+            'cache': result.cache,
+            'download': body.download_path if body is not None else None,
+            'checksum_error': body.checksum_error if body is not None else None,
+            'body': result.data if result.is_json else result.text,
+        }, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if body is not None and body.checksum_error is not None:
+        return 1
+    return 0 if result.status_code < 400 else 1
+
+
+def load_command(args):
+    from caribou.loadtest import LoadTest
+
+    route, group_values, route_values = load_route(args)
+    if args.duration is None and args.requests is None:
+        args.duration = 10
+
+    load_test = LoadTest(
+        route, group_values, route_values,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        duration=args.duration,
+        total=args.requests,
+        engine=args.engine,
+    )
+    load_test.start()
+    try:
+        while not load_test.wait(timeout=1):
+            sys.stderr.write(load_test.snapshot().format() + '\n')
+    except KeyboardInterrupt:
+        load_test.stop()
+        load_test.wait()
+
+    snapshot = load_test.snapshot()
+    sys.stderr.write(snapshot.format() + '\n')
+    json.dump(snapshot.to_dict(), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0 if snapshot.errors == 0 else 1
+
+
+def select_routes(routes, groups, names):
+    if names:
+        return [find_route(routes, name) for name in names]
+    if groups:
+        selected = [route for route in routes if route.group is not None and route.group.name in groups]
+        if not selected:
+            raise CaribouException('No route in group: %s' % ', '.join(groups))
+        return selected
+    return routes
+
+
+def run_all_command(args):
+    from caribou.loader import load_routes
+    from caribou.storage import load_storage
+    from caribou.collection import CollectionRun
+
+    load_storage()
+    routes = select_routes(load_routes(args.path), args.group, args.route)
+    complete = not args.group and not args.route
+    run = CollectionRun(routes, parallelism=args.parallel, overrides=parse_params(args.param), complete=complete)
+    for message in run.dropped_messages():
+        sys.stderr.write(message + '\n')
+    run.start()
+
+    shown = 0
+    try:
+        while True:
+            done = run.wait(timeout=0.2)
+            for result in run.results_since(shown):
+                sys.stderr.write(result.format() + '\n')
+                shown += 1
+            if done:
+                break
+    except KeyboardInterrupt:
+        run.stop()
+        run.wait()
+
+    summary = run.summary()
+    sys.stderr.write('%(passed)s passed, %(failed)s failed, %(skipped)s skipped in %(elapsed).1fs\n' % summary)
+    json.dump({
+        'summary': summary,
+        'results': [result.to_dict() for result in run.results],
+    }, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0 if summary['passed'] == summary['total'] else 1
+
+
+COMMANDS = {
+    'run': run_command,
+    'load': load_command,
+    'run-all': run_all_command,
+}
+
+
+def add_route_arguments(parser):
+    parser.add_argument('path', help='Route file or workspace directory')
+    parser.add_argument('route', help='Route name')
+    parser.add_argument('-p', '--param', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override a parameter value (repeatable)')
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='caribou')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='Execute a route without the GUI')
+    add_route_arguments(run_parser)
+    run_parser.add_argument('--raw', action='store_true', help='Only print the response body')
+    run_parser.add_argument('-o', '--output', metavar='PATH',
+                            help='Save the response body to a file or directory instead of printing it')
+
+    load_parser = subparsers.add_parser('load', help='Load test a route')
+    add_route_arguments(load_parser)
+    load_parser.add_argument('-c', '--concurrency', type=int, default=10, help='Number of concurrent workers')
+    load_parser.add_argument('-r', '--rate', type=float, default=None,
+                             help='Constant arrival rate in requests per second (default: as fast as possible)')
+    load_parser.add_argument('-d', '--duration', type=float, default=None, help='Duration in seconds (default: 10)')
+    load_parser.add_argument('-n', '--requests', type=int, default=None, help='Total number of requests')
+    load_parser.add_argument('-e', '--engine', choices=('threads', 'asyncio'), default='threads',
+                             help='Run requests from worker threads or on an asyncio event loop')
+
+    run_all_parser = subparsers.add_parser('run-all', help='Execute every route of a file, or of some groups')
+    run_all_parser.add_argument('path', help='Route file or workspace directory')
+    run_all_parser.add_argument('-g', '--group', action='append', default=[], help='Only run this group (repeatable)')
+    run_all_parser.add_argument('--route', action='append', default=[], help='Only run this route (repeatable)')
+    run_all_parser.add_argument('-j', '--parallel', type=int, default=4, help='Number of routes run at the same time')
+    run_all_parser.add_argument('-p', '--param', action='append', default=[], metavar='NAME=VALUE',
+                                help='Override a parameter value for every route (repeatable)')
+
+    return parser
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv and argv[0] in COMMANDS:
+        args = create_parser().parse_args(argv)
+        try:
+            sys.exit(COMMANDS[args.command](args))
+        except CaribouException as e:
+            sys.stderr.write('%s\n' % e)
+            sys.exit(2)
+        except Exception:
+            traceback.print_exc()
+            sys.exit(2)
+
+    # the GUI pulls in Qt, only import it when needed
+    from caribou.ui import run
+    run(argv[0] if argv else None)
 
 
 if __name__ == '__main__':
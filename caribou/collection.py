@@ -0,0 +1,236 @@
+import time
+from threading import Thread, Condition
+from typing import NamedTuple, Any
+
+from .exceptions import CaribouException
+from .storage import get_parameter_values_for_route
+from .execute import execute_request
+from .generators import generate_value
+from .download import remove_download
+from .transport import CancelToken, RequestCancelled
+
+DEFAULT_PARALLELISM = 4
+
+SKIPPED = 'skipped'
+CANCELLED = 'cancelled'
+
+
+class RouteRunResult(NamedTuple):
+    route: Any
+    status: Any
+    elapsed: float
+    size: int = 0
+    url: str = None
+    error: str = None
+
+    @property
+    def ok(self):
+        return isinstance(self.status, int) and 0 < self.status < 400
+
+    def format(self):
+        return '%-40s %-16s %8.1f ms %10s  %s' % (
+            self.route.qualified_name, self.status, self.elapsed * 1000, self.size, self.error or self.url or ''
+        )
+
+    def to_dict(self):
+        return {
+            'route': self.route.name,
+            'group': self.route.group.name if self.route.group is not None else None,
+            'module': self.route.module,
+            'status': self.status,
+            'elapsed': self.elapsed,
+            'size': self.size,
+            'url': self.url,
+            'error': self.error,
+        }
+
+
+def _resolve_after(route, name, per_name):
+    # a name in `after` refers to the route of the same group, then of the
+    # same module, and otherwise to every route with that name
+    candidates = [other for other in per_name.get(name, ()) if other is not route]
+    if route.group is not None:
+        same_group = [other for other in candidates if other.group is route.group]
+        if same_group:
+            return same_group
+    if route.module is not None:
+        same_module = [other for other in candidates if other.module == route.module]
+        if same_module:
+            return same_module
+    return candidates
+
+
+def check_dependencies(routes, complete=True):
+    # returns route -> routes it waits for, and the (route, name) pairs of
+    # `after` names not found in `routes`: an error when `routes` is the
+    # complete set, dropped from a run of a subset
+    per_name = {}
+    for route in routes:
+        per_name.setdefault(route.name, []).append(route)
+    dependencies = {}
+    dropped = []
+    for route in routes:
+        dependencies[route] = []
+        for name in route.after:
+            resolved = _resolve_after(route, name, per_name)
+            if not resolved:
+                if complete:
+                    raise CaribouException('Unknown route %s in the order of %s' % (name, route.qualified_name))
+                dropped.append((route, name))
+            dependencies[route] += resolved
+
+    visiting = set()
+    visited = set()
+
+    def visit(route, path):
+        if route in visited:
+            return
+        if route in visiting:
+            raise CaribouException('Circular route order: %s' % ' -> '.join(path + [route.qualified_name]))
+        visiting.add(route)
+        for dependency in dependencies[route]:
+            visit(dependency, path + [route.qualified_name])
+        visiting.discard(route)
+        visited.add(route)
+
+    for route in routes:
+        visit(route, [])
+    return dependencies, dropped
+
+
+class CollectionRun:
+    # executes routes concurrently, a route with `after` waits for those routes
+    # and is skipped when one of them failed
+    def __init__(self, routes, parallelism=DEFAULT_PARALLELISM, overrides=None, complete=True):
+        self.routes = list(routes)
+        self.parallelism = max(1, parallelism)
+        self.overrides = overrides
+        self.dependencies, self.dropped = check_dependencies(self.routes, complete)
+
+        self.condition = Condition()
+        self.pending = list(self.routes)
+        self.running = {}
+        self.finished = {}
+        self.results = []
+        self.stopped = False
+        self.start_time = None
+        self.end_time = None
+        self.threads = []
+        self.finisher = None
+
+    def dropped_messages(self):
+        return ['%s: not waiting for %s, not in this run' % (route.qualified_name, name) for route, name in self.dropped]
+
+    def _next_route(self):
+        # returns (route, cancel token, failed dependencies), or None when nothing is left
+        with self.condition:
+            while not self.stopped and self.pending:
+                for route in self.pending:
+                    dependencies = self.dependencies[route]
+                    if all(dependency in self.finished for dependency in dependencies):
+                        self.pending.remove(route)
+                        token = CancelToken()
+                        self.running[route] = token
+                        failed = [dependency for dependency in dependencies if not self.finished[dependency].ok]
+                        return route, token, failed
+                self.condition.wait()
+            return None
+
+    def _record(self, result):
+        with self.condition:
+            self.running.pop(result.route, None)
+            self.finished[result.route] = result
+            self.results.append(result)
+            self.condition.notify_all()
+
+    def _execute(self, route, token):
+        start = time.perf_counter()
+        url = None
+        try:
+            group_values, route_values = get_parameter_values_for_route(route, self.overrides, generate_value)
+            request = route.get_request(group_values, route_values)
+            url = request.url
+            result = execute_request(request, cancel_token=token)
+            if result.body is not None and result.body.download_path is not None and not isinstance(request.download, str):
+                # only the summary is reported, saved files aren't kept
+                remove_download(result.body.download_path)
+            size = result.body.size if result.body is not None else len(result.text)
+            if result.body is not None and result.body.checksum_error is not None:
+                return RouteRunResult(route, 'checksum', result.elapsed, size, url, result.body.checksum_error)
+            return RouteRunResult(route, result.status_code, result.elapsed, size, url)
+        except RequestCancelled:
+            return RouteRunResult(route, CANCELLED, time.perf_counter() - start, url=url)
+        except CaribouException as e:
+            return RouteRunResult(route, 'error', time.perf_counter() - start, url=url, error=str(e))
+        except Exception as e:
+            return RouteRunResult(route, type(e).__name__, time.perf_counter() - start, url=url, error=str(e))
+
+    def _worker(self):
+        while True:
+            item = self._next_route()
+            if item is None:
+                break
+            route, token, failed = item
+            if failed:
+                result = RouteRunResult(
+                    route, SKIPPED, 0, error='%s failed' % ', '.join(dependency.qualified_name for dependency in failed)
+                )
+            else:
+                result = self._execute(route, token)
+            self._record(result)
+
+    def _finish(self):
+        for thread in self.threads:
+            thread.join()
+        with self.condition:
+            self.end_time = time.monotonic()
+
+    def start(self):
+        self.start_time = time.monotonic()
+        for _ in range(min(self.parallelism, len(self.routes)) or 1):
+            self.threads.append(Thread(target=self._worker, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        self.finisher = Thread(target=self._finish, daemon=True)
+        self.finisher.start()
+
+    def stop(self):
+        # routes not started yet are dropped, the running ones are cancelled
+        with self.condition:
+            self.stopped = True
+            tokens = list(self.running.values())
+            self.condition.notify_all()
+        for token in tokens:
+            token.cancel()
+
+    def wait(self, timeout=None):
+        self.finisher.join(timeout)
+        return not self.finisher.is_alive()
+
+    def is_running(self):
+        return self.start_time is not None and self.end_time is None
+
+    def results_since(self, index):
+        with self.condition:
+            return self.results[index:]
+
+    def failures(self):
+        with self.condition:
+            return [result for result in self.results if not result.ok]
+
+    def summary(self):
+        with self.condition:
+            results = list(self.results)
+            end = self.end_time or time.monotonic()
+            elapsed = end - self.start_time if self.start_time is not None else 0
+        passed = sum(1 for result in results if result.ok)
+        skipped = sum(1 for result in results if result.status == SKIPPED)
+        return {
+            'total': len(self.routes),
+            'completed': len(results),
+            'passed': passed,
+            'failed': len(results) - passed - skipped,
+            'skipped': skipped,
+            'not_run': len(self.routes) - len(results),
+            'elapsed': elapsed,
+        }
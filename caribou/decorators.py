@@ -21,15 +21,15 @@ class RequestApi():
 request = RequestApi()
 
 
-def group(name):
+def group(name, ttl=None, expires=None, cache=True):
     def decorator(func):
-        return Group(func, name=name)
+        return Group(func, name=name, ttl=ttl, expires=expires, cache=cache)
     return decorator
 
 
-def route():
+def route(timeout=None, after=None, download=None):
     def decorator(func):
-        return Route(func)
+        return Route(func, timeout=timeout, after=after, download=download)
     return decorator
 
 
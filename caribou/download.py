@@ -0,0 +1,194 @@
+import os
+import re
+import time
+from pathlib import Path
+from urllib.parse import urlsplit, unquote
+
+from .storage import load_setting
+from .response import CHUNK_SIZE, PROGRESS_INTERVAL, Checksum, ResponseBody, format_size, prune_files
+
+DOWNLOAD_PATH = Path(os.path.expanduser('~/.caribou/downloads'))
+DEFAULT_DOWNLOAD_SIZE = 1024 * 1024 * 1024
+# start of the body shown as a hex dump
+PREVIEW_SIZE = 4 * 1024
+HEX_LINE_SIZE = 16
+
+# application/* types that are still decoded as text
+TEXT_SUBTYPES = ('json', 'xml', 'javascript', 'x-www-form-urlencoded', 'yaml', 'csv', 'html', 'graphql')
+BINARY_TYPES = ('application', 'image', 'audio', 'video', 'font', 'model')
+
+
+def download_dir():
+    return Path(os.path.expanduser(load_setting('download_path') or str(DOWNLOAD_PATH)))
+
+
+def max_download_size():
+    return int(load_setting('download_max_size') or DEFAULT_DOWNLOAD_SIZE)
+
+
+def prune_downloads(keep=None, max_size=None):
+    # only the default directory belongs to caribou, a configured
+    # download_path can hold the user's own files
+    directory = download_dir()
+    if directory != DOWNLOAD_PATH:
+        return
+    if max_size is None:
+        max_size = max_download_size()
+    paths = [path for path in directory.glob('*') if path.is_file() and path.suffix != '.part']
+    prune_files(paths, max_size, keep)
+
+
+def remove_download(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def download_binary():
+    # binary responses are saved to the download directory unless disabled
+    return load_setting('download_binary') is not False
+
+
+def is_binary_content_type(content_type):
+    # responses without a content type are decoded as text
+    mime = (content_type or '').split(';')[0].strip().lower()
+    if mime.split('/')[0] not in BINARY_TYPES:
+        return False
+    return not any(subtype in mime for subtype in TEXT_SUBTYPES)
+
+
+def response_filename(headers, url):
+    disposition = headers.get('Content-Disposition', '')
+    match = re.search(r"filename\*\s*=\s*(?:[\w-]+'[\w-]*')?([^;]+)", disposition, re.IGNORECASE)
+    if match is not None:
+        name = unquote(match.group(1).strip().strip('"'))
+    else:
+        match = re.search(r'filename\s*=\s*"?([^";]+)"?', disposition, re.IGNORECASE)
+        name = match.group(1) if match is not None else unquote(urlsplit(url).path.rpartition('/')[2])
+    # never leave the download directory
+    name = name.replace('\\', '/').rpartition('/')[2].strip()
+    return name if name not in ('', '.', '..') else 'download'
+
+
+def unique_path(directory, filename):
+    path = directory / filename
+    stem, suffix = os.path.splitext(filename)
+    count = 1
+    while path.exists() or path.with_name(path.name + '.part').exists():
+        path = directory / ('%s (%s)%s' % (stem, count, suffix))
+        count += 1
+    return path
+
+
+def download_target(request, status_code, headers, url):
+    # path the body is saved to, None to decode it as text.
+    # Error responses are always shown.
+    if request.download is False or status_code >= 300:
+        return None
+    if isinstance(request.download, str):
+        path = Path(os.path.expanduser(request.download))
+        if path.is_dir():
+            return unique_path(path, response_filename(headers, url))
+        return path
+    if request.download or (download_binary() and (
+        is_binary_content_type(headers.get('Content-Type'))
+        or headers.get('Content-Disposition', '').lower().startswith('attachment')
+    )):
+        return unique_path(download_dir(), response_filename(headers, url))
+    return None
+
+
+def hexdump(data):
+    lines = []
+    for offset in range(0, len(data), HEX_LINE_SIZE):
+        line = data[offset:offset + HEX_LINE_SIZE]
+        hex_part = ' '.join('%02x' % byte for byte in line)
+        text = ''.join(chr(byte) if 32 <= byte < 127 else '.' for byte in line)
+        lines.append('%08x  %-*s  |%s|' % (offset, HEX_LINE_SIZE * 3 - 1, hex_part, text))
+    return '\n'.join(lines)
+
+
+class DownloadReader:
+    # same interface as BodyReader, the body goes to a .part file next to
+    # `path` as it arrives and is never decoded
+    def __init__(self, path, content_type, checksum=None, on_progress=None):
+        self.checksum = Checksum(checksum) if checksum else None
+        self.path = Path(path)
+        self.part_path = self.path.with_name(self.path.name + '.part')
+        self.content_type = content_type
+        self.on_progress = on_progress
+        self.head = bytearray()
+        self.size = 0
+        self.start = time.time()
+        self.last_progress = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = self.part_path.open('wb')
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        self.file.write(chunk)
+        if self.checksum is not None:
+            self.checksum.update(chunk)
+        if len(self.head) < PREVIEW_SIZE:
+            self.head += chunk[:PREVIEW_SIZE - len(self.head)]
+
+        now = time.time()
+        if self.on_progress is not None and now - self.last_progress >= PROGRESS_INTERVAL:
+            self.last_progress = now
+            self.on_progress(self.size, now - self.start)
+
+    def _summary(self, checksum_error):
+        lines = [
+            'Saved %s to %s' % (format_size(self.size), self.path),
+            'Content-Type: %s' % (self.content_type or 'unknown'),
+        ]
+        if self.checksum is not None:
+            lines.append(checksum_error or '%s: %s (verified)' % (self.checksum.algorithm, self.checksum.hexdigest()))
+        lines += ['', hexdump(bytes(self.head))]
+        if self.size > len(self.head):
+            lines.append('... (first %s shown)' % format_size(len(self.head)))
+        return '\n'.join(lines)
+
+    def close(self):
+        self.file.close()
+        os.replace(str(self.part_path), str(self.path))
+        if self.path.parent == DOWNLOAD_PATH:
+            prune_downloads(keep=self.path)
+
+        if self.on_progress is not None:
+            self.on_progress(self.size, time.time() - self.start)
+
+        checksum_error = self.checksum.error() if self.checksum is not None else None
+        return ResponseBody(
+            text=self._summary(checksum_error),
+            size=self.size,
+            download_path=str(self.path),
+            checksum_error=checksum_error,
+        )
+
+    def abort(self):
+        self.file.close()
+        try:
+            self.part_path.unlink()
+        except OSError:
+            pass
+
+
+def read_download(r, path, checksum=None, on_progress=None, cancel_token=None):
+    try:
+        reader = DownloadReader(path, r.headers.get('Content-Type'), checksum, on_progress)
+    except BaseException:
+        r.close()
+        raise
+    try:
+        for chunk in r.iter_content(CHUNK_SIZE):
+            if cancel_token is not None:
+                cancel_token.check()
+            reader.feed(chunk)
+    except BaseException:
+        reader.abort()
+        raise
+    finally:
+        r.close()
+    return reader.close()
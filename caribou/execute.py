@@ -0,0 +1,153 @@
+import json
+import time
+from typing import NamedTuple, Any
+
+from requests.structures import CaseInsensitiveDict
+
+from .transport import get_transport, resolve_timeout, request_scope
+from .response import ResponseBody, read_response, replay_response, parse_response, format_response
+from .upload import UploadStream, upload_body
+from .download import download_target, read_download
+from .httpcache import get_http_cache, cache_enabled, prepared_url, HIT, REVALIDATED, MISS
+from .timing import Timing, TimingRecorder
+from .tracing import span
+
+
+class RequestResult(NamedTuple):
+    text: str
+    status_code: int
+    elapsed: float
+    data: Any = None
+    is_json: bool = False
+    body: ResponseBody = None
+    reused: bool = True
+    timing: Timing = None
+    # hit, revalidated or miss when the HTTP cache is enabled
+    cache: str = None
+
+
+def request_kwargs(request, on_upload_progress=None):
+    # uploads are new streams on each call, a request can be sent again
+    kwargs = dict(
+        params=request.params,
+        headers=request.headers,
+        json=request.json,
+    )
+    if request.data is not None or request.files:
+        data, content_type = upload_body(request.data, request.files, on_upload_progress)
+        kwargs['data'] = data
+        headers = CaseInsensitiveDict(request.headers or {})
+        if content_type is not None and 'Content-Type' not in headers:
+            headers['Content-Type'] = content_type
+            kwargs['headers'] = headers
+    return kwargs
+
+
+def finish_result(body, status_code, elapsed, reused=True):
+    try:
+        data = parse_response(body)
+    except ValueError:
+        return RequestResult(format_response(body), status_code, elapsed, body=body, reused=reused)
+    if body.checksum_error is not None:
+        # shown as text, with the mismatch under the body
+        return RequestResult(format_response(body), status_code, elapsed, body=body, reused=reused)
+    return RequestResult(json.dumps(data, indent=2), status_code, elapsed, data, True, body, reused)
+
+
+def timed_result(body, status_code, start, recorder, reused=True):
+    # decoding is timed too: for large bodies it can cost more than the transfer
+    decode_start = time.perf_counter()
+    result = finish_result(body, status_code, decode_start - start, reused)
+    end = time.perf_counter()
+    recorder.decode = end - decode_start
+    return result._replace(timing=recorder.timing(body.size, end - start))
+
+
+def _cached_result(cache, entry, start, recorder, cache_status, on_chunk=None, on_progress=None, checksum=None):
+    raw = cache.read_body(entry)
+    if raw is None:
+        return None
+    body = replay_response(raw, entry.encoding, entry.headers, on_chunk, on_progress, checksum)
+    return timed_result(body, entry.status_code, start, recorder)._replace(cache=cache_status)
+
+
+def execute_request(request, on_connection=None, on_chunk=None, on_progress=None, cancel_token=None,
+                    on_upload_progress=None, max_size=None):
+    transport = get_transport()
+    recorder = TimingRecorder()
+    kwargs = request_kwargs(request, on_upload_progress)
+
+    cache = entry = url = None
+    if cache_enabled(request):
+        cache = get_http_cache()
+        url = prepared_url(request)
+        entry = cache.lookup(url, request.headers)
+        if entry is not None:
+            if entry.is_fresh(request.headers):
+                result = _cached_result(
+                    cache, entry, time.perf_counter(), recorder, HIT, on_chunk, on_progress, request.checksum
+                )
+                if result is not None:
+                    return result
+            # stale: the server answers 304 when the stored body is still valid
+            kwargs['headers'] = dict(request.headers or {}, **entry.validators())
+
+    with span('execute_request', method=request.method, url=request.url), request_scope(cancel_token, recorder) as scope:
+        try:
+            start = time.perf_counter()
+            r = transport.request(
+                request.method,
+                request.url,
+                stream=True,
+                timeout=resolve_timeout(request.timeout),
+                **kwargs
+            )
+
+            reused = not scope.connections
+            if on_connection is not None:
+                on_connection(reused)
+
+            if entry is not None and r.status_code == 304:
+                r.close()
+                entry = cache.refresh(entry, r.headers)
+                result = _cached_result(
+                    cache, entry, start, recorder, REVALIDATED, on_chunk, on_progress, request.checksum
+                )
+                if result is not None:
+                    return result._replace(reused=reused)
+                # the stored body is gone, fetch it again without validators
+                kwargs['headers'] = request.headers
+                r = transport.request(
+                    request.method,
+                    request.url,
+                    stream=True,
+                    timeout=resolve_timeout(request.timeout),
+                    **kwargs
+                )
+
+            download_start = time.perf_counter()
+            target = download_target(request, r.status_code, r.headers, r.url)
+            if target is not None:
+                body = read_download(r, target, request.checksum, on_progress, cancel_token)
+            else:
+                body = read_response(
+                    r, max_size, on_chunk=on_chunk, on_progress=on_progress, cancel_token=cancel_token,
+                    keep_raw=cache is not None, checksum=request.checksum,
+                )
+            recorder.download = time.perf_counter() - download_start
+        except Exception:
+            # an aborted socket surfaces as a connection error, report it as a cancellation
+            if cancel_token is not None:
+                cancel_token.check()
+            raise
+        finally:
+            if isinstance(kwargs.get('data'), UploadStream):
+                kwargs['data'].close()
+
+    if cancel_token is not None:
+        cancel_token.check()
+    result = timed_result(body, r.status_code, start, recorder, reused)
+    if cache is not None:
+        cache.store(url, request.headers, r.status_code, r.headers, r.encoding, body.raw)
+        result = result._replace(cache=MISS, body=body._replace(raw=None))
+    return result
@@ -0,0 +1,188 @@
+import asyncio
+import inspect
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from .exceptions import CaribouException
+from .aio import get_engine
+
+# threads refilling the prefetched values
+GENERATOR_THREADS = 4
+
+_executor = None
+_pools = {}
+_lock = Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(GENERATOR_THREADS, thread_name_prefix='caribou-generator')
+        return _executor
+
+
+async def _await(value):
+    return await value
+
+
+async def _gather(generator, count):
+    return await asyncio.gather(*(_await(generator()) for _ in range(count)))
+
+
+def _run_async(awaitable):
+    # coroutine generators run on the asyncio engine, the caller blocks
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return get_engine().submit(_await(awaitable)).result()
+    if inspect.iscoroutine(awaitable):
+        awaitable.close()
+    raise CaribouException('Coroutine generators can not be called from an event loop, use generate_value_async')
+
+
+def call_generator(generator):
+    value = generator()
+    if inspect.isawaitable(value):
+        value = _run_async(value)
+    return value
+
+
+def _generate(parameter, count):
+    if parameter.batch is not None:
+        values = parameter.batch(count)
+        if inspect.isawaitable(values):
+            values = _run_async(values)
+        values = list(values)
+        if len(values) != count:
+            raise CaribouException('%s: batch returned %s values instead of %s' % (parameter.name, len(values), count))
+        return values
+    if count > 1 and inspect.iscoroutinefunction(parameter.generator):
+        return list(_run_async(_gather(parameter.generator, count)))
+    return [call_generator(parameter.generator) for _ in range(count)]
+
+
+def _same_function(old, new):
+    if old is None or new is None:
+        return old is new
+    return getattr(old, '__code__', old) == getattr(new, '__code__', new) and \
+        getattr(old, '__defaults__', None) == getattr(new, '__defaults__', None)
+
+
+class ValuePool:
+    # keeps `parameter.prefetch` values ready, refilled on a background thread
+    def __init__(self, parameter):
+        self.parameter = parameter
+        self.size = parameter.prefetch
+        self.values = deque()
+        self.lock = Lock()
+        self.refilling = False
+
+    def update(self, parameter):
+        # a reloaded route brings new generator functions, the values
+        # prefetched by the old ones are only kept if their code is the same
+        with self.lock:
+            same = all(
+                _same_function(getattr(self.parameter, name), getattr(parameter, name))
+                for name in ('generator', 'batch')
+            )
+            self.parameter = parameter
+            self.size = parameter.prefetch
+            if not same:
+                self.values.clear()
+            while len(self.values) > self.size:
+                self.values.pop()
+
+    def _refill(self):
+        try:
+            while True:
+                with self.lock:
+                    missing = self.size - len(self.values)
+                    if missing <= 0:
+                        return
+                values = _generate(self.parameter, missing)
+                with self.lock:
+                    self.values.extend(values)
+        except Exception:
+            # tried again on the next take
+            traceback.print_exc()
+        finally:
+            with self.lock:
+                self.refilling = False
+
+    def refill(self):
+        with self.lock:
+            if self.refilling or len(self.values) >= self.size:
+                return
+            self.refilling = True
+        _get_executor().submit(self._refill)
+
+    def take_ready(self, count):
+        with self.lock:
+            return [self.values.popleft() for _ in range(min(count, len(self.values)))]
+
+    def take(self, count):
+        values = self.take_ready(count)
+        if len(values) < count:
+            values += _generate(self.parameter, count - len(values))
+        self.refill()
+        return values
+
+
+def _pool(parameter, prefix):
+    # one pool per route or group parameter, kept across reloads
+    key = (prefix, parameter.name)
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ValuePool(parameter)
+    if pool.parameter is not parameter:
+        pool.update(parameter)
+    return pool
+
+
+def _pooled(parameter, prefix):
+    return bool(parameter.prefetch) and prefix is not None
+
+
+def prefetch(parameters, prefix):
+    # `prefix` is the storage prefix of the route or group of the parameters
+    for parameter in parameters:
+        if parameter.prefetch and parameter.is_generated:
+            _pool(parameter, prefix).refill()
+
+
+def generate_values(parameter, count, prefix=None):
+    if _pooled(parameter, prefix):
+        return _pool(parameter, prefix).take(count)
+    return _generate(parameter, count)
+
+
+def generate_value(parameter, prefix=None):
+    if _pooled(parameter, prefix):
+        return _pool(parameter, prefix).take(1)[0]
+    if parameter.generator is None:
+        return _generate(parameter, 1)[0]
+    return call_generator(parameter.generator)
+
+
+async def generate_value_async(parameter, prefix=None):
+    # for event loop callers: coroutine generators are awaited here, the
+    # others run on the generator threads so they don't block the loop
+    if _pooled(parameter, prefix):
+        pool = _pool(parameter, prefix)
+        values = pool.take_ready(1)
+        pool.refill()
+        if values:
+            return values[0]
+    loop = asyncio.get_running_loop()
+    if parameter.generator is None:
+        return (await loop.run_in_executor(_get_executor(), _generate, parameter, 1))[0]
+    if inspect.iscoroutinefunction(parameter.generator):
+        return await parameter.generator()
+    value = await loop.run_in_executor(_get_executor(), parameter.generator)
+    if inspect.isawaitable(value):
+        value = await value
+    return value
@@ -0,0 +1,66 @@
+from pygments.lexers import JsonLexer
+from pygments.token import Name, String, Number, Keyword
+
+from .storage import load_setting
+from .tracing import traced
+
+STRING = 0
+NUMBER = 1
+
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024
+
+_lexer = JsonLexer()
+_kinds = {}
+
+
+def max_highlight_size():
+    return int(load_setting('highlight_max_size') or DEFAULT_MAX_SIZE)
+
+
+def _kind(tokentype):
+    try:
+        return _kinds[tokentype]
+    except KeyError:
+        if tokentype in Name or tokentype in String:
+            kind = STRING
+        elif tokentype in Number or tokentype in Keyword:
+            kind = NUMBER
+        else:
+            kind = None
+        _kinds[tokentype] = kind
+        return kind
+
+
+def line_spans(text):
+    spans = []
+    for index, tokentype, value in _lexer.get_tokens_unprocessed(text):
+        kind = _kind(tokentype)
+        if kind is not None:
+            spans.append((index, len(value), kind))
+    return spans
+
+
+@traced('highlight')
+def document_spans(text):
+    # (start, length, kind) spans for every line of `text`, indexed by line number
+    lines = []
+    current = []
+    line_start = 0
+    newline = text.find('\n')
+
+    for index, tokentype, value in _lexer.get_tokens_unprocessed(text):
+        kind = _kind(tokentype)
+        if kind is None:
+            continue
+        while newline != -1 and index > newline:
+            lines.append(current)
+            current = []
+            line_start = newline + 1
+            newline = text.find('\n', line_start)
+        current.append((index - line_start, len(value), kind))
+
+    lines.append(current)
+    while newline != -1:
+        lines.append([])
+        newline = text.find('\n', newline + 1)
+    return lines
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import zlib
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple
+
+HISTORY_PATH = Path(os.path.expanduser('~/.caribou/history'))
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+DEFAULT_HISTORY_SIZE = 10
+COMPRESSION_LEVEL = 1
+
+
+class HistoryEntry(NamedTuple):
+    name: str
+    timestamp: float
+    status_code: int
+    elapsed: float
+
+    @classmethod
+    def from_name(cls, name):
+        timestamp, status_code, elapsed = name[:-len('.z')].split('-')
+        return cls(name, int(timestamp) / 1000, int(status_code), int(elapsed) / 1000)
+
+    @property
+    def meta_name(self):
+        return self.name[:-len('.z')] + '.json'
+
+    @classmethod
+    def create(cls, status_code, elapsed, previous=None):
+        timestamp = time.time()
+        if previous is not None:
+            # names must stay unique and ordered for results saved in the same millisecond
+            timestamp = max(timestamp, previous.timestamp + 0.001)
+        name = '%015d-%d-%d.z' % (timestamp * 1000, status_code, max(elapsed, 0) * 1000)
+        return cls(name, timestamp, status_code, elapsed)
+
+
+class ResponseHistory:
+    def __init__(self, path=HISTORY_PATH, memory_budget=DEFAULT_MEMORY_BUDGET, history_size=DEFAULT_HISTORY_SIZE):
+        self.path = path
+        self.memory_budget = memory_budget
+        self.history_size = history_size
+
+        self.lock = Lock()
+        self.entries = {}
+        self.cache = OrderedDict()
+        self.memory = 0
+        self.pending = {}
+        # small per-entry details (timings), kept for every listed entry
+        self.meta = {}
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def _route_path(self, key):
+        return self.path / key
+
+    def _cache(self, cache_key, text):
+        if cache_key in self.cache:
+            self.cache.move_to_end(cache_key)
+            return
+        self.cache[cache_key] = text
+        self.memory += len(text)
+        while self.memory > self.memory_budget and len(self.cache) > 1:
+            _, evicted = self.cache.popitem(last=False)
+            self.memory -= len(evicted)
+
+    def _uncache(self, cache_key):
+        text = self.cache.pop(cache_key, None)
+        if text is not None:
+            self.memory -= len(text)
+
+    def _write(self, key, entry, text, meta=None):
+        try:
+            route_path = self._route_path(key)
+            route_path.mkdir(parents=True, exist_ok=True)
+            if meta is not None:
+                # written first, the entry only shows up once its body is there
+                (route_path / entry.meta_name).write_text(json.dumps(meta))
+            tmp_path = route_path / (entry.name + '.tmp')
+            tmp_path.write_bytes(zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL))
+            tmp_path.replace(route_path / entry.name)
+        finally:
+            with self.lock:
+                self.pending.pop((key, entry.name), None)
+
+    def _remove(self, key, entry):
+        for name in (entry.name, entry.meta_name):
+            try:
+                (self._route_path(key) / name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def list(self, key):
+        with self.lock:
+            entries = self.entries.get(key)
+            if entries is None:
+                route_path = self._route_path(key)
+                names = os.listdir(route_path) if route_path.exists() else []
+                entries = [
+                    HistoryEntry.from_name(name)
+                    for name in sorted(names, reverse=True)
+                    if name.endswith('.z')
+                ]
+                self.entries[key] = entries
+            return list(entries)
+
+    def add(self, key, text, status_code=0, elapsed=0, meta=None):
+        entries = self.list(key)
+
+        with self.lock:
+            entry = HistoryEntry.create(status_code, elapsed, entries[0] if entries else None)
+            entries.insert(0, entry)
+            dropped = entries[self.history_size:]
+            self.entries[key] = entries[:self.history_size]
+            for old_entry in dropped:
+                self._uncache((key, old_entry.name))
+                self.meta.pop((key, old_entry.name), None)
+
+            self.pending[(key, entry.name)] = text
+            self._cache((key, entry.name), text)
+            if meta is not None:
+                self.meta[(key, entry.name)] = meta
+
+        self.executor.submit(self._write, key, entry, text, meta)
+        for old_entry in dropped:
+            self.executor.submit(self._remove, key, old_entry)
+        return entry
+
+    def load(self, key, entry):
+        cache_key = (key, entry.name)
+        with self.lock:
+            text = self.cache.get(cache_key)
+            if text is None:
+                text = self.pending.get(cache_key)
+            if text is not None:
+                self._cache(cache_key, text)
+                return text
+
+        try:
+            data = (self._route_path(key) / entry.name).read_bytes()
+        except FileNotFoundError:
+            return None
+        text = zlib.decompress(data).decode('utf-8')
+
+        with self.lock:
+            self._cache(cache_key, text)
+        return text
+
+    def load_meta(self, key, entry):
+        cache_key = (key, entry.name)
+        with self.lock:
+            if cache_key in self.meta:
+                return self.meta[cache_key]
+
+        try:
+            meta = json.loads((self._route_path(key) / entry.meta_name).read_text())
+        except (OSError, ValueError):
+            meta = None
+
+        with self.lock:
+            self.meta[cache_key] = meta
+        return meta
+
+    def latest(self, key):
+        entries = self.list(key)
+        if not entries:
+            return None, None
+        return entries[0], self.load(key, entries[0])
+
+    def clear(self, key):
+        with self.lock:
+            for entry in self.entries.pop(key, []):
+                self._uncache((key, entry.name))
+                self.meta.pop((key, entry.name), None)
+        self.executor.submit(shutil.rmtree, self._route_path(key), True)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
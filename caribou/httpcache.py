@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple
+
+from requests.models import PreparedRequest
+from requests.structures import CaseInsensitiveDict
+
+from .storage import load_setting
+
+CACHE_PATH = Path(os.path.expanduser('~/.caribou/http-cache'))
+CACHEABLE_STATUS = (200, 203)
+# bodies kept on disk, the oldest entries are evicted past this
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+# freshness given to responses with a Last-Modified date but no explicit lifetime
+HEURISTIC_FRACTION = 0.1
+MAX_HEURISTIC_LIFETIME = 24 * 3600
+
+# how a result was obtained when the cache is enabled
+HIT = 'hit'
+REVALIDATED = 'revalidated'
+MISS = 'miss'
+
+
+def max_cache_size():
+    return int(load_setting('http_cache_size') or DEFAULT_CACHE_SIZE)
+
+
+def cache_enabled(request):
+    if request.method != 'GET' or request.data is not None or request.files or request.download:
+        return False
+    if request.cache is not None:
+        return request.cache
+    return bool(load_setting('http_cache'))
+
+
+def prepared_url(request):
+    req = PreparedRequest()
+    req.prepare_url(request.url, request.params)
+    return req.url
+
+
+def parse_cache_control(value):
+    directives = {}
+    for item in (value or '').split(','):
+        name, _, argument = item.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else True
+    return directives
+
+
+def _parse_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CacheEntry(NamedTuple):
+    key: str
+    url: str
+    status_code: int
+    headers: CaseInsensitiveDict
+    encoding: str
+    stored: float
+
+    @property
+    def cache_control(self):
+        return parse_cache_control(self.headers.get('Cache-Control'))
+
+    def freshness_lifetime(self):
+        cache_control = self.cache_control
+        if 'no-cache' in cache_control:
+            return 0
+        max_age = _int(cache_control.get('max-age'))
+        if max_age is not None:
+            return max_age
+
+        date = _parse_date(self.headers.get('Date')) or self.stored
+        expires = self.headers.get('Expires')
+        if expires is not None:
+            expires = _parse_date(expires)
+            return max(0, expires - date) if expires is not None else 0
+
+        last_modified = _parse_date(self.headers.get('Last-Modified'))
+        if last_modified is not None:
+            return min(MAX_HEURISTIC_LIFETIME, max(0, date - last_modified) * HEURISTIC_FRACTION)
+        return 0
+
+    def age(self):
+        return (_int(self.headers.get('Age')) or 0) + time.time() - self.stored
+
+    def is_fresh(self, request_headers):
+        request_cache_control = parse_cache_control(CaseInsensitiveDict(request_headers or {}).get('Cache-Control'))
+        if 'no-cache' in request_cache_control:
+            return False
+        return self.age() < self.freshness_lifetime()
+
+    def validators(self):
+        headers = {}
+        if 'ETag' in self.headers:
+            headers['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'status_code': self.status_code,
+            'headers': dict(self.headers),
+            'encoding': self.encoding,
+            'stored': self.stored,
+        }
+
+    @classmethod
+    def from_dict(cls, key, data):
+        return cls(
+            key, data['url'], data['status_code'], CaseInsensitiveDict(data['headers']),
+            data['encoding'], data['stored'],
+        )
+
+
+def _vary_names(headers):
+    return sorted(name.strip().lower() for name in headers.get('Vary', '').split(',') if name.strip())
+
+
+class HTTPCache:
+    # GET responses on disk: <key>.json holds the headers, <key>.body the raw body.
+    # With a Vary header, the URL entry only lists the varying request headers
+    # and each set of their values has its own entry.
+    def __init__(self, path=CACHE_PATH, max_size=None):
+        self.path = path
+        self.max_size = max_cache_size() if max_size is None else max_size
+        self.lock = Lock()
+        # key -> (stored, body size) of the entries on disk, read on the first store
+        self.index = None
+        self.total_size = 0
+
+    def _key(self, *parts):
+        return hashlib.sha1('\0'.join(parts).encode()).hexdigest()
+
+    def _variant_key(self, url_key, names, request_headers):
+        request_headers = CaseInsensitiveDict(request_headers or {})
+        return self._key(url_key, *('%s:%s' % (name, request_headers.get(name, '')) for name in names))
+
+    def _read_meta(self, key):
+        try:
+            with (self.path / ('%s.json' % key)).open() as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key, data, raw=None):
+        self.path.mkdir(parents=True, exist_ok=True)
+        if raw is not None:
+            tmp_path = self.path / ('%s.body.tmp' % key)
+            tmp_path.write_bytes(raw)
+            os.replace(str(tmp_path), str(self.path / ('%s.body' % key)))
+        tmp_path = self.path / ('%s.json.tmp' % key)
+        tmp_path.write_text(json.dumps(data))
+        os.replace(str(tmp_path), str(self.path / ('%s.json' % key)))
+
+    def _load_index(self):
+        self.index = {}
+        self.total_size = 0
+        for path in self.path.glob('*.json'):
+            data = self._read_meta(path.stem)
+            if data is None or 'stored' not in data:
+                continue
+            try:
+                size = (self.path / ('%s.body' % path.stem)).stat().st_size
+            except OSError:
+                size = 0
+            self.index[path.stem] = (data['stored'], size)
+            self.total_size += size
+
+    def _remove(self, key):
+        for suffix in ('json', 'body'):
+            try:
+                (self.path / ('%s.%s' % (key, suffix))).unlink()
+            except OSError:
+                pass
+        _, size = self.index.pop(key)
+        self.total_size -= size
+
+    def _evict(self):
+        # the least recently stored or revalidated entries go first
+        if self.total_size <= self.max_size:
+            return
+        for key, _ in sorted(self.index.items(), key=lambda item: item[1][0]):
+            self._remove(key)
+            if self.total_size <= self.max_size:
+                break
+
+    def lookup(self, url, request_headers):
+        url_key = self._key('GET', url)
+        with self.lock:
+            data = self._read_meta(url_key)
+            if data is not None and 'vary' in data:
+                key = self._variant_key(url_key, data['vary'], request_headers)
+                data = self._read_meta(key)
+            else:
+                key = url_key
+        if data is None:
+            return None
+        try:
+            return CacheEntry.from_dict(key, data)
+        except (KeyError, TypeError):
+            return None
+
+    def read_body(self, entry):
+        try:
+            return (self.path / ('%s.body' % entry.key)).read_bytes()
+        except OSError:
+            return None
+
+    def store(self, url, request_headers, status_code, headers, encoding, raw):
+        # returns False when the response can't be stored
+        if status_code not in CACHEABLE_STATUS or raw is None or len(raw) > self.max_size:
+            return False
+        cache_control = parse_cache_control(headers.get('Cache-Control'))
+        request_cache_control = parse_cache_control(CaseInsensitiveDict(request_headers or {}).get('Cache-Control'))
+        if 'no-store' in cache_control or 'no-store' in request_cache_control:
+            return False
+        names = _vary_names(headers)
+        if '*' in names:
+            return False
+
+        url_key = self._key('GET', url)
+        entry = CacheEntry(url_key, url, status_code, CaseInsensitiveDict(headers), encoding, time.time())
+        with self.lock:
+            if self.index is None:
+                self._load_index()
+            try:
+                if names:
+                    self._write(url_key, {'vary': names})
+                    entry = entry._replace(key=self._variant_key(url_key, names, request_headers))
+                self._write(entry.key, entry.to_dict(), raw)
+            except OSError:
+                return False
+            _, previous_size = self.index.get(entry.key, (0, 0))
+            self.index[entry.key] = (entry.stored, len(raw))
+            self.total_size += len(raw) - previous_size
+            self._evict()
+        return True
+
+    def refresh(self, entry, headers):
+        # a 304 updates the stored headers and makes the entry fresh again
+        merged = CaseInsensitiveDict(entry.headers)
+        for name, value in headers.items():
+            if name.lower() not in ('content-length', 'content-encoding', 'transfer-encoding'):
+                merged[name] = value
+        entry = entry._replace(headers=merged, stored=time.time())
+        with self.lock:
+            try:
+                self._write(entry.key, entry.to_dict())
+            except OSError:
+                pass
+            if self.index is not None and entry.key in self.index:
+                self.index[entry.key] = (entry.stored, self.index[entry.key][1])
+        return entry
+
+    def clear(self):
+        with self.lock:
+            shutil.rmtree(str(self.path), ignore_errors=True)
+            self.index = None
+            self.total_size = 0
+
+
+_cache = None
+_cache_lock = Lock()
+
+
+def get_http_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = HTTPCache()
+        return _cache
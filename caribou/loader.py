@@ -1,12 +1,30 @@
 import os
+import sys
+import marshal
+import hashlib
+import traceback
 import importlib.util
+from collections import OrderedDict
 from contextlib import contextmanager
+from pathlib import Path
 from threading import Lock
+from typing import NamedTuple, List
+
+from .exceptions import CaribouException
+from .tracing import span
+
+BYTECODE_PATH = Path(os.path.expanduser('~/.caribou/bytecode'))
+# compiled files kept on disk, the oldest are removed past this
+BYTECODE_CACHE_SIZE = 256
+WORKSPACE_PACKAGE = 'caribou_workspace'
 
 hook_enabled = False
 routes = []
 lock = Lock()
 
+# path -> ((mtime, size), code), avoids reading unchanged files again
+_code_cache = {}
+
 
 @contextmanager
 def hook_context():
@@ -30,13 +48,245 @@ def register_route(route):
             routes.append(route)
 
 
+def _prune_bytecode_cache():
+    files = sorted(BYTECODE_PATH.glob('*.pyc'), key=lambda path: path.stat().st_mtime)
+    for path in files[:-BYTECODE_CACHE_SIZE]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def compile_file(file_path):
+    stat = os.stat(file_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _code_cache.get(file_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with open(file_path, 'rb') as f:
+        source = f.read()
+
+    # the path is part of the key since it is stored in the code object
+    digest = hashlib.sha1(importlib.util.MAGIC_NUMBER + file_path.encode() + b'\0' + source).hexdigest()
+    cache_path = BYTECODE_PATH / ('%s.pyc' % digest)
+
+    code = None
+    try:
+        code = marshal.loads(cache_path.read_bytes())
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    if code is None:
+        code = compile(source, file_path, 'exec', dont_inherit=True)
+        try:
+            BYTECODE_PATH.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix('.tmp')
+            tmp_path.write_bytes(marshal.dumps(code))
+            os.replace(str(tmp_path), str(cache_path))
+            _prune_bytecode_cache()
+        except OSError:
+            pass
+
+    _code_cache[file_path] = (key, code)
+    return code
+
+
+def _exec_file(file_path, module_name):
+    with span('compile_file', path=file_path):
+        code = compile_file(file_path)
+    spec = importlib.util.spec_from_file_location(module_name, file_path)
+    module = importlib.util.module_from_spec(spec)
+
+    with span('load_file', path=file_path), hook_context():
+        exec(code, module.__dict__)
+        return list(routes)
+
+
 def load_file(file_path):
     if not os.path.exists(file_path):
         raise Exception('File not found: %s' % file_path)
 
-    spec = importlib.util.spec_from_file_location("routes", file_path)
-    route_modules = importlib.util.module_from_spec(spec)
+    return _exec_file(os.path.abspath(file_path), "routes")
 
-    with hook_context():
-        spec.loader.exec_module(route_modules)
-        return list(routes)
+
+class WorkspaceModule:
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.routes = None
+        self.loaded_mtime = None
+
+    @property
+    def loaded(self):
+        return self.routes is not None
+
+    def is_stale(self):
+        try:
+            return os.stat(self.path).st_mtime_ns != self.loaded_mtime
+        except OSError:
+            return True
+
+    def load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        try:
+            routes = _exec_file(self.path, '%s.%s' % (WORKSPACE_PACKAGE, self.name))
+        except Exception:
+            if self.routes is None:
+                # don't retry a broken module until its file changes
+                self.routes = []
+                self.loaded_mtime = mtime
+            raise
+        for route in routes:
+            route.module = self.name
+            if route.group is not None:
+                route.group.module = self.name
+        self.routes = routes
+        self.loaded_mtime = mtime
+        return routes
+
+
+class Workspace:
+    # a directory of route modules, each one is only executed once its
+    # routes are needed and again when its file changes
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        if not os.path.isdir(self.path):
+            raise CaribouException('Workspace not found: %s' % path)
+        self.modules = OrderedDict()
+        self.scan()
+
+    def _module_paths(self):
+        paths = {}
+        for directory, dirnames, filenames in os.walk(self.path):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith(('.', '_')))
+            for filename in filenames:
+                # modules starting with _ are helpers that route modules can import
+                if not filename.endswith('.py') or filename.startswith('_'):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.path)[:-3].replace(os.sep, '.')
+                paths[name] = path
+        return paths
+
+    def scan(self):
+        # returns True when modules were added or removed
+        paths = self._module_paths()
+        changed = set(paths) != set(self.modules)
+        modules = OrderedDict()
+        for name in sorted(paths):
+            module = self.modules.get(name)
+            if module is None:
+                module = WorkspaceModule(name, paths[name])
+            modules[name] = module
+        self.modules = modules
+        return changed
+
+    @contextmanager
+    def _import_path(self):
+        sys.path.insert(0, self.path)
+        try:
+            yield
+        finally:
+            sys.path.remove(self.path)
+
+    def load_module(self, name):
+        with self._import_path():
+            return self.modules[name].load()
+
+    def load_all(self):
+        with self._import_path():
+            for module in self.modules.values():
+                if not module.loaded:
+                    module.load()
+        return self.routes()
+
+    def refresh(self):
+        # re-executes the loaded modules whose file changed, a module that
+        # fails keeps its previous routes and its traceback is returned
+        self.scan()
+        errors = []
+        with self._import_path():
+            for module in self.modules.values():
+                if module.loaded and module.is_stale():
+                    try:
+                        module.load()
+                    except Exception:
+                        errors.append(traceback.format_exc())
+        return errors
+
+    def routes(self):
+        return [route for module in self.modules.values() if module.loaded for route in module.routes]
+
+    def sections(self):
+        return [(module.name, module.loaded) for module in self.modules.values()]
+
+    def watched_paths(self):
+        paths = {self.path}
+        for module in self.modules.values():
+            paths.add(module.path)
+            paths.add(os.path.dirname(module.path))
+        return sorted(paths)
+
+
+def load_routes(path):
+    if os.path.isdir(path):
+        return Workspace(path).load_all()
+    return load_file(path)
+
+
+def parameter_signature(parameter):
+    # generators are new functions on every load, only their presence changes the widgets
+    return parameter._replace(generator=parameter.generator is not None, batch=parameter.batch is not None)
+
+
+def route_signature(route):
+    group = route.group
+    group_signature = None
+    if group is not None:
+        group_signature = (
+            group.name,
+            group.storage_prefix,
+            [parameter_signature(parameter) for parameter in group.parameters],
+        )
+    return (
+        route.storage_prefix,
+        group_signature,
+        [parameter_signature(parameter) for parameter in route.parameters],
+    )
+
+
+class RouteDiff(NamedTuple):
+    added: List
+    removed: List
+    # (old, new) pairs whose parameters or group changed
+    changed: List
+    # (old, new) pairs that can keep their widgets
+    unchanged: List
+    reordered: bool
+
+    def is_structural(self):
+        return bool(self.added or self.removed or self.reordered)
+
+
+def diff_routes(old_routes, new_routes):
+    old_per_key = {route.key: route for route in old_routes}
+    new_keys = {route.key for route in new_routes}
+
+    added = []
+    changed = []
+    unchanged = []
+    for route in new_routes:
+        old = old_per_key.get(route.key)
+        if old is None:
+            added.append(route)
+        elif route_signature(old) == route_signature(route):
+            unchanged.append((old, route))
+        else:
+            changed.append((old, route))
+
+    removed = [route for route in old_routes if route.key not in new_keys]
+    kept_order = [route.key for route in old_routes if route.key in new_keys]
+    reordered = kept_order != [route.key for route in new_routes if route.key in old_per_key]
+    return RouteDiff(added, removed, changed, unchanged, reordered)
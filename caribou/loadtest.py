@@ -0,0 +1,384 @@
+import math
+import time
+import queue
+import asyncio
+from collections import defaultdict
+from threading import Thread, Lock, Event
+from typing import NamedTuple
+
+from .aio import AsyncEngine, check_supported
+from .transport import Transport, resolve_timeout
+from .execute import request_kwargs
+from .generators import generate_value, generate_value_async, prefetch
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    # log-linear buckets: every recorded value is within PRECISION of its bucket bound
+    PRECISION = 0.01
+    MIN_VALUE = 1e-6
+
+    def __init__(self):
+        self.base = math.log1p(self.PRECISION)
+        self.counts = defaultdict(int)
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+
+    def _index(self, value):
+        return int(math.log(max(value, self.MIN_VALUE) / self.MIN_VALUE) / self.base)
+
+    def _bucket_value(self, index):
+        return self.MIN_VALUE * math.exp((index + 1) * self.base)
+
+    def record(self, value):
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        if other.total:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percentile):
+        if self.total == 0:
+            return None
+        target = max(1, math.ceil(self.total * percentile / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / self.total if self.total else None
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        # returns how long to wait before the token can be used
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+
+class LoadTestSnapshot(NamedTuple):
+    elapsed: float
+    completed: int
+    errors: int
+    in_flight: int
+    throughput: float
+    status_counts: dict
+    percentiles: dict
+    mean: float
+    max: float
+    running: bool
+
+    def to_dict(self):
+        return {
+            'elapsed': self.elapsed,
+            'completed': self.completed,
+            'errors': self.errors,
+            'error_rate': self.errors / self.completed if self.completed else 0,
+            'throughput': self.throughput,
+            'status_counts': {str(status): count for status, count in self.status_counts.items()},
+            'latency': {
+                'mean': self.mean,
+                'max': self.max,
+                **{'p%s' % p: value for p, value in self.percentiles.items()},
+            },
+        }
+
+    def format(self):
+        statuses = ' '.join('%s:%s' % item for item in sorted(self.status_counts.items(), key=lambda item: str(item[0])))
+        latencies = ' '.join(
+            'p%s=%s' % (p, '-' if value is None else '%.1fms' % (value * 1000))
+            for p, value in self.percentiles.items()
+        )
+        return '%.1fs  %s done  %.1f req/s  %s errors  [%s]  %s' % (
+            self.elapsed, self.completed, self.throughput, self.errors, statuses, latencies
+        )
+
+
+class LoadTest:
+    def __init__(self, route, group_values, route_values, concurrency=10, rate=None,
+                 duration=None, total=None, engine='threads'):
+        self.route = route
+        self.group_values = group_values
+        self.route_values = route_values
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.total = total
+        self.engine = engine
+
+        if engine == 'asyncio':
+            check_supported()
+            self.transport = AsyncEngine(pool_size=concurrency)
+        else:
+            self.transport = Transport(pool_size=concurrency)
+
+        self.generated_parameters = [
+            parameter for parameter in route.parameters if parameter.is_generated
+        ]
+        if route.group is not None:
+            self.generated_group_parameters = [
+                parameter for parameter in route.group.parameters if parameter.is_generated
+            ]
+            self.group_prefix = route.group.storage_prefix
+            prefetch(self.generated_group_parameters, self.group_prefix)
+        else:
+            self.generated_group_parameters = []
+            self.group_prefix = None
+        prefetch(self.generated_parameters, route.storage_prefix)
+        self.request = None
+        if not self.generated_parameters and not self.generated_group_parameters:
+            self.request = route.get_request(group_values, route_values)
+
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.histogram = LatencyHistogram()
+        self.status_counts = defaultdict(int)
+        self.completed = 0
+        self.errors = 0
+        self.issued = 0
+        self.in_flight = 0
+        self.start_time = None
+        self.end_time = None
+        self.threads = []
+        self.schedule = None
+        self.finisher = None
+
+    def _build_request(self):
+        if self.request is not None:
+            return self.request
+
+        group_values = dict(self.group_values)
+        for parameter in self.generated_group_parameters:
+            group_values[parameter.name] = generate_value(parameter, self.group_prefix)
+        route_values = dict(self.route_values)
+        for parameter in self.generated_parameters:
+            route_values[parameter.name] = generate_value(parameter, self.route.storage_prefix)
+        return self.route.get_request(group_values, route_values)
+
+    async def _async_build_request(self):
+        if self.request is not None:
+            return self.request
+
+        group_values = dict(self.group_values)
+        for parameter in self.generated_group_parameters:
+            group_values[parameter.name] = await generate_value_async(parameter, self.group_prefix)
+        route_values = dict(self.route_values)
+        for parameter in self.generated_parameters:
+            route_values[parameter.name] = await generate_value_async(parameter, self.route.storage_prefix)
+        return self.route.get_request(group_values, route_values)
+
+    def _take_slot(self):
+        with self.lock:
+            if self.total is not None and self.issued >= self.total:
+                return None
+            self.issued += 1
+            self.in_flight += 1
+        return time.monotonic()
+
+    def _record(self, intended, status):
+        # latency is measured from the intended start, so a saturated
+        # server is not hidden by the workers falling behind
+        latency = time.monotonic() - intended
+        with self.lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.status_counts[status] += 1
+            if not isinstance(status, int) or status >= 400:
+                self.errors += 1
+            self.histogram.record(latency)
+
+    # thread workers
+
+    def _next_slot(self):
+        # returns the intended start time of the next request, or None when done
+        while not self.stop_event.is_set():
+            if self.schedule is None:
+                return self._take_slot()
+            try:
+                intended = self.schedule.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if intended is not None:
+                with self.lock:
+                    self.in_flight += 1
+            return intended
+        return None
+
+    def _schedule(self):
+        bucket = TokenBucket(self.rate)
+        issued = 0
+        while not self.stop_event.is_set():
+            if self.total is not None and issued >= self.total:
+                break
+            wait = bucket.take()
+            if wait > 0:
+                self.stop_event.wait(wait)
+            self.schedule.put(time.monotonic())
+            issued += 1
+        self.schedule.put(None)
+
+    def _send(self, request):
+        r = self.transport.request(
+            request.method, request.url,
+            timeout=resolve_timeout(request.timeout),
+            **request_kwargs(request)
+        )
+        # read the body so the connection goes back to the pool
+        r.content
+        return r.status_code
+
+    def _worker(self):
+        while True:
+            intended = self._next_slot()
+            if intended is None:
+                break
+            try:
+                status = self._send(self._build_request())
+            except Exception as e:
+                status = type(e).__name__
+            self._record(intended, status)
+
+        if self.schedule is not None:
+            # let the other workers see the end of the schedule too
+            self.schedule.put(None)
+
+    # asyncio workers
+
+    async def _async_next_slot(self):
+        while not self.stop_event.is_set():
+            if self.schedule is None:
+                return self._take_slot()
+            try:
+                intended = await asyncio.wait_for(self.schedule.get(), 0.1)
+            except asyncio.TimeoutError:
+                continue
+            if intended is not None:
+                with self.lock:
+                    self.in_flight += 1
+            return intended
+        return None
+
+    async def _async_schedule(self):
+        bucket = TokenBucket(self.rate)
+        issued = 0
+        while not self.stop_event.is_set():
+            if self.total is not None and issued >= self.total:
+                break
+            wait = bucket.take()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.schedule.put_nowait(time.monotonic())
+            issued += 1
+        self.schedule.put_nowait(None)
+
+    async def _async_worker(self):
+        while True:
+            intended = await self._async_next_slot()
+            if intended is None:
+                break
+            try:
+                status = await self.transport.send(await self._async_build_request())
+            except Exception as e:
+                status = type(e).__name__
+            self._record(intended, status)
+
+        if self.schedule is not None:
+            self.schedule.put_nowait(None)
+
+    async def _run_async(self):
+        tasks = []
+        if self.rate:
+            self.schedule = asyncio.Queue()
+            tasks.append(self._async_schedule())
+        tasks += [self._async_worker() for _ in range(self.concurrency)]
+        await asyncio.gather(*tasks)
+
+    # lifecycle
+
+    def _watchdog(self):
+        if self.duration is not None:
+            self.stop_event.wait(self.duration)
+            self.stop_event.set()
+
+    def _finish(self):
+        if self.engine == 'asyncio':
+            try:
+                self.transport.submit(self._run_async()).result()
+            finally:
+                self.transport.close()
+        else:
+            for thread in self.threads:
+                thread.join()
+            self.transport.close()
+
+        with self.lock:
+            self.end_time = time.monotonic()
+        self.stop_event.set()
+
+    def start(self):
+        self.start_time = time.monotonic()
+        if self.engine != 'asyncio':
+            if self.rate:
+                self.schedule = queue.Queue()
+                self.threads.append(Thread(target=self._schedule, daemon=True))
+            for _ in range(self.concurrency):
+                self.threads.append(Thread(target=self._worker, daemon=True))
+            for thread in self.threads:
+                thread.start()
+
+        Thread(target=self._watchdog, daemon=True).start()
+        self.finisher = Thread(target=self._finish, daemon=True)
+        self.finisher.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def wait(self, timeout=None):
+        self.finisher.join(timeout)
+        return not self.finisher.is_alive()
+
+    def is_running(self):
+        return self.start_time is not None and self.end_time is None
+
+    def snapshot(self):
+        with self.lock:
+            end = self.end_time or time.monotonic()
+            elapsed = end - self.start_time if self.start_time is not None else 0
+            return LoadTestSnapshot(
+                elapsed=elapsed,
+                completed=self.completed,
+                errors=self.errors,
+                in_flight=self.in_flight,
+                throughput=self.completed / elapsed if elapsed > 0 else 0,
+                status_counts=dict(self.status_counts),
+                percentiles={p: self.histogram.percentile(p) for p in PERCENTILES},
+                mean=self.histogram.mean(),
+                max=self.histogram.max,
+                running=self.end_time is None,
+            )
@@ -1,4 +1,29 @@
-from typing import NamedTuple, Callable, Union, List as TList
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple, Any, Callable, Union, List as TList
+
+# group contexts kept per group, one for each set of group parameter values
+CONTEXT_CACHE_SIZE = 16
+
+
+def freeze(value):
+    # hashable version of parameter values
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def copy_context(ctx):
+    # contexts holding objects that can't be copied (sessions, locks...)
+    # are only copied one level deep
+    try:
+        return copy.deepcopy(ctx)
+    except (TypeError, copy.Error):
+        return dict(ctx)
 
 
 class Choice(NamedTuple):
@@ -22,12 +47,30 @@ class TextField(NamedTuple):
         return value
 
 
+class File(NamedTuple):
+    # a file sent from disk, read in chunks while the request is sent
+    path: str
+    filename: str = None
+    content_type: str = None
+
+
 class Request(NamedTuple):
     url: str
     method: str
     params: dict = None
     headers: dict = None
     json: dict = None
+    timeout: Union[float, tuple] = None
+    # None follows the http_cache setting
+    cache: bool = None
+    # raw body: bytes, str, form fields, a File or a file-like object
+    data: Any = None
+    # multipart fields: name -> File, file-like object, bytes or str
+    files: dict = None
+    # True or a path saves the body to a file, False always shows it as text
+    download: Union[bool, str] = None
+    # 'sha256:<hex>' verified on downloads
+    checksum: str = None
 
 
 class Parameter(NamedTuple):
@@ -37,6 +80,14 @@ class Parameter(NamedTuple):
     generator: Callable[[], str] = None
     type: Union[Choice, List] = None
     id: str = None
+    # values generated ahead of time in the background
+    prefetch: int = 0
+    # batch(count) returns `count` values at once
+    batch: Callable[[int], TList[str]] = None
+
+    @property
+    def is_generated(self):
+        return self.generator is not None or self.batch is not None
 
     def storage_path(self, prefix):
         if self.id is not None:
@@ -51,10 +102,18 @@ class Parameter(NamedTuple):
 
 
 class Route:
-    def __init__(self, func, group=None):
+    def __init__(self, func, group=None, timeout=None, after=None, download=None):
         from .loader import register_route
         self.group = group
         self.func = func
+        self.timeout = timeout
+        self.download = download
+        # names of the routes a collection run executes before this one
+        if isinstance(after, str):
+            after = [after]
+        self.after = tuple(after or ())
+        # workspace module the route was loaded from
+        self.module = None
         parameters = getattr(func, '__caribou_params__', [])
         self.parameters = list(reversed(parameters))
 
@@ -62,12 +121,23 @@ class Route:
 
     @property
     def storage_prefix(self):
+        if self.module is not None:
+            return 'routes.%s.%s' % (self.module, self.func.__name__)
         return 'routes.%s' % self.func.__name__
 
     @property
     def name(self):
         return self.func.__name__
 
+    @property
+    def key(self):
+        # route names are only unique within a group and a workspace module
+        return (self.module, self.group.name if self.group is not None else None, self.name)
+
+    @property
+    def qualified_name(self):
+        return '.'.join(part for part in self.key if part)
+
     KEYWORDS = ('get', 'post')
 
     @property
@@ -76,13 +146,21 @@ class Route:
         name_items = [name.upper() if name in self.KEYWORDS else name for name in name_items]
         return ' '.join(name_items)
 
+    WORD_COLORS = {'get': '#25A86B', 'post': '#FDA60A'}
+    DEFAULT_WORD_COLOR = '#FFFFFF'
+
+    @property
+    def display_words(self):
+        return [
+            (name.upper() if name in self.KEYWORDS else name, self.WORD_COLORS.get(name, self.DEFAULT_WORD_COLOR))
+            for name in self.func.__name__.split('_')
+        ]
+
     def _style_word(self, name):
-        if name == 'get':
-            return '<span style="color:#25A86B">GET</span>'
-        elif name == 'post':
-            return '<span style="color:#FDA60A">POST</span>'
-        else:
-            return '<span style="color:#FFFFFF">%s</span>' % name
+        return '<span style="color:%s">%s</span>' % (
+            self.WORD_COLORS.get(name, self.DEFAULT_WORD_COLOR),
+            name.upper() if name in self.WORD_COLORS else name,
+        )
 
     @property
     def display_name(self):
@@ -96,24 +174,97 @@ class Route:
         )
 
     def get_request(self, group_values, route_values):
-        ctx = {}
-        if self.group:
-            self.group(ctx, **group_values)
-        return self(ctx, **route_values)
+        ctx = self.group.context(group_values) if self.group else {}
+        request = self(ctx, **route_values)
+        if self.timeout is not None and isinstance(request, Request) and request.timeout is None:
+            request = request._replace(timeout=self.timeout)
+        if self.download is not None and isinstance(request, Request) and request.download is None:
+            request = request._replace(download=self.download)
+        return request
 
     def __call__(self, *args, **kwargs):
         return self.func(*args, **kwargs)
 
 
+class GroupContext:
+    def __init__(self, ctx, build_time):
+        self.ctx = ctx
+        self.created = time.time()
+        self.build_time = build_time
+        self.hits = 0
+        # whether the last lookup reused this context
+        self.last_hit = False
+
+    @property
+    def age(self):
+        return time.time() - self.created
+
+
 class Group:
-    def __init__(self, func, name):
+    def __init__(self, func, name, ttl=None, expires=None, cache=True):
         self.func = func
         self.name = name
+        # workspace module the group was loaded from
+        self.module = None
         parameters = getattr(func, '__caribou_params__', [])
         self.parameters = list(reversed(parameters))
+        # the context is built once and reused until `ttl` seconds passed,
+        # `expires(ctx)` returns True or the group parameters change
+        self.ttl = ttl
+        self.expires = expires
+        self.cache = cache
+        self.contexts = OrderedDict()
+        self.lock = Lock()
+
+    def _is_expired(self, entry):
+        if self.ttl is not None and entry.age >= self.ttl:
+            return True
+        return self.expires is not None and bool(self.expires(entry.ctx))
+
+    def context(self, group_values):
+        # routes get a copy, so they can't change the cached context
+        if not self.cache:
+            ctx = {}
+            self(ctx, **group_values)
+            return ctx
+
+        key = freeze(group_values)
+        # held while building, so concurrent requests wait for one build
+        with self.lock:
+            entry = self.contexts.get(key)
+            if entry is not None and not self._is_expired(entry):
+                entry.hits += 1
+                entry.last_hit = True
+                self.contexts.move_to_end(key)
+                return copy_context(entry.ctx)
+
+            start = time.perf_counter()
+            ctx = {}
+            self(ctx, **group_values)
+            entry = GroupContext(ctx, time.perf_counter() - start)
+            self.contexts[key] = entry
+            self.contexts.move_to_end(key)
+            while len(self.contexts) > CONTEXT_CACHE_SIZE:
+                self.contexts.popitem(last=False)
+            return copy_context(ctx)
+
+    def cached_context(self, group_values):
+        with self.lock:
+            return self.contexts.get(freeze(group_values))
+
+    def is_current(self, entry):
+        # False once the context was evicted, invalidated or expired
+        with self.lock:
+            return any(current is entry for current in self.contexts.values()) and not self._is_expired(entry)
+
+    def invalidate(self):
+        with self.lock:
+            self.contexts.clear()
 
     @property
     def storage_prefix(self):
+        if self.module is not None:
+            return 'groups.%s.%s' % (self.module, self.func.__name__)
         return 'groups.%s' % self.func.__name__
 
     def __repr__(self):
@@ -121,9 +272,9 @@ class Group:
             self.parameters
         )
 
-    def route(self):
+    def route(self, timeout=None, after=None, download=None):
         def decorator(func):
-            return Route(func, group=self)
+            return Route(func, group=self, timeout=timeout, after=after, download=download)
         return decorator
 
     def __call__(self, *args, **kwargs):
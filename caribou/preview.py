@@ -0,0 +1,96 @@
+import json
+from collections import OrderedDict
+from threading import Lock
+from requests.models import PreparedRequest
+
+from .storage import load_setting
+from .models import freeze
+from .upload import describe_upload
+
+TEMPLATE = '''{method} {url}
+{headers}
+
+{body}
+'''
+
+CACHE_SIZE = 128
+DEFAULT_PREVIEW_SIZE = 64 * 1024
+
+_cache = OrderedDict()
+_cache_lock = Lock()
+
+
+def max_preview_size():
+    return int(load_setting('preview_max_size') or DEFAULT_PREVIEW_SIZE)
+
+
+def preview_key(route, group_values, route_values):
+    return (route, freeze(group_values), freeze(route_values))
+
+
+def format_request(request):
+    headers = []
+    if request.headers is not None:
+        headers = ['%s: %s' % (name, value) for name, value in request.headers.items()]
+
+    body = ''
+    if request.data is not None or request.files:
+        body = describe_upload(request.data, request.files)
+    elif request.json is not None:
+        body = json.dumps(request.json, indent=2)
+
+    req = PreparedRequest()
+    req.prepare_url(request.url, request.params)
+    url = req.url
+
+    return TEMPLATE.format(
+        method=request.method,
+        url=url,
+        headers='\n'.join(headers),
+        body=body,
+    )
+
+
+def _context_entry(route, group_values):
+    # the cached group context a preview was built from
+    if route.group is None or not route.group.cache:
+        return None
+    return route.group.cached_context(group_values)
+
+
+def cached_preview(key):
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is None:
+            return None
+        text, entry = cached
+        # built from a context that expired since
+        if entry is not None and not key[0].group.is_current(entry):
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return text
+
+
+def build_preview(route, group_values, route_values):
+    text = format_request(route.get_request(group_values, route_values))
+    entry = _context_entry(route, group_values)
+
+    with _cache_lock:
+        _cache[preview_key(route, group_values, route_values)] = (text, entry)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return text
+
+
+def clear_previews():
+    with _cache_lock:
+        _cache.clear()
+
+
+def truncate_preview(text, max_size=None):
+    if max_size is None:
+        max_size = max_preview_size()
+    if len(text) <= max_size:
+        return text, False
+    return text[:max_size] + '\n... (%s more characters)' % (len(text) - max_size), True
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import codecs
+import uuid
+import hashlib
+from pathlib import Path
+from typing import NamedTuple
+
+from .storage import load_setting
+from .exceptions import CaribouException
+
+SPILL_PATH = Path(os.path.expanduser('~/.caribou/responses'))
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024
+# spilled bodies kept on disk, the oldest are removed past this
+DEFAULT_SPILL_SIZE = 1024 * 1024 * 1024
+PROGRESS_INTERVAL = 0.1
+DEFAULT_CHECKSUM = 'sha256'
+
+
+class ResponseBody(NamedTuple):
+    text: str
+    size: int
+    is_json: bool = False
+    streamed: bool = False
+    truncated: bool = False
+    spill_path: str = None
+    # the undecoded body, only kept for the HTTP cache
+    raw: bytes = None
+    # set when the body was saved to a file instead of decoded
+    download_path: str = None
+    checksum_error: str = None
+
+
+def max_result_size():
+    return int(load_setting('max_result_size') or DEFAULT_MAX_SIZE)
+
+
+def max_spill_size():
+    return int(load_setting('spill_max_size') or DEFAULT_SPILL_SIZE)
+
+
+def prune_files(paths, max_size, keep=None):
+    # removes the oldest files until the rest fit in `max_size`
+    files = []
+    for path in paths:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+
+
+def prune_spill_files(keep=None, max_size=None):
+    # history entries refer to their spill file, so files are only removed
+    # once the recent ones fill the budget
+    if max_size is None:
+        max_size = max_spill_size()
+    prune_files(SPILL_PATH.glob('*.body'), max_size, keep)
+
+
+def is_json_response(headers):
+    return 'json' in headers.get('Content-Type', '').lower()
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return '%.0f %s' % (size, unit) if unit == 'B' else '%.1f %s' % (size, unit)
+        size /= 1024
+    return '%.1f GB' % size
+
+
+class Checksum:
+    # 'sha256:<hex>' or only the hex digest, checked against the received bytes
+    def __init__(self, checksum):
+        algorithm, _, expected = checksum.rpartition(':')
+        self.algorithm = algorithm.lower() or DEFAULT_CHECKSUM
+        if self.algorithm not in hashlib.algorithms_available:
+            raise CaribouException('Unknown checksum algorithm: %s' % self.algorithm)
+        self.expected = expected.strip().lower()
+        self.hash = hashlib.new(self.algorithm)
+
+    def update(self, chunk):
+        self.hash.update(chunk)
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+    def error(self):
+        if self.hexdigest() == self.expected:
+            return None
+        return '%s mismatch: expected %s, got %s' % (self.algorithm, self.expected, self.hexdigest())
+
+
+def _open_spill_file():
+    SPILL_PATH.mkdir(parents=True, exist_ok=True)
+    path = SPILL_PATH / ('%s.body' % uuid.uuid4().hex)
+    return path, path.open('wb')
+
+
+def _decoder_for(encoding):
+    try:
+        return codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+
+class BodyReader:
+    # JSON is only formatted once complete, other text is passed to
+    # `on_chunk` as it is decoded and still kept, so a JSON body sent with
+    # another content type is parsed at the end. Past `max_size` bytes the
+    # body is only written to a spill file.
+    def __init__(self, encoding, is_json, max_size=None, on_chunk=None, on_progress=None, keep_raw=False,
+                 checksum=None):
+        self.checksum = Checksum(checksum) if checksum else None
+        self.is_json = is_json
+        self.keep_raw = keep_raw
+        self.max_size = max_result_size() if max_size is None else max_size
+        self.stream_chunks = on_chunk is not None and not is_json
+        self.on_chunk = on_chunk
+        self.on_progress = on_progress
+        self.decoder = _decoder_for(encoding)
+
+        self.parts = []
+        self.raw_parts = []
+        self.size = 0
+        self.spill_path = None
+        self.spill_file = None
+        self.start = time.time()
+        self.last_progress = 0
+
+    def _add_text(self, text):
+        if text:
+            self.parts.append(text)
+            if self.stream_chunks:
+                self.on_chunk(text)
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        if self.checksum is not None:
+            self.checksum.update(chunk)
+
+        if self.spill_file is not None:
+            self.spill_file.write(chunk)
+        elif self.size > self.max_size:
+            self.spill_path, self.spill_file = _open_spill_file()
+            for raw in self.raw_parts:
+                self.spill_file.write(raw)
+            self.spill_file.write(chunk)
+            self.raw_parts = []
+        else:
+            self.raw_parts.append(chunk)
+            self._add_text(self.decoder.decode(chunk))
+
+        now = time.time()
+        if self.on_progress is not None and now - self.last_progress >= PROGRESS_INTERVAL:
+            self.last_progress = now
+            self.on_progress(self.size, now - self.start)
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            prune_spill_files(keep=self.spill_path)
+        else:
+            self._add_text(self.decoder.decode(b'', final=True))
+
+        text = ''.join(self.parts)
+        is_json = self.is_json
+        if self.stream_chunks and self.spill_path is None:
+            try:
+                json.loads(text)
+                is_json = True
+            except ValueError:
+                pass
+
+        if self.on_progress is not None:
+            self.on_progress(self.size, time.time() - self.start)
+
+        return ResponseBody(
+            text=text,
+            size=self.size,
+            is_json=is_json,
+            streamed=self.stream_chunks,
+            truncated=self.spill_path is not None,
+            spill_path=str(self.spill_path) if self.spill_path is not None else None,
+            raw=b''.join(self.raw_parts) if self.keep_raw and self.spill_path is None else None,
+            checksum_error=self.checksum.error() if self.checksum is not None else None,
+        )
+
+    def abort(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            try:
+                self.spill_path.unlink()
+            except OSError:
+                pass
+
+
+def read_response(r, max_size=None, on_chunk=None, on_progress=None, cancel_token=None, keep_raw=False,
+                  checksum=None):
+    try:
+        reader = BodyReader(r.encoding, is_json_response(r.headers), max_size, on_chunk, on_progress, keep_raw, checksum)
+    except BaseException:
+        r.close()
+        raise
+    try:
+        for chunk in r.iter_content(CHUNK_SIZE):
+            if cancel_token is not None:
+                cancel_token.check()
+            reader.feed(chunk)
+    except BaseException:
+        reader.abort()
+        raise
+    finally:
+        r.close()
+    return reader.close()
+
+
+def replay_response(raw, encoding, headers, on_chunk=None, on_progress=None, checksum=None):
+    # a stored body goes through the same decoding as a received one
+    reader = BodyReader(encoding, is_json_response(headers), len(raw), on_chunk, on_progress, checksum=checksum)
+    for start in range(0, len(raw), CHUNK_SIZE):
+        reader.feed(raw[start:start + CHUNK_SIZE])
+    return reader.close()
+
+
+def parse_response(body):
+    if body.truncated or body.download_path is not None or (body.streamed and not body.is_json):
+        raise ValueError('Response was not buffered')
+    return json.loads(body.text)
+
+
+def _format_body(body):
+    if body.truncated:
+        return body.text + '\n\n[Truncated: %s received. Full body saved to %s]' % (
+            format_size(body.size), body.spill_path
+        )
+
+    if body.streamed:
+        # already shown as it arrived
+        return body.text
+    try:
+        return json.dumps(parse_response(body), indent=2)
+    except ValueError:
+        return body.text
+
+
+def format_response(body):
+    text = _format_body(body)
+    # downloads already report it in their summary
+    if body.checksum_error is not None and body.download_path is None:
+        text += '\n\n[%s]' % body.checksum_error
+    return text
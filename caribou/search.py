@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from typing import NamedTuple
+
+# filters routes on their group (or workspace module) name: "@users get"
+GROUP_PREFIX = '@'
+
+WORD_START_BONUS = 8
+CONSECUTIVE_BONUS = 4
+SUBSTRING_BONUS = 20
+
+# term score tables kept for reuse while typing
+TERM_CACHE_SIZE = 64
+
+
+def fuzzy_score(term, text, word_starts):
+    # returns None when `term` is not a subsequence of `text`
+    position = text.find(term)
+    if position != -1:
+        score = SUBSTRING_BONUS + len(term) * CONSECUTIVE_BONUS - position
+        if position in word_starts:
+            score += WORD_START_BONUS
+        return score
+
+    score = 0
+    position = -1
+    previous = -2
+    for c in term:
+        position = text.find(c, position + 1)
+        if position == -1:
+            return None
+        if position in word_starts:
+            score += WORD_START_BONUS
+        if position == previous + 1:
+            score += CONSECUTIVE_BONUS
+        previous = position
+    return score - (position - len(term)) // 4
+
+
+class IndexEntry(NamedTuple):
+    text: str
+    word_starts: frozenset
+
+
+class Query(NamedTuple):
+    terms: tuple
+    groups: tuple
+
+    @classmethod
+    def parse(cls, text):
+        terms = []
+        groups = []
+        for element in text.lower().split():
+            if element.startswith(GROUP_PREFIX):
+                if len(element) > len(GROUP_PREFIX):
+                    groups.append(element[len(GROUP_PREFIX):])
+            else:
+                terms.append(element)
+        return cls(tuple(terms), tuple(groups))
+
+
+def _entry(route):
+    text = route.raw_display_name.lower()
+    word_starts = frozenset(
+        i for i, c in enumerate(text) if c != ' ' and (i == 0 or text[i - 1] == ' ')
+    )
+    return IndexEntry(text, word_starts)
+
+
+def _route_groups(route):
+    groups = []
+    if route.group is not None:
+        groups.append(route.group.name.lower())
+    if route.module is not None:
+        groups.append(route.module.lower())
+    return groups
+
+
+class RouteIndex:
+    def __init__(self, routes):
+        self.routes = list(routes)
+        self.entries = [_entry(route) for route in self.routes]
+
+        # character -> routes containing it, intersected to find the candidates of a term
+        self.postings = {}
+        # group or module name -> routes in it
+        self.groups = {}
+        for i, (route, entry) in enumerate(zip(self.routes, self.entries)):
+            for c in set(entry.text):
+                self.postings.setdefault(c, set()).add(i)
+            for group in _route_groups(route):
+                self.groups.setdefault(group, set()).add(i)
+
+        self.term_scores = OrderedDict()
+
+    def _candidates(self, term):
+        # a term extending a cached one can only match a subset of its routes
+        for length in range(len(term) - 1, 0, -1):
+            scores = self.term_scores.get(term[:length])
+            if scores is not None:
+                return scores.keys()
+
+        sets = []
+        for c in set(term):
+            postings = self.postings.get(c)
+            if postings is None:
+                return ()
+            sets.append(postings)
+        return set.intersection(*sets)
+
+    def _term_scores(self, term):
+        scores = self.term_scores.get(term)
+        if scores is not None:
+            self.term_scores.move_to_end(term)
+            return scores
+
+        scores = {}
+        entries = self.entries
+        for i in self._candidates(term):
+            entry = entries[i]
+            score = fuzzy_score(term, entry.text, entry.word_starts)
+            if score is not None:
+                scores[i] = score
+
+        self.term_scores[term] = scores
+        while len(self.term_scores) > TERM_CACHE_SIZE:
+            self.term_scores.popitem(last=False)
+        return scores
+
+    def _group_matches(self, group):
+        matches = set()
+        for name, indexes in self.groups.items():
+            if group in name:
+                matches |= indexes
+        return matches
+
+    def search(self, text):
+        # returns the matching routes, best first
+        query = Query.parse(text)
+        if not query.terms and not query.groups:
+            return list(self.routes)
+
+        allowed = None
+        for group in query.groups:
+            matches = self._group_matches(group)
+            allowed = matches if allowed is None else allowed & matches
+
+        all_scores = [self._term_scores(term) for term in query.terms]
+        if all_scores:
+            smallest = min(all_scores, key=len)
+            indexes = smallest.keys() if allowed is None else allowed.intersection(smallest)
+            totals = {}
+            for i in indexes:
+                total = 0
+                for scores in all_scores:
+                    score = scores.get(i)
+                    if score is None:
+                        break
+                    total += score
+                else:
+                    totals[i] = total
+        else:
+            totals = dict.fromkeys(allowed, 0)
+
+        ranked = sorted(totals, key=lambda i: (-totals[i], i))
+        return [self.routes[i] for i in ranked]
@@ -1,13 +1,93 @@
 import os
 import json
+import atexit
+import sqlite3
+import traceback
 from pathlib import Path
+from threading import Lock, Timer
 from .exceptions import MissingParameter
+from .history import ResponseHistory, HISTORY_PATH, DEFAULT_MEMORY_BUDGET, DEFAULT_HISTORY_SIZE
 
 VERSION = 1
 DATA_PATH = Path(os.path.expanduser('~/.caribou/data'))
+DB_PATH = Path(os.path.expanduser('~/.caribou/data.db'))
+
+# delay before dirty keys are written, so bursts of saves end up in one transaction
+FLUSH_DELAY = 0.5
 
 GLOBAL_STORAGE = {}
-TEMPORARY_STORAGE = {}
+
+
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.connection = None
+
+    def _connect(self):
+        if self.connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                str(self.path),
+                timeout=5,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS storage (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.connection = connection
+        return self.connection
+
+    def version(self):
+        with self.lock:
+            row = self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            return int(row[0]) if row is not None else None
+
+    def load(self):
+        with self.lock:
+            rows = self._connect().execute('SELECT key, value FROM storage').fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def write(self, items, version=VERSION):
+        with self.lock:
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO storage (key, value) VALUES (?, ?)',
+                    [(key, json.dumps(value)) for key, value in items.items()]
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                    (str(version),)
+                )
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+_backend = SQLiteBackend(DB_PATH)
+_dirty = {}
+_dirty_lock = Lock()
+_flush_timer = None
+
+
+def _set(key, value):
+    if key in GLOBAL_STORAGE and GLOBAL_STORAGE[key] == value:
+        return
+    GLOBAL_STORAGE[key] = value
+    with _dirty_lock:
+        _dirty[key] = value
+    persist_storage()
 
 
 def load_setting(name):
@@ -15,34 +95,65 @@ def load_setting(name):
 
 
 def save_setting(name, value):
-    GLOBAL_STORAGE['settings.%s' % name] = value
+    _set('settings.%s' % name, value)
 
 
 def save_parameter(prefix, parameter, value):
-    GLOBAL_STORAGE[parameter.storage_path(prefix)] = value
+    _set(parameter.storage_path(prefix), value)
 
 
 def load_parameter(prefix, parameter):
     return GLOBAL_STORAGE.get(parameter.storage_path(prefix))
 
 
-def save_request_result(route, value):
-    TEMPORARY_STORAGE['%s.result' % route.storage_prefix] = value
+_response_history = None
+
+
+def response_history():
+    global _response_history
+    if _response_history is None:
+        _response_history = ResponseHistory(
+            HISTORY_PATH,
+            memory_budget=int(load_setting('history_memory_budget') or DEFAULT_MEMORY_BUDGET),
+            history_size=int(load_setting('history_size') or DEFAULT_HISTORY_SIZE),
+        )
+    return _response_history
+
 
+def save_request_result(route, value, status_code=0, elapsed=0, meta=None):
+    return response_history().add(route.storage_prefix, value, status_code, elapsed, meta)
 
-def load_request_result(route):
-    return TEMPORARY_STORAGE.get('%s.result' % route.storage_prefix)
 
+def list_request_results(route):
+    return response_history().list(route.storage_prefix)
 
-def get_parameter_values(prefix, parameters):
+
+def load_request_result(route, entry=None):
+    if entry is None:
+        entries = list_request_results(route)
+        if not entries:
+            return None
+        entry = entries[0]
+    return response_history().load(route.storage_prefix, entry)
+
+
+def load_request_meta(route, entry):
+    return response_history().load_meta(route.storage_prefix, entry)
+
+
+def get_parameter_values(prefix, parameters, overrides=None, generate=None):
+    # `generate(param, prefix)` fills the generated parameters that have no value
     values = {}
     for param in parameters:
-        storage_path = param.storage_path(prefix)
-
-        value = GLOBAL_STORAGE.get(storage_path)
+        if overrides is not None and param.name in overrides:
+            value = overrides[param.name]
+        else:
+            value = GLOBAL_STORAGE.get(param.storage_path(prefix))
 
         if value in (None, ''):
             value = param.default
+            if value in (None, '') and generate is not None and param.is_generated:
+                value = generate(param, prefix)
         else:
             value = param.process_value(value)
 
@@ -53,37 +164,87 @@ def get_parameter_values(prefix, parameters):
     return values
 
 
-def get_parameter_values_for_route(route):
+def get_parameter_values_for_route(route, overrides=None, generate=None):
     if route.group is not None:
         group_values = get_parameter_values(
             route.group.storage_prefix,
-            route.group.parameters
+            route.group.parameters,
+            overrides,
+            generate
         )
     else:
         group_values = {}
 
     route_values = get_parameter_values(
         route.storage_prefix,
-        route.parameters
+        route.parameters,
+        overrides,
+        generate
     )
     return group_values, route_values
 
 
-# XXX: cleanup
-def load_storage():
-    global GLOBAL_STORAGE
-    if DATA_PATH.exists():
+def _load_legacy_storage():
+    if not DATA_PATH.exists():
+        return {}
+    try:
         with DATA_PATH.open() as f:
             data = json.load(f)
-            if data['version'] != VERSION:
-                return
-            GLOBAL_STORAGE = data['data']
+    except ValueError:
+        return {}
+    if data.get('version') != VERSION:
+        return {}
+    return data['data']
+
+
+def load_storage():
+    global GLOBAL_STORAGE
+    version = _backend.version()
+    if version is None:
+        data = _load_legacy_storage()
+        _backend.write(data)
+    elif version != VERSION:
+        return
+    else:
+        data = _backend.load()
+    GLOBAL_STORAGE = data
+
+
+def flush_storage():
+    global _flush_timer
+    with _dirty_lock:
+        items = dict(_dirty)
+        _dirty.clear()
+        _flush_timer = None
+
+    if not items:
+        return
+
+    try:
+        _backend.write(items)
+    except sqlite3.Error:
+        traceback.print_exc()
+        with _dirty_lock:
+            for key, value in items.items():
+                _dirty.setdefault(key, value)
 
 
 def persist_storage():
-    DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with DATA_PATH.open('w') as f:
-        json.dump({
-            'version': VERSION,
-            'data': GLOBAL_STORAGE
-        }, f)
+    global _flush_timer
+    with _dirty_lock:
+        if _flush_timer is not None or not _dirty:
+            return
+        _flush_timer = Timer(FLUSH_DELAY, flush_storage)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+@atexit.register
+def _flush_at_exit():
+    with _dirty_lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+    flush_storage()
+    _backend.close()
+    if _response_history is not None:
+        _response_history.close()
@@ -0,0 +1,101 @@
+import re
+from bisect import bisect_left, bisect_right
+
+from .storage import load_setting
+
+DEFAULT_MAX_MATCHES = 10000
+# matches found before the partial results are reported
+BATCH_SIZE = 2000
+
+_astral = re.compile('[\U00010000-\U0010FFFF]')
+
+
+def max_matches():
+    return int(load_setting('search_max_matches') or DEFAULT_MAX_MATCHES)
+
+
+def compile_pattern(text, regex=False, case_sensitive=False):
+    # raises re.error for an invalid regex
+    flags = 0 if case_sensitive else re.IGNORECASE
+    return re.compile(text if regex else re.escape(text), flags | re.MULTILINE)
+
+
+class SearchMatches:
+    # sorted (start, end) positions of the matches in the result document
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.capped = False
+        self.done = False
+
+    def __len__(self):
+        return len(self.starts)
+
+    def extend(self, starts, ends):
+        self.starts.extend(starts)
+        self.ends.extend(ends)
+
+    def next_index(self, position):
+        # first match starting after `position`, wrapping around
+        if not self.starts:
+            return None
+        index = bisect_right(self.starts, position)
+        return index if index < len(self.starts) else 0
+
+    def previous_index(self, position):
+        if not self.starts:
+            return None
+        index = bisect_left(self.starts, position) - 1
+        return index if index >= 0 else len(self.starts) - 1
+
+    def index_at(self, position):
+        index = bisect_left(self.starts, position)
+        if index < len(self.starts) and self.starts[index] == position:
+            return index
+        return None
+
+    def in_range(self, start, end):
+        # indexes of the matches overlapping [start, end)
+        first = bisect_left(self.ends, start + 1)
+        last = bisect_left(self.starts, end)
+        return range(first, max(first, last))
+
+
+class TextSearch:
+    # run on a worker thread, `cancelled` is set when the search is superseded
+    def __init__(self, text, pattern, limit=None):
+        self.text = text
+        self.pattern = pattern
+        self.limit = max_matches() if limit is None else limit
+        self.cancelled = False
+
+    def _document_positions(self):
+        # the document counts UTF-16 units, characters outside the BMP take two
+        astral = [m.start() for m in _astral.finditer(self.text)]
+        if not astral:
+            return lambda position: position
+        return lambda position: position + bisect_left(astral, position)
+
+    def run(self, on_batch):
+        # calls on_batch(starts, ends, done, capped) every BATCH_SIZE matches
+        to_document = self._document_positions()
+        starts = []
+        ends = []
+        count = 0
+        for match in self.pattern.finditer(self.text):
+            if self.cancelled:
+                return
+            start, end = match.span()
+            if start == end:
+                continue
+            starts.append(to_document(start))
+            ends.append(to_document(end))
+            count += 1
+            if count >= self.limit:
+                on_batch(starts, ends, True, True)
+                return
+            if len(starts) >= BATCH_SIZE:
+                on_batch(starts, ends, False, False)
+                starts = []
+                ends = []
+        on_batch(starts, ends, True, False)
@@ -0,0 +1,87 @@
+from typing import NamedTuple
+
+from .response import format_size
+
+PHASES = ('dns', 'connect', 'tls', 'send', 'wait', 'download', 'decode')
+
+PHASE_LABELS = {
+    'dns': 'DNS',
+    'connect': 'Connect',
+    'tls': 'TLS',
+    'send': 'Send',
+    'wait': 'Wait (TTFB)',
+    'download': 'Download',
+    'decode': 'Decode',
+}
+
+
+class TimingRecorder:
+    # filled in by the connections of a request, redirects add up
+    def __init__(self):
+        self.dns = 0.0
+        self.connect = 0.0
+        self.tls = 0.0
+        self.send = 0.0
+        self.wait = 0.0
+        self.download = 0.0
+        self.decode = 0.0
+
+    def timing(self, size, total):
+        return Timing(
+            self.dns, self.connect, self.tls, self.send, self.wait,
+            self.download, self.decode, size, total,
+        )
+
+
+class Timing(NamedTuple):
+    dns: float = 0.0
+    connect: float = 0.0
+    tls: float = 0.0
+    send: float = 0.0
+    wait: float = 0.0
+    download: float = 0.0
+    decode: float = 0.0
+    size: int = 0
+    total: float = 0.0
+
+    @property
+    def rate(self):
+        return self.size / self.download if self.download > 0 else None
+
+    def phases(self):
+        # (phase, start, duration) in request order, for a waterfall
+        start = 0.0
+        phases = []
+        for phase in PHASES:
+            duration = getattr(self, phase)
+            phases.append((phase, start, duration))
+            start += duration
+        return phases
+
+    def to_dict(self):
+        return self._asdict()
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: value for key, value in data.items() if key in cls._fields})
+
+    def format(self, previous=None):
+        # with `previous`, its values and the difference are shown next to each phase
+        def row(label, value, previous_value):
+            line = '%-12s%8.1f ms' % (label, value * 1000)
+            if previous is not None:
+                line += '%10.1f ms %+9.1f ms' % (previous_value * 1000, (value - previous_value) * 1000)
+            return line
+
+        lines = []
+        if previous is not None:
+            lines.append('%-12s%11s%13s%13s' % ('', 'this run', 'previous', 'delta'))
+        for phase in PHASES:
+            lines.append(row(PHASE_LABELS[phase], getattr(self, phase), getattr(previous, phase, 0)))
+        lines.append(row('Total', self.total, getattr(previous, 'total', 0)))
+
+        size = 'Size        %s' % format_size(self.size)
+        if self.rate is not None:
+            size += ' (%s/s)' % format_size(self.rate)
+        lines.append(size)
+        return '\n'.join(lines)
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+
+from .storage import load_setting
+
+# CARIBOU_TRACE=1 enables tracing at startup, CARIBOU_TRACE=trace.json also exports it on exit
+TRACE_ENV = 'CARIBOU_TRACE'
+DEFAULT_BUFFER_SIZE = 100000
+
+
+class SpanStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.last = duration
+
+
+class Tracer:
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.enabled = False
+        self.lock = Lock()
+        # oldest events are dropped once the buffer is full
+        self.events = deque(maxlen=buffer_size)
+        self.stats = {}
+        self.thread_names = {}
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+
+    def _timestamp(self, value):
+        # trace events are in microseconds
+        return (value - self.origin) * 1e6
+
+    def record(self, name, start, end, category='caribou', args=None):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': self._timestamp(start),
+            'dur': (end - start) * 1e6,
+            'pid': self.pid,
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+            self.thread_names.setdefault(thread.ident, thread.name)
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = SpanStats()
+            stats.add(end - start)
+
+    @contextmanager
+    def _span(self, name, category, args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), category, args)
+
+    def span(self, name, category='caribou', **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name, category, args)
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+            self.stats.clear()
+
+    def slowest(self, count=3):
+        with self.lock:
+            items = [(name, stats.max) for name, stats in self.stats.items()]
+        return sorted(items, key=lambda item: -item[1])[:count]
+
+    def summary(self, count=3):
+        slowest = self.slowest(count)
+        if not slowest:
+            return 'Tracing: no spans yet'
+        return 'Slowest: ' + ', '.join('%s %.1f ms' % (name, duration * 1000) for name, duration in slowest)
+
+    def trace_events(self):
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+            for tid, name in thread_names.items()
+        ]
+        return metadata + events
+
+    def export(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+_tracer = None
+_tracer_lock = Lock()
+
+
+def get_tracer():
+    global _tracer
+    if _tracer is not None:
+        return _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(int(load_setting('trace_buffer_size') or DEFAULT_BUFFER_SIZE))
+            value = os.environ.get(TRACE_ENV)
+            if value:
+                _tracer.enabled = True
+                if value not in ('1', 'true', 'yes'):
+                    atexit.register(_tracer.export, value)
+        return _tracer
+
+
+def span(name, category='caribou', **args):
+    return get_tracer().span(name, category, **args)
+
+
+def traced(name=None, category='caribou'):
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,330 @@
+import os
+import time
+import socket
+import threading
+from contextlib import contextmanager
+from http.cookiejar import LWPCookieJar, LoadError
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+try:
+    from urllib3.exceptions import NameResolutionError
+except ImportError:
+    # urllib3 < 2 reports DNS failures as NewConnectionError
+    NameResolutionError = None
+
+from .storage import load_setting
+from .exceptions import CaribouException
+
+COOKIES_PATH = Path(os.path.expanduser('~/.caribou/cookies'))
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+
+def _timeout_setting(name, default):
+    value = load_setting(name)
+    if value is None:
+        return default
+    # 0 disables the timeout
+    return float(value) or None
+
+
+def resolve_timeout(timeout=None):
+    if timeout is None:
+        return (
+            _timeout_setting('connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+            _timeout_setting('read_timeout', DEFAULT_READ_TIMEOUT),
+        )
+    if isinstance(timeout, (tuple, list)):
+        return tuple(timeout)
+    return timeout, timeout
+
+
+class RequestCancelled(CaribouException):
+    def __str__(self):
+        return 'Request cancelled'
+
+
+class CancelToken:
+    def __init__(self):
+        self.cancelled = False
+        self.connection = None
+        self.lock = Lock()
+
+    def _abort(self, connection):
+        sock = getattr(connection, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def attach(self, connection):
+        with self.lock:
+            self.connection = connection
+            if self.cancelled:
+                self._abort(connection)
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.connection is not None:
+                self._abort(self.connection)
+
+    def check(self):
+        if self.cancelled:
+            raise RequestCancelled()
+
+
+class RequestScope(NamedTuple):
+    cancel_token: CancelToken = None
+    timing: object = None
+    # connections opened while in the scope, none when it reused a pooled one
+    connections: list = None
+
+
+_local = threading.local()
+
+
+def _current_scope():
+    return getattr(_local, 'scope', None) or RequestScope()
+
+
+@contextmanager
+def request_scope(cancel_token=None, timing=None):
+    # connections used by this thread while in the scope can be aborted
+    # through `cancel_token` and record their phases in `timing`
+    _local.scope = RequestScope(cancel_token, timing, [])
+    try:
+        yield _local.scope
+    finally:
+        _local.scope = None
+
+
+class _ScopedConnectionMixin:
+    def _new_conn(self):
+        timing = _current_scope().timing
+        if timing is None:
+            return super()._new_conn()
+
+        # resolve here so DNS is timed apart from the TCP handshake
+        start = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(self._dns_host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            if NameResolutionError is None:
+                raise NewConnectionError(self, 'Failed to resolve %r (%s)' % (self.host, e)) from e
+            raise NameResolutionError(self.host, self, e) from e
+        resolved = time.perf_counter()
+        timing.dns += resolved - start
+
+        dns_host = self._dns_host
+        error = None
+        try:
+            for address in dict.fromkeys(info[4][0] for info in infos):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except NewConnectionError as e:
+                    error = e
+            raise error
+        finally:
+            self._dns_host = dns_host
+            timing.connect += time.perf_counter() - resolved
+
+    def _connection_time(self, timing):
+        return timing.dns + timing.connect + timing.tls
+
+    def connect(self):
+        scope = _current_scope()
+        timing = scope.timing
+        if timing is not None:
+            start = time.perf_counter()
+            before = self._connection_time(timing)
+
+        super().connect()
+
+        if timing is not None:
+            # what connect() spent besides opening the socket is the TLS handshake
+            handshake = time.perf_counter() - start - (self._connection_time(timing) - before)
+            if isinstance(self, HTTPSConnection):
+                timing.tls += handshake
+            else:
+                timing.connect += handshake
+        if scope.connections is not None:
+            scope.connections.append(self)
+        if scope.cancel_token is not None:
+            scope.cancel_token.attach(self)
+
+    def request(self, *args, **kwargs):
+        scope = _current_scope()
+        if scope.cancel_token is not None:
+            scope.cancel_token.check()
+            scope.cancel_token.attach(self)
+
+        timing = scope.timing
+        if timing is None:
+            return super().request(*args, **kwargs)
+
+        # a new connection is opened lazily while sending, it is timed on its own
+        start = time.perf_counter()
+        before = self._connection_time(timing)
+        result = super().request(*args, **kwargs)
+        self._sent_at = time.perf_counter()
+        timing.send += self._sent_at - start - (self._connection_time(timing) - before)
+        return result
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        timing = _current_scope().timing
+        sent_at = getattr(self, '_sent_at', None)
+        if timing is not None and sent_at is not None:
+            timing.wait += time.perf_counter() - sent_at
+            self._sent_at = None
+        return response
+
+
+class ScopedHTTPConnection(_ScopedConnectionMixin, HTTPConnection):
+    pass
+
+
+class ScopedHTTPSConnection(_ScopedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class ScopedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = ScopedHTTPConnection
+
+
+class ScopedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = ScopedHTTPSConnection
+
+
+class TransportAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': ScopedHTTPConnectionPool,
+            'https': ScopedHTTPSConnectionPool,
+        }
+
+
+class PoolStats(NamedTuple):
+    host: str
+    new_connections: int = 0
+    reused_connections: int = 0
+
+    def __add__(self, other):
+        return PoolStats(
+            self.host,
+            self.new_connections + other.new_connections,
+            self.reused_connections + other.reused_connections,
+        )
+
+
+def host_key(url):
+    parts = urlsplit(url)
+    return '%s://%s' % (parts.scheme, parts.netloc)
+
+
+class Transport:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, keep_alive=True, cookies_path=COOKIES_PATH):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.cookies_path = cookies_path
+        self.cookies = LWPCookieJar(str(cookies_path))
+        self.sessions = {}
+        self.lock = Lock()
+
+        if cookies_path.exists():
+            try:
+                self.cookies.load(ignore_discard=True)
+            except (LoadError, OSError):
+                pass
+
+    def _create_session(self):
+        session = requests.Session()
+        # one session per host, so a single pool per adapter is enough
+        adapter = TransportAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.cookies = self.cookies
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def session_for(self, url):
+        key = host_key(url)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self._create_session()
+                self.sessions[key] = session
+            return session
+
+    def request(self, method, url, **kwargs):
+        return self.session_for(url).request(method, url, **kwargs)
+
+    def stats(self, url):
+        key = host_key(url)
+        with self.lock:
+            session = self.sessions.get(key)
+        stats = PoolStats(key)
+        if session is None:
+            return stats
+
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                stats += PoolStats(
+                    key,
+                    pool.num_connections,
+                    max(pool.num_requests - pool.num_connections, 0),
+                )
+        return stats
+
+    def all_stats(self):
+        with self.lock:
+            keys = list(self.sessions.keys())
+        return [self.stats(key) for key in keys]
+
+    def save_cookies(self):
+        self.cookies_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cookies.save(ignore_discard=True)
+
+    def close(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+        for session in sessions:
+            session.close()
+
+
+_transport = None
+_transport_lock = Lock()
+
+
+def get_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            pool_size = load_setting('pool_size') or DEFAULT_POOL_SIZE
+            keep_alive = load_setting('keep_alive')
+            _transport = Transport(
+                pool_size=int(pool_size),
+                keep_alive=True if keep_alive is None else bool(keep_alive),
+            )
+        return _transport
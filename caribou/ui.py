@@ -1,31 +1,52 @@
+import re
 import sys
 import time
 import os
-import requests
 import json
+import html
+import asyncio
 import traceback
-from requests.models import PreparedRequest
-from pygments.token import Name, String, Number, Keyword
-from pygments.lexers import JsonLexer
+from collections import deque, OrderedDict
+from typing import NamedTuple
 from PySide2.QtWidgets import (
     QLabel, QLineEdit, QPushButton, QApplication,
     QVBoxLayout, QHBoxLayout, QMainWindow, QWidget,
-    QTextEdit, QPlainTextEdit, QFrame, QComboBox, QScrollArea,
-    QShortcut, QFileDialog, QAction, QMessageBox
+    QTextEdit, QPlainTextEdit, QFrame, QComboBox,
+    QShortcut, QFileDialog, QAction, QMessageBox, QTreeView, QStackedWidget,
+    QDialog, QFormLayout, QSpinBox, QDoubleSpinBox, QListView, QStyledItemDelegate,
+    QStyleOptionViewItem, QStyle, QTableWidget, QTableWidgetItem, QHeaderView
+)
+from PySide2.QtCore import (
+    Signal, QThreadPool, QRunnable, Slot, QObject, Qt, QFileSystemWatcher, QTimer,
+    QAbstractItemModel, QAbstractListModel, QModelIndex, QItemSelectionModel, QSize, QPoint
 )
-from PySide2.QtCore import Signal, QThreadPool, QRunnable, Slot, QObject, Qt, QFileSystemWatcher
 from PySide2.QtGui import (
     QIcon, QFont, QTextCharFormat, QSyntaxHighlighter, QColor,
-    QKeySequence, QTextDocument, QTextCursor, QPalette, QFontMetrics
+    QKeySequence, QTextCursor, QPalette, QFontMetrics, QPainter
 )
 from .models import Route, Choice, List, TextField
-from .loader import load_file
+from .loader import load_file, diff_routes, Workspace
+from .search import RouteIndex
+from .textsearch import SearchMatches, TextSearch, compile_pattern
 from .storage import (
     save_parameter, load_parameter, get_parameter_values_for_route,
-    load_request_result, save_request_result, MissingParameter,
+    load_request_result, save_request_result, list_request_results, load_request_meta, MissingParameter,
     persist_storage, load_storage, load_setting, save_setting
 )
 from .exceptions import CaribouException
+from . import highlight
+from .transport import get_transport, CancelToken, RequestCancelled
+from .preview import preview_key, cached_preview, build_preview, truncate_preview, clear_previews
+from .response import format_size, prune_spill_files
+from .timing import Timing
+from .tracing import get_tracer, span, traced
+from .execute import execute_request
+from .httpcache import get_http_cache, cache_enabled, HIT, REVALIDATED
+from .download import download_dir
+from .loadtest import LoadTest
+from .collection import CollectionRun, DEFAULT_PARALLELISM, SKIPPED
+from .generators import generate_value, prefetch
+from .aio import get_engine, use_asyncio
 
 CURRENT_DIR = os.path.dirname(__file__)
 
@@ -33,99 +54,272 @@ FONT = QFont('Fira Mono')
 FONT_ROUTE = QFont('Fira Mono', 11)
 TEXT_FONT = QFont('Fira Mono')
 
+# characters appended to the result view per event loop tick
+RESULT_APPEND_SIZE = 256 * 1024
 
-class RouteButton(QPushButton):
-    def __init__(self, route):
-        super().__init__(route.raw_display_name)
+# delay (ms) after the last parameter edit before the preview is rebuilt
+PREVIEW_DELAY = 150
 
-        self.setStyleSheet("color:rgba(0,0,0,0)")
+# delay (ms) after the last keystroke in the result search
+SEARCH_DELAY = 100
 
-        self._label = QLabel(route.display_name, self)
-        self._label.setAlignment(Qt.AlignCenter | Qt.AlignBaseline)
-        self._label.setFont(FONT_ROUTE)
-        self._label.setDisabled(True)
-        self.stackUnder(self._label)
+# panes of recently shown routes are kept so switching back to them is instant
+DEFAULT_PANE_CACHE_SIZE = 16
+DEFAULT_PANE_CACHE_MEMORY = 64 * 1024 * 1024
+# bytes per character of a result: the UTF-16 document with its layout, and the Python copy
+RESULT_MEMORY_FACTOR = 6
 
-    def resizeEvent(self, p):
-        super().resizeEvent(p)
-        size = self.geometry().size()
-        # XXX: magic number
-        size.setHeight(size.height() - 4)
-        self._label.resize(size)
 
+ROUTE_ROLE = Qt.UserRole
 
-class RouteList(QWidget):
-    new_route_signal = Signal(Route)
 
-    def _create_route_widget(self, route):
-        button = RouteButton(route)
-        button.setCheckable(True)
-        button.setAutoExclusive(True)
-        button.setFont(FONT_ROUTE)
+class RouteSection(NamedTuple):
+    name: str
+    expanded: bool
 
-        def cb():
-            self.new_route_signal.emit(route)
 
-        button.clicked.connect(cb)
-        return button
+class RouteListModel(QAbstractListModel):
+    # rows are routes, and workspace section headers when not searching
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == ROUTE_ROLE:
+            return row
+        if role == Qt.DisplayRole:
+            if isinstance(row, RouteSection):
+                return '%s %s' % ('▾' if row.expanded else '▸', row.name)
+            return row.raw_display_name
+        return None
+
+
+class RouteDelegate(QStyledItemDelegate):
+    PADDING = 6
+
+    def paint(self, painter, option, index):
+        opt = QStyleOptionViewItem(option)
+        self.initStyleOption(opt, index)
+        opt.text = ''
+        # background, selection and focus come from the style, only the words are drawn here
+        style = opt.widget.style() if opt.widget is not None else QApplication.style()
+        style.drawControl(QStyle.CE_ItemViewItem, opt, painter, opt.widget)
+
+        painter.save()
+        painter.setFont(FONT_ROUTE)
+        metrics = QFontMetrics(FONT_ROUTE)
+        rect = option.rect
+        baseline = rect.top() + (rect.height() + metrics.ascent() - metrics.descent()) // 2
+
+        row = index.data(ROUTE_ROLE)
+        if isinstance(row, RouteSection):
+            painter.setPen(QColor('#A0A0A0'))
+            painter.drawText(rect.left() + self.PADDING, baseline, index.data(Qt.DisplayRole))
+        else:
+            words = row.display_words
+            space = metrics.horizontalAdvance(' ')
+            width = sum(metrics.horizontalAdvance(word) for word, _ in words) + space * (len(words) - 1)
+            x = rect.left() + max(self.PADDING, (rect.width() - width) // 2)
+            for word, color in words:
+                painter.setPen(QColor(color))
+                painter.drawText(x, baseline, word)
+                x += metrics.horizontalAdvance(word) + space
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        metrics = QFontMetrics(FONT_ROUTE)
+        text = index.data(Qt.DisplayRole) or ''
+        return QSize(metrics.horizontalAdvance(text) + 2 * self.PADDING, metrics.height() + self.PADDING)
+
+
+class RouteList(QListView):
+    new_route_signal = Signal(Route)
+    # workspace modules that must be executed to show their routes
+    load_sections_signal = Signal(list)
 
-    def __init__(self, routes):
+    def __init__(self, routes, sections=None):
         super().__init__()
 
-        self.buttons = []
-        self.route_per_button = {}
+        self.route_model = RouteListModel()
+        self.setModel(self.route_model)
+        self.setItemDelegate(RouteDelegate(self))
+        # every row has the same height, the view only lays out what is visible
+        self.setUniformItemSizes(True)
+        self.setEditTriggers(QListView.NoEditTriggers)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.clicked.connect(self._activate)
+
+        self.routes = []
+        # (module name, loaded) pairs in workspace mode, None for a single file
+        self.sections = None
+        self.collapsed = set()
+        self.search_text = ''
+        self.selected_route = None
+        self.index = None
+
+        self._set_routes(routes, sections)
+
+    def _update_sections(self, sections):
+        old_sections = dict(self.sections or [])
+        self.sections = sections
+        names = {name for name, _ in sections or []}
+        self.collapsed &= names
+
+        for name, loaded in sections or []:
+            if not loaded:
+                self.collapsed.add(name)
+            elif not old_sections.get(name, True):
+                # just loaded, show its routes
+                self.collapsed.discard(name)
+
+    def _set_routes(self, routes, sections):
+        self.routes = list(routes)
+        self._update_sections(sections)
+        self.index = RouteIndex(self.routes)
+
+        metrics = QFontMetrics(FONT_ROUTE)
+        width = max((metrics.horizontalAdvance(route.raw_display_name) for route in self.routes), default=100)
+        self.setMinimumWidth(width + 2 * RouteDelegate.PADDING + self.verticalScrollBar().sizeHint().width())
+
+        self._update_rows()
+
+    def _rows(self):
+        if self.search_text.split():
+            return self.index.search(self.search_text)
+        if self.sections is None:
+            return self.routes
+
+        routes_per_section = {}
+        for route in self.routes:
+            routes_per_section.setdefault(route.module, []).append(route)
+
+        rows = []
+        for name, _ in self.sections:
+            expanded = name not in self.collapsed
+            rows.append(RouteSection(name, expanded))
+            if expanded:
+                rows += routes_per_section.get(name, [])
+        return rows
+
+    def _update_rows(self):
+        scroll = self.verticalScrollBar().value()
+        self.route_model.set_rows(self._rows())
+
+        if self.selected_route is not None:
+            for row, item in enumerate(self.route_model.rows):
+                if isinstance(item, Route) and item.key == self.selected_route.key:
+                    self.selectionModel().setCurrentIndex(
+                        self.route_model.index(row), QItemSelectionModel.ClearAndSelect
+                    )
+                    break
+        self.verticalScrollBar().setValue(scroll)
 
-        layout = QVBoxLayout()
-        for route in routes:
-            button = self._create_route_widget(route)
-            self.buttons.append(button)
-            self.route_per_button[route] = button
-            layout.addWidget(button)
+    def keyPressEvent(self, event):
+        if event.key() in (Qt.Key_Return, Qt.Key_Enter):
+            self._activate(self.currentIndex())
+            return
+        super().keyPressEvent(event)
 
-        layout.addStretch(1)
+    def _activate(self, index):
+        row = index.data(ROUTE_ROLE)
+        if isinstance(row, RouteSection):
+            self.toggle_section(row.name)
+        elif row is not None and row is not self.selected_route:
+            self.select_route(row)
 
-        self.setLayout(layout)
+    def select_route(self, route):
+        self.selected_route = route
+        for row, item in enumerate(self.route_model.rows):
+            if item is route:
+                self.setCurrentIndex(self.route_model.index(row))
+                break
+        self.new_route_signal.emit(route)
+
+    def first_route(self):
+        for row in self.route_model.rows:
+            if isinstance(row, Route):
+                return row
+        return None
+
+    def unloaded_sections(self):
+        return [name for name, loaded in self.sections or [] if not loaded]
+
+    def toggle_section(self, name):
+        if name in self.unloaded_sections():
+            self.load_sections_signal.emit([name])
+            return
+
+        if name in self.collapsed:
+            self.collapsed.remove(name)
+        else:
+            self.collapsed.add(name)
+        self._update_rows()
+
+    def filter(self, text):
+        self.search_text = text
+        self._update_rows()
+
+    def apply_diff(self, routes, diff, sections=None):
+        # the swapped route objects are picked up by the new index
+        if self.selected_route is not None:
+            selected = self.selected_route
+            self.selected_route = None
+            for old, new in diff.changed + diff.unchanged:
+                if old is selected:
+                    self.selected_route = new
+        self._set_routes(routes, sections)
 
 
 class SearchRouteList(QWidget):
-    def __init__(self, routes):
+    def __init__(self, routes, sections=None):
         super().__init__()
 
-        self.route_list = RouteList(routes)
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidget(self.route_list)
-        self.scroll_area.setWidgetResizable(False)
-        self.scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        self.route_list = RouteList(routes, sections)
 
         self.search_line = QLineEdit()
-        self.search_line.setPlaceholderText('Search')
+        self.search_line.setPlaceholderText('Search (@group to filter)')
         self.search_line.textChanged.connect(self.search)
         self.search_line.returnPressed.connect(self.select_first_visible)
 
         layout = QVBoxLayout()
         layout.addWidget(self.search_line)
-        layout.addWidget(self.scroll_area)
+        layout.addWidget(self.route_list)
 
         self.setLayout(layout)
 
+    def apply_diff(self, routes, diff, sections=None):
+        self.route_list.apply_diff(routes, diff, sections)
+
     def search(self):
-        text_elements = self.search_line.text().lower().split(' ')
+        text = self.search_line.text()
+
+        unloaded = self.route_list.unloaded_sections()
+        if text.split() and unloaded:
+            # searching needs every module, the list is filtered again once they are loaded
+            self.route_list.load_sections_signal.emit(unloaded)
 
-        for button in self.route_list.buttons:
-            visible = all(text_element in button.text().lower() for text_element in text_elements)
-            button.setVisible(visible)
+        self.route_list.filter(text)
 
     def select_first_visible(self):
-        for button in self.route_list.buttons:
-            if button.isVisible():
-                button.animateClick()
-                return
+        route = self.route_list.first_route()
+        if route is not None:
+            self.route_list.select_route(route)
 
-    def select_route_with_name(self, name):
-        for route, button in self.route_list.route_per_button.items():
-            if route.name == name:
-                button.animateClick()
+    def select_route_with_key(self, key):
+        for route in self.route_list.routes:
+            if route.key == key:
+                self.route_list.select_route(route)
                 return
 
     def set_search(self, text):
@@ -139,13 +333,6 @@ class SearchRouteList(QWidget):
         self.search_line.selectAll()
 
 
-TEMPLATE = '''{method} {url}
-{headers}
-
-{body}
-'''
-
-
 class TextParameterWidget(QLineEdit):
     updated_signal = Signal(object)
 
@@ -232,6 +419,7 @@ class ChoiceParameterWidget(QComboBox):
 
 
 class ParameterWidget(QWidget):
+    @traced('ParameterWidget')
     def __init__(self, route=None):
         super().__init__()
 
@@ -242,6 +430,24 @@ class ParameterWidget(QWidget):
         self.preview_text_edit.setFont(TEXT_FONT)
         self.preview_text_edit.setReadOnly(True)
 
+        self.preview_text = ''
+        self.preview_generation = 0
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DELAY)
+        self.preview_timer.timeout.connect(self._build_preview)
+
+        self.expand_preview_button = QPushButton('Show full preview')
+        self.expand_preview_button.clicked.connect(self.expand_preview)
+        self.expand_preview_button.hide()
+
+        self.inputs = {}
+        self.shown_values = {}
+        self._index_parameters()
+
+        self.context_label = QLabel()
+        self.context_label.setFont(FONT)
+
         if route is not None:
             if route.group is not None:
                 for parameter in route.group.parameters:
@@ -251,6 +457,16 @@ class ParameterWidget(QWidget):
                     )
                     layout.addLayout(param_layout)
 
+                if route.group.cache:
+                    refresh_context_button = QPushButton('refresh')
+                    refresh_context_button.setToolTip('Run the group function again')
+                    refresh_context_button.clicked.connect(self.refresh_context)
+                    context_layout = QHBoxLayout()
+                    context_layout.addWidget(self.context_label)
+                    context_layout.addStretch(1)
+                    context_layout.addWidget(refresh_context_button)
+                    layout.addLayout(context_layout)
+
                 line = QFrame()
                 line.setFrameShape(QFrame.HLine)
                 line.setFrameShadow(QFrame.Sunken)
@@ -264,48 +480,116 @@ class ParameterWidget(QWidget):
                 layout.addLayout(param_layout)
 
         self.highlighter = TextHighlighter(self.preview_text_edit.document())
-        self._update_preview()
+        self.preview_timer.stop()
+        self._build_preview()
         layout.addWidget(self.preview_text_edit)
+        layout.addWidget(self.expand_preview_button)
 
         self.setLayout(layout)
 
+    def _index_parameters(self):
+        self.parameters = {}
+        if self.route is None:
+            return
+        if self.route.group is not None:
+            for parameter in self.route.group.parameters:
+                self.parameters[(self.route.group.storage_prefix, parameter.name)] = parameter
+        for parameter in self.route.parameters:
+            self.parameters[(self.route.storage_prefix, parameter.name)] = parameter
+
+    def set_route(self, route):
+        # only called on reload for a route with the same parameters,
+        # the widgets and their values stay as they are
+        self.route = route
+        self._index_parameters()
+        self._update_preview()
+
     def _update_preview(self):
+        self.preview_timer.start()
+
+    @traced('update_preview')
+    def _build_preview(self):
         if self.route is None:
             return
 
+        self.preview_generation += 1
         try:
             group_values, route_values = get_parameter_values_for_route(self.route)
-            request = self.route.get_request(group_values, route_values)
+        except CaribouException as e:
+            self._set_preview(self.preview_generation, str(e))
+            return
 
-            headers = []
-            if request.headers is not None:
-                headers = ['%s: %s' % (name, value) for name, value in request.headers.items()]
-
-            body = ''
-            if request.json is not None:
-                body = json.dumps(request.json, indent=2)
-            # elif request.body is not None:
-            #     body = request.body
-
-            req = PreparedRequest()
-            req.prepare_url(request.url, request.params)
-            url = req.url
-
-            text = TEMPLATE.format(
-                method=request.method,
-                url=url,
-                headers='\n'.join(headers),
-                body=body,
-            )
+        key = preview_key(self.route, group_values, route_values)
+        text = cached_preview(key)
+        if text is not None:
+            self._set_preview(self.preview_generation, text)
+            return
 
-            self.preview_text_edit.setPlainText(text)
-        except CaribouException as e:
-            self.preview_text_edit.setPlainText(str(e))
-        except Exception:
-            self.preview_text_edit.setPlainText(traceback.format_exc())
+        worker = PreviewWorker(self.route, group_values, route_values, self.preview_generation)
+        worker.signals.result.connect(self._set_preview)
+        QThreadPool.globalInstance().start(worker)
+
+    def _set_preview(self, generation, text):
+        if generation != self.preview_generation:
+            return
+
+        self.update_context_status()
+
+        self.preview_text = text
+        shown_text, truncated = truncate_preview(text)
+        self.preview_text_edit.setPlainText(shown_text)
+        self.expand_preview_button.setVisible(truncated)
+
+    def expand_preview(self):
+        self.preview_text_edit.setPlainText(self.preview_text)
+        self.expand_preview_button.hide()
+
+    def refresh_values(self):
+        # a cached pane can miss edits made to a shared (id) parameter from another route
+        for (prefix, name), widget in self.inputs.items():
+            value = load_parameter(prefix, self.parameters[(prefix, name)])
+            if value != self.shown_values.get((prefix, name)):
+                widget.set_value(value)
+        self.update_context_status()
+
+    def update_context_status(self):
+        group = self.route.group if self.route is not None else None
+        if group is None or not group.cache:
+            return
+
+        try:
+            group_values, _ = get_parameter_values_for_route(self.route)
+        except CaribouException:
+            entry = None
+        else:
+            entry = group.cached_context(group_values)
+
+        if entry is None:
+            self.context_label.setText('Context: not built')
+            self.context_label.setToolTip('')
+            return
+
+        if entry.last_hit:
+            self.context_label.setText('Context: cached (hit)')
+        else:
+            self.context_label.setText('Context: built in %s ms (miss)' % int(entry.build_time * 1000))
+        tooltip = 'Built %s s ago, reused %s times' % (int(entry.age), entry.hits)
+        if group.ttl is not None:
+            tooltip += '\nExpires after %s s' % group.ttl
+        self.context_label.setToolTip(tooltip)
+
+    def refresh_context(self):
+        self.route.group.invalidate()
+        clear_previews()
+        self.preview_timer.stop()
+        self._build_preview()
+
+    def memory_size(self):
+        return 2 * len(self.preview_text)
 
     def _create_parameter_layout(self, prefix, parameter):
         def on_updated_param(value):
+            self.shown_values[(prefix, parameter.name)] = value
             save_parameter(prefix, parameter, value)
             self._update_preview()
 
@@ -324,103 +608,462 @@ class ParameterWidget(QWidget):
             raise Exception('Widget not supported')
 
         widget.updated_signal.connect(on_updated_param)
+        self.inputs[(prefix, parameter.name)] = widget
 
         saved_value = load_parameter(prefix, parameter)
         widget.set_value(saved_value)
+        # compared with the stored value by refresh_values
+        self.shown_values[(prefix, parameter.name)] = saved_value
 
         layout.addWidget(widget)
 
-        if parameter.generator is not None:
+        if parameter.is_generated:
+            generator_button = QPushButton('new')
+
+            def set_generated_value(value):
+                generator_button.setEnabled(True)
+                widget.set_value(value)
+
+            def show_generator_error(text):
+                generator_button.setEnabled(True)
+                self.preview_text_edit.setPlainText(text)
+
             def generate_new_value():
-                new_value = parameter.generator()
-                widget.set_value(new_value)
+                # generators can be slow (network), they run on a worker
+                generator_button.setEnabled(False)
+                worker = GeneratorWorker(self.parameters[(prefix, parameter.name)], prefix)
+                worker.signals.result.connect(set_generated_value)
+                worker.signals.error.connect(show_generator_error)
+                QThreadPool.globalInstance().start(worker)
 
-            generator_button = QPushButton('new')
             generator_button.clicked.connect(generate_new_value)
             layout.addWidget(generator_button)
+            prefetch([parameter], prefix)
         return layout
 
 
+class GeneratorSignals(QObject):
+    result = Signal(object)
+    error = Signal(str)
+
+
+class GeneratorWorker(QRunnable):
+    def __init__(self, parameter, prefix):
+        super().__init__()
+        self.parameter = parameter
+        self.prefix = prefix
+        self.signals = GeneratorSignals()
+
+    @Slot()
+    def run(self):
+        try:
+            with span('generate_value', parameter=self.parameter.name):
+                value = generate_value(self.parameter, self.prefix)
+        except CaribouException as e:
+            self.signals.error.emit(str(e))
+        except Exception:
+            self.signals.error.emit(traceback.format_exc())
+        else:
+            self.signals.result.emit(value)
+
+
+class PreviewSignals(QObject):
+    result = Signal(int, str)
+
+
+class PreviewWorker(QRunnable):
+    def __init__(self, route, group_values, route_values, generation):
+        super().__init__()
+        self.route = route
+        self.group_values = group_values
+        self.route_values = route_values
+        self.generation = generation
+        self.signals = PreviewSignals()
+
+    @Slot()
+    def run(self):
+        try:
+            with span('build_preview'):
+                text = build_preview(self.route, self.group_values, self.route_values)
+        except CaribouException as e:
+            text = str(e)
+        except Exception:
+            text = traceback.format_exc()
+        self.signals.result.emit(self.generation, text)
+
+
 class WorkerSignals(QObject):
     result = Signal(str, int, float)
+    connection = Signal(bool)
+    chunk = Signal(str)
+    progress = Signal(object, float)
+    upload_progress = Signal(object, object)
+    data = Signal(object)
+    spans = Signal(object)
+    timing = Signal(object)
+    cache = Signal(str)
+
+
+def emit_request_result(signals, result, spans=None):
+    if result.cache is not None:
+        signals.cache.emit(result.cache)
+    if result.timing is not None:
+        signals.timing.emit(result.timing)
+    if result.is_json:
+        signals.data.emit(result.data)
+        if spans is not None:
+            signals.spans.emit(spans)
+    signals.result.emit(result.text, result.status_code, result.elapsed)
+
+
+def result_spans(result):
+    if result.is_json and len(result.text) <= highlight.max_highlight_size():
+        return highlight.document_spans(result.text)
+    return None
+
+
+def _record_queued(queued):
+    # time spent waiting for a free thread or event loop
+    tracer = get_tracer()
+    if tracer.enabled and queued is not None:
+        tracer.record('worker.queued', queued, time.perf_counter())
 
 
 class RequestWorker(QRunnable):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, request):
         super().__init__()
-        self.args = args
-        self.kwargs = kwargs
+        self.request = request
         self.signals = WorkerSignals()
+        self.cancel_token = CancelToken()
+        self.queued = None
+
+    def start(self, thread_pool):
+        self.queued = time.perf_counter()
+        thread_pool.start(self)
+
+    def cancel(self):
+        self.cancel_token.cancel()
 
     @Slot()
     def run(self):
+        _record_queued(self.queued)
+        with span('worker.run', url=self.request.url):
+            self._run()
+
+    def _run(self):
         try:
-            start = time.time()
-            r = requests.request(
-                *self.args,
-                **self.kwargs
+            result = execute_request(
+                self.request,
+                on_connection=self.signals.connection.emit,
+                on_chunk=self.signals.chunk.emit,
+                on_progress=self.signals.progress.emit,
+                cancel_token=self.cancel_token,
+                on_upload_progress=self.signals.upload_progress.emit,
             )
-            end = time.time()
-            elapsed = end - start
+            emit_request_result(self.signals, result, result_spans(result))
+        except RequestCancelled:
+            pass
+        except Exception:
+            self.signals.result.emit(traceback.format_exc(), 0, -1)
 
-            try:
-                json_response = r.json()
-                text = json.dumps(json_response, indent=2)
-            except ValueError:
-                text = r.text
-            self.signals.result.emit(text, r.status_code, elapsed)
+
+class AsyncRequestWorker:
+    # same signals as RequestWorker, but runs on the asyncio engine's event loop
+    def __init__(self, request):
+        self.request = request
+        self.signals = WorkerSignals()
+        self.future = None
+        self.queued = None
+
+    def start(self, thread_pool=None):
+        self.queued = time.perf_counter()
+        self.future = get_engine().submit(self.run())
+        return self.future
+
+    def cancel(self):
+        if self.future is not None:
+            self.future.cancel()
+
+    async def run(self):
+        _record_queued(self.queued)
+        with span('worker.run', url=self.request.url):
+            await self._run()
+
+    async def _run(self):
+        try:
+            result = await get_engine().execute(
+                self.request,
+                on_connection=self.signals.connection.emit,
+                on_chunk=self.signals.chunk.emit,
+                on_progress=self.signals.progress.emit,
+                on_upload_progress=self.signals.upload_progress.emit,
+            )
+            spans = await asyncio.get_running_loop().run_in_executor(None, result_spans, result)
+            emit_request_result(self.signals, result, spans)
         except Exception:
             self.signals.result.emit(traceback.format_exc(), 0, -1)
 
 
-class TextHighlighter(QSyntaxHighlighter):
-    def highlightBlock(self, text):
-        string_format = QTextCharFormat()
-        string_format.setForeground(QColor('#E6DB74'))
+def create_request_worker(request):
+    # the HTTP cache is only used by the threaded transport
+    if use_asyncio() and not cache_enabled(request):
+        return AsyncRequestWorker(request)
+    return RequestWorker(request)
 
-        number_format = QTextCharFormat()
-        number_format.setForeground(QColor('#AE81FF'))
 
-        get_format = QTextCharFormat()
-        get_format.setForeground(QColor('#25A86B'))
+class SearchSignals(QObject):
+    batch = Signal(int, object, object, bool, bool)
 
-        post_format = QTextCharFormat()
-        post_format.setForeground(QColor('#FDA60A'))
 
-        if text.startswith('GET '):
-            self.setFormat(0, len('GET'), get_format)
-        if text.startswith('POST '):
-            self.setFormat(0, len('POST'), post_format)
+class SearchWorker(QRunnable):
+    def __init__(self, search, generation):
+        super().__init__()
+        self.search = search
+        self.generation = generation
+        self.signals = SearchSignals()
+
+    @Slot()
+    def run(self):
+        def on_batch(starts, ends, done, capped):
+            self.signals.batch.emit(self.generation, starts, ends, done, capped)
+
+        with span('search_result'):
+            self.search.run(on_batch)
 
-        if len(text) == 0 or text[0] not in '{}[] ':
-            return
 
-        current = 0
-        for tokentype, value in JsonLexer().get_tokens(text):
-            if tokentype in Name or tokentype in String:
-                self.setFormat(current, len(value), string_format)
-            elif tokentype in Number or tokentype in Keyword:
-                self.setFormat(current, len(value), number_format)
-            current += len(value)
+def _char_format(color):
+    char_format = QTextCharFormat()
+    char_format.setForeground(QColor(color))
+    return char_format
+
+
+SEARCH_FORMAT = QTextCharFormat()
+SEARCH_FORMAT.setBackground(QColor('#668B8B'))
+
+
+SPAN_FORMATS = {
+    highlight.STRING: _char_format('#E6DB74'),
+    highlight.NUMBER: _char_format('#AE81FF'),
+}
+GET_FORMAT = _char_format('#25A86B')
+POST_FORMAT = _char_format('#FDA60A')
 
 
 class JSONHighlighter(QSyntaxHighlighter):
+    CACHE_SIZE = 4096
+
+    def __init__(self, document):
+        super().__init__(document)
+        self.spans = None
+        self.mode = 'full'
+        self.visible_range = (0, -1)
+        self.highlighted = set()
+        self.cache = {}
+
+    def configure(self, size, spans=None):
+        self.spans = spans
+        self.highlighted = set()
+        if size > highlight.max_highlight_size():
+            self.mode = load_setting('highlight_mode') or 'viewport'
+        else:
+            self.mode = 'full'
+
+    def set_visible_range(self, first, last):
+        self.visible_range = (first, last)
+        if self.mode != 'viewport':
+            return
+
+        document = self.document()
+        for number in range(first, last + 1):
+            if number not in self.highlighted:
+                block = document.findBlockByNumber(number)
+                if block.isValid():
+                    self.rehighlightBlock(block)
+
+    def _cached_spans(self, text):
+        spans = self.cache.get(text)
+        if spans is None:
+            if len(self.cache) >= self.CACHE_SIZE:
+                self.cache.clear()
+            spans = highlight.line_spans(text)
+            self.cache[text] = spans
+        return spans
+
+    def _is_json_line(self, text):
+        return True
+
     def highlightBlock(self, text):
-        string_format = QTextCharFormat()
-        string_format.setForeground(QColor('#E6DB74'))
+        if self.mode == 'off' or len(text) == 0:
+            return
 
-        number_format = QTextCharFormat()
-        number_format.setForeground(QColor('#AE81FF'))
-        if len(text) == 0:
+        number = self.currentBlock().blockNumber()
+        if self.mode == 'viewport':
+            first, last = self.visible_range
+            if not first <= number <= last:
+                self.highlighted.discard(number)
+                return
+            self.highlighted.add(number)
+
+        self.highlight_line(text)
+
+        if self.spans is not None and number < len(self.spans):
+            spans = self.spans[number]
+        elif self._is_json_line(text):
+            spans = self._cached_spans(text)
+        else:
             return
 
-        current = 0
-        for tokentype, value in JsonLexer().get_tokens(text):
-            if tokentype in Name or tokentype in String:
-                self.setFormat(current, len(value), string_format)
-            elif tokentype in Number or tokentype in Keyword:
-                self.setFormat(current, len(value), number_format)
-            current += len(value)
+        for start, length, kind in spans:
+            self.setFormat(start, length, SPAN_FORMATS[kind])
+
+    def highlight_line(self, text):
+        pass
+
+
+class TextHighlighter(JSONHighlighter):
+    def _is_json_line(self, text):
+        return text[0] in '{}[] '
+
+    def highlight_line(self, text):
+        if text.startswith('GET '):
+            self.setFormat(0, len('GET'), GET_FORMAT)
+        if text.startswith('POST '):
+            self.setFormat(0, len('POST'), POST_FORMAT)
+
+
+class JsonNode:
+    def __init__(self, parent, row, key, value):
+        self.parent = parent
+        self.row = row
+        self.key = key
+        self.value = value
+        self.fetched = 0
+        self.children = {}
+        self._keys = None
+        self._size = None
+
+    @property
+    def is_container(self):
+        return isinstance(self.value, (dict, list))
+
+    def child_count(self):
+        return len(self.value) if self.is_container else 0
+
+    def child(self, row):
+        node = self.children.get(row)
+        if node is None:
+            if isinstance(self.value, dict):
+                if self._keys is None:
+                    self._keys = list(self.value.keys())
+                key = self._keys[row]
+            else:
+                key = row
+            node = JsonNode(self, row, key, self.value[key])
+            self.children[row] = node
+        return node
+
+    def size(self):
+        if self._size is None:
+            self._size = len(json.dumps(self.value))
+        return self._size
+
+
+class JsonTreeModel(QAbstractItemModel):
+    HEADERS = ('Key', 'Value', 'Children', 'Size')
+    FETCH_SIZE = 500
+    PREVIEW_SIZE = 200
+
+    STRING_COLOR = QColor('#E6DB74')
+    NUMBER_COLOR = QColor('#AE81FF')
+
+    def __init__(self, data):
+        super().__init__()
+        if not isinstance(data, (dict, list)):
+            data = [data]
+        self.root = JsonNode(None, 0, None, data)
+
+    def _node(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self.root
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        return self.createIndex(row, column, self._node(parent).child(row))
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return self._node(parent).fetched
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return False
+        return self._node(parent).child_count() > 0
+
+    def canFetchMore(self, parent):
+        node = self._node(parent)
+        return node.fetched < node.child_count()
+
+    def fetchMore(self, parent):
+        node = self._node(parent)
+        count = min(self.FETCH_SIZE, node.child_count() - node.fetched)
+        if count <= 0:
+            return
+        self.beginInsertRows(parent, node.fetched, node.fetched + count - 1)
+        node.fetched += count
+        self.endInsertRows()
+
+    def _preview(self, value):
+        if isinstance(value, dict):
+            return '{...}' if value else '{}'
+        if isinstance(value, list):
+            return '[...]' if value else '[]'
+        text = json.dumps(value)
+        if len(text) > self.PREVIEW_SIZE:
+            text = text[:self.PREVIEW_SIZE] + '...'
+        return text
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return '[%s]' % node.key if isinstance(node.key, int) else str(node.key)
+            elif column == 1:
+                return self._preview(node.value)
+            elif column == 2:
+                return str(node.child_count()) if node.is_container else ''
+            elif column == 3:
+                return format_size(node.size())
+        elif role == Qt.ForegroundRole and column == 1:
+            if isinstance(node.value, str):
+                return self.STRING_COLOR
+            elif isinstance(node.value, (bool, int, float)) or node.value is None:
+                return self.NUMBER_COLOR
+        elif role == Qt.TextAlignmentRole and column in (2, 3):
+            return Qt.AlignRight | Qt.AlignVCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
 
 
 class ResultTextEdit(QPlainTextEdit):
@@ -441,25 +1084,115 @@ class ResultTextEdit(QPlainTextEdit):
             return
         super().keyPressEvent(e)
 
+    def visible_block_range(self):
+        block = self.firstVisibleBlock()
+        first = last = block.blockNumber()
+        offset = self.contentOffset()
+        height = self.viewport().height()
+        while block.isValid() and self.blockBoundingGeometry(block).translated(offset).top() <= height:
+            last = block.blockNumber()
+            block = block.next()
+        return first, last
+
+
+PHASE_COLORS = {
+    'dns': '#6A9FB5',
+    'connect': '#F4BF75',
+    'tls': '#AA759F',
+    'send': '#90A959',
+    'wait': '#1FDA9A',
+    'download': '#75B5AA',
+    'decode': '#DB3340',
+}
+
+
+class TimingBar(QWidget):
+    # waterfall of the request phases, details in the tooltip
+    def __init__(self):
+        super().__init__()
+        self.timing = None
+        self.setFixedSize(120, 12)
+
+    def set_timing(self, timing, previous=None):
+        self.timing = timing
+        if timing is None:
+            self.hide()
+            return
+        self.setToolTip('<pre>%s</pre>' % html.escape(timing.format(previous)))
+        self.show()
+        self.update()
+
+    def paintEvent(self, event):
+        if self.timing is None or self.timing.total <= 0:
+            return
+        painter = QPainter(self)
+        width = self.width()
+        for phase, start, duration in self.timing.phases():
+            if duration <= 0:
+                continue
+            x = int(start / self.timing.total * width)
+            # keep every phase that happened visible
+            w = max(1, int(duration / self.timing.total * width))
+            painter.fillRect(x, 0, w, self.height(), QColor(PHASE_COLORS[phase]))
+        painter.end()
+
 
 class ResultWidget(QWidget):
+    result_signal = Signal()
+
+    @traced('ResultWidget')
     def __init__(self, route=None):
         super().__init__()
 
         layout = QVBoxLayout()
         self.route = route
+        self.route_url = None
+        self.connection_reused = True
+        self.cache_status = None
+        # responses from a superseded or cancelled send are dropped
+        self.request_id = 0
+        self.active_worker = None
 
         self.thread_pool = QThreadPool()
 
         layout_send = QHBoxLayout()
         self.send_button = QPushButton('Send')
-        self.send_button.clicked.connect(self.make_request)
+        self.send_button.clicked.connect(lambda: self.make_request())
+
+        self.cancel_button = QPushButton('Cancel')
+        self.cancel_button.clicked.connect(self.cancel_request)
+        self.cancel_button.hide()
 
         self.search_line = QLineEdit()
         self.search_line.setPlaceholderText('Search')
-        self.search_line.textChanged.connect(self.search_result_reset)
+        self.search_line.textChanged.connect(lambda: self.search_timer.start())
         self.search_line.returnPressed.connect(self.search_result)
 
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.start_search)
+
+        self.regex_button = QPushButton('.*')
+        self.regex_button.setToolTip('Regular expression')
+        self.regex_button.setCheckable(True)
+        self.regex_button.setChecked(bool(load_setting('search_regex')))
+        self.regex_button.toggled.connect(lambda checked: self._set_search_option('search_regex', checked))
+
+        self.case_button = QPushButton('Aa')
+        self.case_button.setToolTip('Match case')
+        self.case_button.setCheckable(True)
+        self.case_button.setChecked(bool(load_setting('search_case_sensitive')))
+        self.case_button.toggled.connect(lambda checked: self._set_search_option('search_case_sensitive', checked))
+
+        # matches are found on a worker, a new search supersedes the running one
+        self.search_task = None
+        self.search_generation = 0
+        self.search_matches = SearchMatches()
+        self.search_index = None
+        self.search_select_first = False
+        self.search_highlight_key = None
+
         self.response_status_label = QLabel()
         self.response_status_label.setFont(FONT_ROUTE)
         self.response_status_label.hide()
@@ -468,19 +1201,55 @@ class ResultWidget(QWidget):
         self.elapsed_time_label.setFont(FONT_ROUTE)
         self.elapsed_time_label.hide()
 
+        self.timing_bar = TimingBar()
+        self.timing_bar.hide()
+        self.result_timing = None
+
+        self.progress_label = QLabel()
+        self.progress_label.setFont(FONT_ROUTE)
+        self.progress_label.hide()
+
         self.search_summary_label = QLabel()
         self.search_summary_label.setFont(FONT_ROUTE)
         self.search_summary_label.hide()
 
+        self.history_entries = []
+        self.history_index = 0
+
+        self.older_button = QPushButton('<')
+        self.older_button.setToolTip('Older response')
+        self.older_button.clicked.connect(lambda: self.show_history_entry(self.history_index + 1))
+
+        self.newer_button = QPushButton('>')
+        self.newer_button.setToolTip('Newer response')
+        self.newer_button.clicked.connect(lambda: self.show_history_entry(self.history_index - 1))
+
+        self.history_label = QLabel()
+        self.history_label.setFont(FONT_ROUTE)
+
         if route is not None:
             layout_send.addWidget(self.send_button)
+            layout_send.addWidget(self.cancel_button)
+            layout_send.addWidget(self.older_button)
+            layout_send.addWidget(self.history_label)
+            layout_send.addWidget(self.newer_button)
 
         layout_send.addWidget(self.response_status_label)
         layout_send.addWidget(self.elapsed_time_label)
+        layout_send.addWidget(self.timing_bar)
+        layout_send.addWidget(self.progress_label)
         layout_send.addStretch(1)
 
+        self.tree_button = QPushButton('Tree')
+        self.tree_button.setCheckable(True)
+        self.tree_button.setChecked(load_setting('result_view') == 'tree')
+        self.tree_button.toggled.connect(self.toggle_tree_view)
+
         layout_send.addWidget(self.search_summary_label)
         layout_send.addWidget(self.search_line)
+        layout_send.addWidget(self.regex_button)
+        layout_send.addWidget(self.case_button)
+        layout_send.addWidget(self.tree_button)
 
         layout.addLayout(layout_send)
 
@@ -491,108 +1260,396 @@ class ResultWidget(QWidget):
 
         self.result_text_edit.search.connect(self.focus)
 
-        self.shortcut = QShortcut(QKeySequence("Ctrl+Return"), self, self.make_request)
-
         self.result_text_edit.setUndoRedoEnabled(False)
 
         self.highlighter = TextHighlighter(self.result_text_edit.document())
-
-        layout.addWidget(self.result_text_edit)
+        self.result_spans = None
+        self.result_text_edit.updateRequest.connect(self._update_visible_blocks)
+
+        self.pending_text = deque()
+        self.received_length = 0
+        self.append_timer = QTimer(self)
+        self.append_timer.setInterval(0)
+        self.append_timer.timeout.connect(self._append_pending)
+
+        self.result_text = None
+        self.result_data = None
+        self.result_model = None
+        self.result_tree_view = QTreeView()
+        self.result_tree_view.setFont(TEXT_FONT)
+        self.result_tree_view.setUniformRowHeights(True)
+        self.result_tree_view.setAlternatingRowColors(True)
+
+        self.result_stack = QStackedWidget()
+        self.result_stack.addWidget(self.result_text_edit)
+        self.result_stack.addWidget(self.result_tree_view)
+        layout.addWidget(self.result_stack)
 
         if route is not None:
-            saved_result = load_request_result(route)
-            self.result_text_edit.setPlainText(saved_result)
+            self.history_entries = list_request_results(route)
+            self.show_history_entry(0)
+
+        self.toggle_tree_view(self.tree_button.isChecked())
 
         self.setLayout(layout)
 
-    def goto(self, to):
-        c = self.result_text_edit.textCursor()
-        c.movePosition(to, QTextCursor.MoveAnchor, 1)
-        self.result_text_edit.setTextCursor(c)
+    def _set_search_option(self, name, checked):
+        save_setting(name, checked)
+        self.start_search()
+
+    def _clear_search(self):
+        if self.search_task is not None:
+            self.search_task.cancelled = True
+            self.search_task = None
+        self.search_generation += 1
+        self.search_matches = SearchMatches()
+        self.search_index = None
+        self.search_highlight_key = None
+
+    def start_search(self, select_first=True):
+        self.search_timer.stop()
+        self._clear_search()
+
+        text = self.search_line.text()
+        if text == '':
+            self._highlight_search_matches()
+            self.search_summary_label.hide()
+            return
 
-    def search_result_reset(self):
-        self.goto(QTextCursor.Start)
+        try:
+            pattern = compile_pattern(text, self.regex_button.isChecked(), self.case_button.isChecked())
+        except re.error:
+            self._highlight_search_matches()
+            self.search_summary_label.setText('invalid')
+            self.search_summary_label.show()
+            return
 
-        string_format = QTextCharFormat()
-        string_format.setBackground(QColor('#668B8B'))
+        result_text = self.result_text if self.result_text is not None else self.result_text_edit.toPlainText()
+        self.search_task = TextSearch(result_text, pattern)
+        self.search_select_first = select_first
+        worker = SearchWorker(self.search_task, self.search_generation)
+        worker.signals.batch.connect(self._add_search_matches)
+        QThreadPool.globalInstance().start(worker)
+        self._update_search_summary()
+
+    def refresh_search(self):
+        # the result changed, find the matches again without moving the view
+        if self.search_line.text():
+            self.start_search(select_first=False)
+        else:
+            self._clear_search()
 
-        extras = []
-        self.search_positions = []
-        while True:
-            extra = QTextEdit.ExtraSelection()
-            found = self.result_text_edit.find(self.search_line.text())
+    def _add_search_matches(self, generation, starts, ends, done, capped):
+        if generation != self.search_generation:
+            return
 
-            if not found:
-                break
+        self.search_matches.extend(starts, ends)
+        self.search_matches.done = done
+        self.search_matches.capped = capped
+        if done:
+            self.search_task = None
 
-            extra.cursor = self.result_text_edit.textCursor()
-            extra.format = string_format
+        if self.search_select_first and self.search_index is None and len(self.search_matches):
+            self._select_match(0)
+        else:
+            self._highlight_search_matches()
+        self._update_search_summary()
+
+    def _update_search_summary(self):
+        current = self.search_index + 1 if self.search_index is not None else 0
+        text = '%s/%s' % (current, len(self.search_matches))
+        if self.search_matches.capped:
+            text += '+'
+        elif not self.search_matches.done:
+            text += '...'
+        self.search_summary_label.setText(text)
+        self.search_summary_label.show()
 
-            self.search_positions.append(extra.cursor.position())
-            extras.append(extra)
+    def _select_match(self, index):
+        start = self.search_matches.starts[index]
+        end = self.search_matches.ends[index]
+        if end >= self.result_text_edit.document().characterCount():
+            # not appended to the document yet
+            return
 
+        self.search_index = index
+        cursor = self.result_text_edit.textCursor()
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        self.result_text_edit.setTextCursor(cursor)
+        self._highlight_search_matches()
+        self._update_search_summary()
+
+    def _visible_range(self):
+        viewport = self.result_text_edit.viewport()
+        start = self.result_text_edit.cursorForPosition(QPoint(0, 0)).position()
+        end = self.result_text_edit.cursorForPosition(QPoint(viewport.width(), viewport.height())).position()
+        return start, end + 1
+
+    def _highlight_search_matches(self):
+        # only the matches in the viewport get an extra selection
+        if not len(self.search_matches):
+            if self.search_highlight_key != ():
+                self.search_highlight_key = ()
+                self.result_text_edit.setExtraSelections([])
+            return
+
+        start, end = self._visible_range()
+        key = (start, end, len(self.search_matches))
+        if key == self.search_highlight_key:
+            return
+        self.search_highlight_key = key
+
+        document = self.result_text_edit.document()
+        length = document.characterCount()
+        extras = []
+        for index in self.search_matches.in_range(start, end):
+            match_end = self.search_matches.ends[index]
+            if match_end >= length:
+                break
+            cursor = QTextCursor(document)
+            cursor.setPosition(self.search_matches.starts[index])
+            cursor.setPosition(match_end, QTextCursor.KeepAnchor)
+            extra = QTextEdit.ExtraSelection()
+            extra.cursor = cursor
+            extra.format = SEARCH_FORMAT
+            extras.append(extra)
         self.result_text_edit.setExtraSelections(extras)
-        self.goto(QTextCursor.Start)
-        self.search_result()
 
     def search_result(self):
         p = self.result_text_edit.palette()
         p.setColor(QPalette.Highlight, QColor("#ee799f"))
         self.result_text_edit.setPalette(p)
 
-        search_settings = QTextDocument.FindFlags()
+        if self.search_timer.isActive():
+            self.start_search()
+            return
+        if not len(self.search_matches):
+            return
 
-        mod = QApplication.keyboardModifiers()
-        if (mod & Qt.ShiftModifier) != 0:
-            search_settings |= QTextDocument.FindBackward
+        position = self.result_text_edit.textCursor().selectionStart()
+        if QApplication.keyboardModifiers() & Qt.ShiftModifier:
+            index = self.search_matches.previous_index(position)
+        else:
+            index = self.search_matches.next_index(position)
+        self._select_match(index)
 
-        r = self.result_text_edit.find(self.search_line.text(), search_settings)
-        if not r:
-            if (mod & Qt.ShiftModifier) != 0:
-                self.goto(QTextCursor.End)
-            else:
-                self.goto(QTextCursor.Start)
-            self.result_text_edit.find(self.search_line.text(), search_settings)
+    def focus(self):
+        self.search_line.setFocus()
+        self.search_line.selectAll()
 
-        if self.search_line.text() == '':
-            self.search_summary_label.hide()
+    def _reset_result(self, text=''):
+        self._clear_search()
+        self.pending_text.clear()
+        self.received_length = 0
+        self.append_timer.stop()
+        self.highlighter.configure(len(text))
+        self.result_text_edit.setPlainText(text)
+
+    def _update_visible_blocks(self, *args):
+        if self.highlighter.mode == 'viewport':
+            self.highlighter.set_visible_range(*self.result_text_edit.visible_block_range())
+        self._highlight_search_matches()
+
+    def _queue_text(self, text):
+        if text:
+            self.pending_text.append(text)
+            self.append_timer.start()
+
+    @traced('append_result')
+    def _append_pending(self):
+        budget = RESULT_APPEND_SIZE
+        pieces = []
+        while self.pending_text and budget > 0:
+            text = self.pending_text.popleft()
+            if len(text) > budget:
+                self.pending_text.appendleft(text[budget:])
+                text = text[:budget]
+            pieces.append(text)
+            budget -= len(text)
+
+        cursor = QTextCursor(self.result_text_edit.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(''.join(pieces))
+
+        if not self.pending_text:
+            self.append_timer.stop()
+
+    def append_result(self, text):
+        if self.received_length == 0:
+            self._reset_result()
+        self.received_length += len(text)
+        if self.highlighter.mode == 'full' and self.received_length > highlight.max_highlight_size():
+            self.highlighter.configure(self.received_length)
+        self._queue_text(text)
+
+    def set_spans(self, spans):
+        self.result_spans = spans
+
+    def _update_history_controls(self):
+        count = len(self.history_entries)
+        self.older_button.setEnabled(self.history_index < count - 1)
+        self.newer_button.setEnabled(self.history_index > 0)
+        self.history_label.setText('%s/%s' % (self.history_index + 1, count) if count else '')
+
+    def show_history_entry(self, index):
+        self._update_history_controls()
+        if not 0 <= index < len(self.history_entries):
             return
 
-        current_position = self.result_text_edit.textCursor().position()
-        try:
-            current_index = self.search_positions.index(current_position)
-        except ValueError:
-            current_index = -1
+        self.history_index = index
+        self._update_history_controls()
+
+        entry = self.history_entries[index]
+        text = load_request_result(self.route, entry)
+        self._show_status(entry.status_code, entry.elapsed)
+        self.timing_bar.set_timing(self._entry_timing(index), self._entry_timing(index + 1))
+        self.elapsed_time_label.setToolTip(
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.timestamp))
+        )
+
+        self.result_text = text
+        self.result_data = None
+        self._reset_result()
+        self.highlighter.configure(len(text or ''))
+        self._queue_text(text)
+        self.refresh_search()
+        if self.tree_button.isChecked():
+            self._update_tree_model()
+
+    def _entry_timing(self, index):
+        if not 0 <= index < len(self.history_entries):
+            return None
+        meta = load_request_meta(self.route, self.history_entries[index])
+        if not meta or 'timing' not in meta:
+            return None
+        return Timing.from_dict(meta['timing'])
+
+    def set_timing(self, timing):
+        self.result_timing = timing
+
+    def set_data(self, data):
+        self.result_data = data
+        if self.tree_button.isChecked():
+            self._update_tree_model()
+
+    def _update_tree_model(self):
+        if self.result_data is None and self.result_text:
+            try:
+                self.result_data = json.loads(self.result_text)
+            except ValueError:
+                pass
 
-        self.search_summary_label.show()
-        self.search_summary_label.setText('%s/%s' % (current_index + 1, len(self.search_positions)))
+        if self.result_data is None:
+            self.result_model = None
+        else:
+            self.result_model = JsonTreeModel(self.result_data)
+        self.result_tree_view.setModel(self.result_model)
+        self.result_tree_view.setColumnWidth(0, 200)
+
+    def toggle_tree_view(self, checked):
+        save_setting('result_view', 'tree' if checked else 'text')
+        if checked:
+            self._update_tree_model()
+            self.result_stack.setCurrentWidget(self.result_tree_view)
+        else:
+            self.result_stack.setCurrentWidget(self.result_text_edit)
+
+    def set_progress(self, size, elapsed_time):
+        text = format_size(size)
+        if elapsed_time > 0:
+            text += ' (%s/s)' % format_size(size / elapsed_time)
+        self.progress_label.setText(text)
+        self.progress_label.show()
+
+    def set_upload_progress(self, sent, total):
+        text = 'Uploading %s / %s' % (format_size(sent), format_size(total))
+        if total:
+            text += ' (%d%%)' % (100 * sent / total)
+        self.progress_label.setText(text)
+        self.progress_label.show()
 
-    def focus(self):
-        self.search_line.setFocus()
-        self.search_line.selectAll()
+    def set_route(self, route):
+        # a reloaded route keeps its pane and any request in flight
+        self.route = route
+
+    def memory_size(self):
+        return RESULT_MEMORY_FACTOR * len(self.result_text or '')
+
+    def _for_request(self, request_id, slot):
+        def handler(*args):
+            if request_id == self.request_id:
+                slot(*args)
+        return handler
 
-    def make_request(self):
+    def _stop_worker(self):
+        self.request_id += 1
+        if self.active_worker is not None:
+            self.active_worker.cancel()
+            self.active_worker = None
+        self.cancel_button.hide()
+
+    def cancel_request(self):
+        if self.active_worker is None:
+            return
+        self._stop_worker()
+        self.progress_label.hide()
+        self._reset_result('Cancelled')
+
+    def make_request(self, download=None):
+        # a new send supersedes the one in flight, free its thread right away
+        self._stop_worker()
+        request_id = self.request_id
         self.response_status_label.hide()
         self.elapsed_time_label.hide()
-        self.result_text_edit.setPlainText('Loading..')
+        self.timing_bar.set_timing(None)
+        self.progress_label.hide()
+        self.connection_reused = True
+        self.cache_status = None
+        self._reset_result('Loading..')
+        self.result_timing = None
+        self.result_text = None
+        self.result_data = None
+        self.result_spans = None
+        self._update_tree_model()
         try:
             group_values, route_values = get_parameter_values_for_route(self.route)
             request = self.route.get_request(group_values, route_values)
-            worker = RequestWorker(
-                request.method,
-                request.url,
-                params=request.params,
-                headers=request.headers,
-                json=request.json,
-            )
-            worker.signals.result.connect(self.set_result)
-            self.thread_pool.start(worker)
+            if download is not None:
+                request = request._replace(download=download)
+            self.route_url = request.url
+            worker = create_request_worker(request)
+            worker.signals.result.connect(self._for_request(request_id, self.set_result))
+            worker.signals.connection.connect(self._for_request(request_id, self.set_connection))
+            worker.signals.chunk.connect(self._for_request(request_id, self.append_result))
+            worker.signals.progress.connect(self._for_request(request_id, self.set_progress))
+            worker.signals.upload_progress.connect(self._for_request(request_id, self.set_upload_progress))
+            worker.signals.data.connect(self._for_request(request_id, self.set_data))
+            worker.signals.spans.connect(self._for_request(request_id, self.set_spans))
+            worker.signals.timing.connect(self._for_request(request_id, self.set_timing))
+            worker.signals.cache.connect(self._for_request(request_id, self.set_cache_status))
+            self.active_worker = worker
+            self.cancel_button.show()
+            worker.start(self.thread_pool)
         except CaribouException as e:
-            self.result_text_edit.setPlainText(str(e))
+            self._reset_result(str(e))
         except Exception:
-            self.result_text_edit.setPlainText(traceback.format_exc())
+            self._reset_result(traceback.format_exc())
+
+    def set_connection(self, reused):
+        self.connection_reused = reused
+        stats = get_transport().stats(self.route_url) if self.route_url else None
+        tooltip = 'Connection: %s' % ('reused' if reused else 'new')
+        if stats is not None:
+            tooltip += '\n%s: %s reused / %s new' % (
+                stats.host, stats.reused_connections, stats.new_connections
+            )
+        self.elapsed_time_label.setToolTip(tooltip)
 
-    def set_result(self, text, status_code, elapsed_time):
+    def set_cache_status(self, cache_status):
+        self.cache_status = cache_status
+
+    def _show_status(self, status_code, elapsed_time, reused=True, cache_status=None):
         if status_code == 0:
             self.response_status_label.hide()
             self.elapsed_time_label.hide()
@@ -608,34 +1665,360 @@ class ResultWidget(QWidget):
             self.response_status_label.setPalette(p)
             self.response_status_label.show()
 
-            self.elapsed_time_label.setText('%s ms' % int(elapsed_time * 1000))
+            elapsed_text = '%s ms' % int(elapsed_time * 1000)
+            if cache_status == HIT:
+                elapsed_text += ' (cached)'
+            elif cache_status == REVALIDATED:
+                elapsed_text += ' (revalidated)'
+            elif not reused:
+                elapsed_text += ' (new connection)'
+            self.elapsed_time_label.setText(elapsed_text)
             self.elapsed_time_label.show()
 
-        self.result_text_edit.setUpdatesEnabled(False)
-        self.result_text_edit.setPlainText(text)
-        self.result_text_edit.setUpdatesEnabled(True)
+    @traced('set_result')
+    def set_result(self, text, status_code, elapsed_time):
+        self.active_worker = None
+        self.cancel_button.hide()
+        self._show_status(status_code, elapsed_time, self.connection_reused, self.cache_status)
 
-        save_request_result(self.route, text)
+        if self.received_length and status_code != 0 and self.result_data is None:
+            # the body was already streamed in, only append what follows it
+            self._queue_text(text[self.received_length:])
+        else:
+            self._reset_result()
+            self.highlighter.configure(len(text), self.result_spans)
+            self._queue_text(text)
+
+        self.result_text = text
+        self.refresh_search()
+        if self.tree_button.isChecked() and self.result_model is None:
+            self._update_tree_model()
+
+        meta = None
+        if self.result_timing is not None:
+            meta = {'timing': self.result_timing.to_dict()}
+        save_request_result(self.route, text, status_code, elapsed_time, meta)
+        self.history_entries = list_request_results(self.route)
+        self.history_index = 0
+        self._update_history_controls()
+        # compared with the previous run
+        self.timing_bar.set_timing(self.result_timing, self._entry_timing(1))
         persist_storage()
+        get_transport().save_cookies()
+        self.result_signal.emit()
+
+
+class LoadTestDialog(QDialog):
+    def __init__(self, route, parent=None):
+        super().__init__(parent)
+        self.route = route
+        self.load_test = None
+        self.last_snapshot = None
+
+        self.setWindowTitle('Load test: %s' % route.raw_display_name)
+
+        self.concurrency_input = QSpinBox()
+        self.concurrency_input.setRange(1, 1000)
+        self.concurrency_input.setValue(10)
+
+        self.rate_input = QDoubleSpinBox()
+        self.rate_input.setRange(0, 100000)
+        self.rate_input.setSpecialValueText('unlimited')
+        self.rate_input.setSuffix(' req/s')
+
+        self.duration_input = QDoubleSpinBox()
+        self.duration_input.setRange(1, 24 * 3600)
+        self.duration_input.setValue(10)
+        self.duration_input.setSuffix(' s')
+
+        self.engine_input = QComboBox()
+        self.engine_input.addItems(['threads', 'asyncio'])
+        self.engine_input.setCurrentText('asyncio' if use_asyncio() else 'threads')
+
+        self.start_button = QPushButton('Start')
+        self.start_button.clicked.connect(self.toggle)
+
+        self.report_text_edit = QPlainTextEdit()
+        self.report_text_edit.setReadOnly(True)
+        self.report_text_edit.setFont(TEXT_FONT)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(500)
+        self.timer.timeout.connect(self.update_report)
+
+        form = QFormLayout()
+        form.addRow('Workers', self.concurrency_input)
+        form.addRow('Arrival rate', self.rate_input)
+        form.addRow('Duration', self.duration_input)
+        form.addRow('Engine', self.engine_input)
+
+        layout = QVBoxLayout()
+        layout.addLayout(form)
+        layout.addWidget(self.start_button)
+        layout.addWidget(self.report_text_edit)
+        self.setLayout(layout)
+        self.resize(500, 450)
+
+    def toggle(self):
+        if self.load_test is not None and self.load_test.is_running():
+            self.load_test.stop()
+            return
+
+        try:
+            group_values, route_values = get_parameter_values_for_route(self.route)
+            self.load_test = LoadTest(
+                self.route, group_values, route_values,
+                concurrency=self.concurrency_input.value(),
+                rate=self.rate_input.value() or None,
+                duration=self.duration_input.value(),
+                engine=self.engine_input.currentText(),
+            )
+        except CaribouException as e:
+            self.report_text_edit.setPlainText(str(e))
+            return
+        except Exception:
+            self.report_text_edit.setPlainText(traceback.format_exc())
+            return
+
+        self.last_snapshot = None
+        self.load_test.start()
+        self.start_button.setText('Stop')
+        self.timer.start()
+
+    def update_report(self):
+        snapshot = self.load_test.snapshot()
+
+        current = snapshot.throughput
+        if self.last_snapshot is not None and snapshot.elapsed > self.last_snapshot.elapsed:
+            current = (snapshot.completed - self.last_snapshot.completed) / (snapshot.elapsed - self.last_snapshot.elapsed)
+        self.last_snapshot = snapshot
+
+        error_rate = snapshot.errors / snapshot.completed * 100 if snapshot.completed else 0
+        lines = [
+            'Elapsed     %.1f s' % snapshot.elapsed,
+            'Requests    %s (%s in flight)' % (snapshot.completed, snapshot.in_flight),
+            'Throughput  %.1f req/s (current %.1f req/s)' % (snapshot.throughput, current),
+            'Errors      %s (%.1f%%)' % (snapshot.errors, error_rate),
+            '',
+            'Status',
+        ]
+        for status, count in sorted(snapshot.status_counts.items(), key=lambda item: str(item[0])):
+            lines.append('  %-10s%s' % (status, count))
+        lines += ['', 'Latency']
+        for p, value in snapshot.percentiles.items():
+            lines.append('  %-10s%s' % ('p%s' % p, '-' if value is None else '%.1f ms' % (value * 1000)))
+        if snapshot.max is not None:
+            lines.append('  %-10s%.1f ms' % ('max', snapshot.max * 1000))
+
+        self.report_text_edit.setPlainText('\n'.join(lines))
+
+        if not snapshot.running:
+            self.timer.stop()
+            self.start_button.setText('Start')
+
+    def closeEvent(self, event):
+        if self.load_test is not None:
+            self.load_test.stop()
+        self.timer.stop()
+        super().closeEvent(event)
+
+
+class CollectionDialog(QDialog):
+    COLUMNS = ('Route', 'Status', 'Latency', 'Size', 'Details')
+
+    def __init__(self, routes, title, parent=None, complete=True):
+        super().__init__(parent)
+        self.routes = routes
+        # whether `routes` are all the routes, see check_dependencies
+        self.complete = complete
+        self.run = None
+        self.shown = 0
+        self.rows = {route: row for row, route in enumerate(routes)}
+
+        self.setWindowTitle('Run: %s' % title)
+
+        self.parallelism_input = QSpinBox()
+        self.parallelism_input.setRange(1, 100)
+        self.parallelism_input.setValue(int(load_setting('collection_parallelism') or DEFAULT_PARALLELISM))
+
+        self.start_button = QPushButton('Start')
+        self.start_button.clicked.connect(self.toggle)
+
+        self.summary_label = QLabel('%s routes' % len(routes))
+
+        self.table = QTableWidget(len(routes), len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setFont(TEXT_FONT)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self._reset_rows()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(200)
+        self.timer.timeout.connect(self.update_results)
+
+        form = QFormLayout()
+        form.addRow('Parallel routes', self.parallelism_input)
+
+        layout = QVBoxLayout()
+        layout.addLayout(form)
+        layout.addWidget(self.start_button)
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+        self.resize(800, 500)
+
+    def _set_row(self, row, values, color=None):
+        for column, value in enumerate(values):
+            item = QTableWidgetItem(value)
+            if color is not None and column == 1:
+                item.setForeground(QColor(color))
+            self.table.setItem(row, column, item)
+
+    def _reset_rows(self):
+        for row, route in enumerate(self.routes):
+            self._set_row(row, (route.raw_display_name, '', '', '', ''))
+
+    def toggle(self):
+        if self.run is not None and self.run.is_running():
+            self.run.stop()
+            return
+
+        save_setting('collection_parallelism', self.parallelism_input.value())
+        try:
+            self.run = CollectionRun(self.routes, parallelism=self.parallelism_input.value(), complete=self.complete)
+        except CaribouException as e:
+            self.summary_label.setText(str(e))
+            return
+
+        self.shown = 0
+        self._reset_rows()
+        self.run.start()
+        self.start_button.setText('Stop')
+        self.timer.start()
+
+    def update_results(self):
+        running = self.run.is_running()
+        for result in self.run.results_since(self.shown):
+            self.shown += 1
+            if result.ok:
+                color = '#1FDA9A'
+            elif result.status == SKIPPED:
+                color = '#808080'
+            else:
+                color = '#DB3340'
+            self._set_row(self.rows[result.route], (
+                result.route.raw_display_name,
+                str(result.status),
+                '%s ms' % int(result.elapsed * 1000),
+                format_size(result.size),
+                result.error or result.url or '',
+            ), color)
+
+        summary = self.run.summary()
+        self.summary_label.setText('\n'.join(
+            ['%(passed)s passed, %(failed)s failed, %(skipped)s skipped, %(not_run)s not run in %(elapsed).1fs' % summary]
+            + self.run.dropped_messages()
+        ))
+
+        if not running:
+            self.timer.stop()
+            self.start_button.setText('Start')
+
+    def closeEvent(self, event):
+        if self.run is not None:
+            self.run.stop()
+        self.timer.stop()
+        super().closeEvent(event)
+
+
+class RoutePanes(NamedTuple):
+    route: Route
+    parameter_widget: QWidget
+    result_widget: QWidget
+
+    def memory_size(self):
+        return self.parameter_widget.memory_size() + self.result_widget.memory_size()
+
+    def is_busy(self):
+        return self.result_widget.active_worker is not None
+
+
+class PaneCache:
+    def __init__(self, max_panes=None, memory_budget=None):
+        self.max_panes = max_panes or int(load_setting('pane_cache_size') or DEFAULT_PANE_CACHE_SIZE)
+        self.memory_budget = memory_budget or int(load_setting('pane_cache_memory') or DEFAULT_PANE_CACHE_MEMORY)
+        # route key -> RoutePanes, least recently shown first
+        self.panes = OrderedDict()
+
+    def get(self, route):
+        panes = self.panes.get(route.key)
+        if panes is None or panes.route is not route:
+            return None
+        self.panes.move_to_end(route.key)
+        return panes
+
+    def add(self, panes):
+        self.panes[panes.route.key] = panes
+        self.panes.move_to_end(panes.route.key)
+
+    def pop(self, key):
+        return self.panes.pop(key, None)
+
+    def swap(self, old, new):
+        panes = self.panes.get(old.key)
+        if panes is not None and panes.route is old:
+            panes.parameter_widget.set_route(new)
+            panes.result_widget.set_route(new)
+            self.panes[new.key] = panes._replace(route=new)
+
+    def evict(self, current_key):
+        # returns the panes to destroy, oldest first; the shown pane and
+        # panes with a request in flight are kept
+        total = sum(panes.memory_size() for panes in self.panes.values())
+        evicted = []
+        for key in list(self.panes):
+            if len(self.panes) <= self.max_panes and total <= self.memory_budget:
+                break
+            panes = self.panes[key]
+            if key == current_key or panes.is_busy():
+                continue
+            del self.panes[key]
+            total -= panes.memory_size()
+            evicted.append(panes)
+        return evicted
 
 
 class MainWidget(QWidget):
-    def __init__(self, routes):
+    @traced('MainWidget')
+    def __init__(self, routes, sections=None):
         super().__init__()
 
         self.layout = QHBoxLayout()
 
-        self.route_list_widget = SearchRouteList(routes)
+        self.route_list_widget = SearchRouteList(routes, sections)
         self.parameter_widget = ParameterWidget()
         self.result_widget = ResultWidget()
+        self.empty_panes = RoutePanes(None, self.parameter_widget, self.result_widget)
+        self.pane_cache = PaneCache()
+
+        self.parameter_stack = QStackedWidget()
+        self.parameter_stack.addWidget(self.parameter_widget)
+        self.result_stack = QStackedWidget()
+        self.result_stack.addWidget(self.result_widget)
 
         self.selected_route = None
 
         self.route_list_widget.route_list.new_route_signal.connect(self.set_route)
 
+        # one shortcut for all the cached panes, sent to the shown one
+        self.shortcut = QShortcut(QKeySequence("Ctrl+Return"), self, lambda: self.result_widget.make_request())
+
         self.layout.addWidget(self.route_list_widget)
-        self.layout.addWidget(self.parameter_widget, stretch=1)
-        self.layout.addWidget(self.result_widget, stretch=1)
+        self.layout.addWidget(self.parameter_stack, stretch=1)
+        self.layout.addWidget(self.result_stack, stretch=1)
 
         self.setLayout(self.layout)
 
@@ -644,22 +2027,72 @@ class MainWidget(QWidget):
             self.route_list_widget.focus()
             e.accept()
 
+    def _destroy_panes(self, panes):
+        if panes.is_busy():
+            panes.result_widget.cancel_request()
+        for stack, widget in ((self.parameter_stack, panes.parameter_widget), (self.result_stack, panes.result_widget)):
+            stack.removeWidget(widget)
+            widget.deleteLater()
+
+    def apply_diff(self, routes, diff, sections=None):
+        self.route_list_widget.apply_diff(routes, diff, sections)
+
+        # panes of changed routes were built for other parameters
+        for route in diff.removed:
+            panes = self.pane_cache.pop(route.key)
+            if panes is not None:
+                self._destroy_panes(panes)
+        for old, new in diff.changed:
+            panes = self.pane_cache.pop(old.key)
+            if panes is not None:
+                self._destroy_panes(panes)
+        for old, new in diff.unchanged:
+            self.pane_cache.swap(old, new)
+
+        if self.selected_route is None:
+            return
+
+        key = self.selected_route.key
+        if any(route.key == key for route in diff.removed):
+            self.set_route(None)
+            return
+        for old, new in diff.changed:
+            if old.key == key:
+                self.set_route(new)
+                return
+        for old, new in diff.unchanged:
+            if old.key == key:
+                self.selected_route = new
+                return
+
+    @traced('set_route')
     def set_route(self, route):
         self.selected_route = route
 
-        self.layout.removeWidget(self.parameter_widget)
-        self.parameter_widget.setParent(None)
+        if route is None:
+            panes = self.empty_panes
+        else:
+            panes = self.pane_cache.get(route)
+            if panes is None:
+                panes = RoutePanes(route, ParameterWidget(route), ResultWidget(route))
+                panes.result_widget.result_signal.connect(panes.parameter_widget.update_context_status)
+                self.parameter_stack.addWidget(panes.parameter_widget)
+                self.result_stack.addWidget(panes.result_widget)
+                self.pane_cache.add(panes)
+            else:
+                panes.parameter_widget.refresh_values()
 
-        self.layout.removeWidget(self.result_widget)
-        self.result_widget.setParent(None)
+        self.parameter_widget = panes.parameter_widget
+        self.result_widget = panes.result_widget
+        self.parameter_stack.setCurrentWidget(self.parameter_widget)
+        self.result_stack.setCurrentWidget(self.result_widget)
 
-        self.parameter_widget = ParameterWidget(route)
-        self.result_widget = ResultWidget(route)
-        self.layout.addWidget(self.parameter_widget, stretch=1)
-        self.layout.addWidget(self.result_widget, stretch=1)
+        if route is not None:
+            for evicted in self.pane_cache.evict(route.key):
+                self._destroy_panes(evicted)
 
-    def set_route_with_name(self, name):
-        self.route_list_widget.select_route_with_name(name)
+    def set_route_with_key(self, key):
+        self.route_list_widget.select_route_with_key(key)
 
     def set_search(self, text):
         self.route_list_widget.set_search(text)
@@ -673,6 +2106,10 @@ class MainWindow(QMainWindow):
         super().__init__()
 
         self.widget = None
+        self.routes = None
+        self.workspace = None
+        self.load_test_dialog = None
+        self.collection_dialog = None
 
         if path is None:
             path = load_setting('file_path')
@@ -693,22 +2130,95 @@ class MainWindow(QMainWindow):
         open_action.setStatusTip('Open config file')
         open_action.triggered.connect(self.query_open)
 
+        open_workspace_action = QAction('Open &workspace', self)
+        open_workspace_action.setShortcut('Ctrl+Shift+O')
+        open_workspace_action.setStatusTip('Open a directory of route modules')
+        open_workspace_action.triggered.connect(self.query_open_workspace)
+
         reload_action = QAction('&Reload', self)
         reload_action.setShortcut('Ctrl+R')
         reload_action.setStatusTip('Reload config file')
         reload_action.triggered.connect(self.query_reload)
 
+        connection_stats_action = QAction('&Connection stats', self)
+        connection_stats_action.setStatusTip('Show connection pool statistics')
+        connection_stats_action.triggered.connect(self.show_connection_stats)
+
+        http_cache_action = QAction('&HTTP cache', self)
+        http_cache_action.setCheckable(True)
+        http_cache_action.setChecked(bool(load_setting('http_cache')))
+        http_cache_action.setStatusTip('Reuse and revalidate cacheable GET responses')
+        http_cache_action.toggled.connect(lambda checked: save_setting('http_cache', checked))
+
+        clear_http_cache_action = QAction('C&lear HTTP cache', self)
+        clear_http_cache_action.triggered.connect(get_http_cache().clear)
+
         menubar = self.menuBar()
         fileMenu = menubar.addMenu('&File')
         fileMenu.addAction(open_action)
+        fileMenu.addAction(open_workspace_action)
         fileMenu.addAction(reload_action)
+        fileMenu.addAction(connection_stats_action)
+        fileMenu.addAction(http_cache_action)
+        fileMenu.addAction(clear_http_cache_action)
 
         # copy_curl_action = QAction('Copy curl command', self)
         # copy_curl_action.setStatusTip('Copy curl command')
         # copy_curl_action.triggered.connect(self.copy_curl_command)
 
-        # routeMenu = menubar.addMenu('&Route')
+        load_test_action = QAction('&Load test', self)
+        load_test_action.setShortcut('Ctrl+L')
+        load_test_action.setStatusTip('Load test the selected route')
+        load_test_action.triggered.connect(self.show_load_test)
+
+        send_to_file_action = QAction('&Send to file...', self)
+        send_to_file_action.setShortcut('Ctrl+Shift+Return')
+        send_to_file_action.setStatusTip('Send the selected route and save the response body to a file')
+        send_to_file_action.triggered.connect(self.send_to_file)
+
+        run_group_action = QAction('Run &group', self)
+        run_group_action.setShortcut('Ctrl+Shift+G')
+        run_group_action.setStatusTip('Run every route of the selected route group')
+        run_group_action.triggered.connect(self.show_run_group)
+
+        run_all_action = QAction('Run &all', self)
+        run_all_action.setShortcut('Ctrl+Shift+A')
+        run_all_action.setStatusTip('Run every route')
+        run_all_action.triggered.connect(self.show_run_all)
+
+        routeMenu = menubar.addMenu('&Route')
         # routeMenu.addAction(copy_curl_action)
+        routeMenu.addAction(send_to_file_action)
+        routeMenu.addAction(load_test_action)
+        routeMenu.addAction(run_group_action)
+        routeMenu.addAction(run_all_action)
+
+        tracer = get_tracer()
+        self.trace_action = QAction('&Enable tracing', self)
+        self.trace_action.setCheckable(True)
+        self.trace_action.setChecked(tracer.enabled)
+        self.trace_action.setStatusTip('Record spans of the slow operations')
+        self.trace_action.toggled.connect(self.toggle_tracing)
+
+        export_trace_action = QAction('E&xport trace...', self)
+        export_trace_action.setStatusTip('Save the recorded spans as a Chrome trace (open it in Perfetto)')
+        export_trace_action.triggered.connect(self.export_trace)
+
+        clear_trace_action = QAction('&Clear trace', self)
+        clear_trace_action.triggered.connect(tracer.clear)
+
+        traceMenu = menubar.addMenu('&Trace')
+        traceMenu.addAction(self.trace_action)
+        traceMenu.addAction(export_trace_action)
+        traceMenu.addAction(clear_trace_action)
+
+        # live summary of the slowest spans while tracing
+        self.trace_label = QLabel()
+        self.statusBar().addPermanentWidget(self.trace_label)
+        self.trace_timer = QTimer(self)
+        self.trace_timer.setInterval(1000)
+        self.trace_timer.timeout.connect(self.update_trace_summary)
+        self.toggle_tracing(tracer.enabled)
 
         self.setFont(FONT)
         self.setWindowTitle('Caribou')
@@ -726,53 +2236,188 @@ class MainWindow(QMainWindow):
         if path is not None:
             self.open_file(path)
 
+    def query_open_workspace(self):
+        path = QFileDialog.getExistingDirectory(self, "Open Workspace", os.path.expanduser("~"))
+
+        if path:
+            self.open_file(path)
+
     def open_file(self, path):
+        self.workspace = Workspace(path) if os.path.isdir(path) else None
+
         self.file_watcher = QFileSystemWatcher()
-        self.file_watcher.addPath(path)
         self.file_watcher.fileChanged.connect(self.reload)
+        self.file_watcher.directoryChanged.connect(self.reload)
 
         save_setting('file_path', path)
         persist_storage()
 
         self.path = path
+        # a new file is always rebuilt from scratch
+        self.routes = None
         self.reload(path)
 
     # def copy_curl_command(self):
     #     pass
 
+    def show_load_test(self):
+        route = self.widget.selected_route if self.widget is not None else None
+        if route is None:
+            self.statusBar().showMessage('Select a route first', 3000)
+            return
+        self.load_test_dialog = LoadTestDialog(route, self)
+        self.load_test_dialog.show()
+
+    def send_to_file(self):
+        route = self.widget.selected_route if self.widget is not None else None
+        if route is None:
+            self.statusBar().showMessage('Select a route first', 3000)
+            return
+        path = QFileDialog.getSaveFileName(self, "Save Response", str(download_dir() / route.name))[0]
+        if path:
+            self.widget.result_widget.make_request(download=path)
+
+    def _show_collection(self, routes, title, complete=True):
+        if not routes:
+            self.statusBar().showMessage('No route to run', 3000)
+            return
+        if self.collection_dialog is not None:
+            self.collection_dialog.close()
+        self.collection_dialog = CollectionDialog(routes, title, self, complete)
+        self.collection_dialog.show()
+
+    def show_run_group(self):
+        route = self.widget.selected_route if self.widget is not None else None
+        if route is None or route.group is None:
+            self.statusBar().showMessage('Select a route of a group first', 3000)
+            return
+        routes = [other for other in self.routes if other.group is route.group]
+        self._show_collection(routes, route.group.name, complete=False)
+
+    def show_run_all(self):
+        routes = self.routes or []
+        if self.workspace is not None:
+            try:
+                routes = self.workspace.load_all()
+            except Exception:
+                self._show_error(traceback.format_exc())
+                return
+            self._show_routes(routes, self.workspace.sections())
+        self._show_collection(routes, os.path.basename(self.path))
+
+    def show_connection_stats(self):
+        lines = [
+            '%s: %s reused / %s new' % (stats.host, stats.reused_connections, stats.new_connections)
+            for stats in get_transport().all_stats()
+        ]
+        msgBox = QMessageBox()
+        msgBox.setText('\n'.join(lines) or 'No connections')
+        msgBox.exec_()
+
     def query_reload(self):
         return self.reload(self.path)
 
-    def reload(self, path):
-        current_route = self.widget.selected_route if self.widget is not None else None
-        current_search = self.widget.current_search() if self.widget is not None else None
+    def toggle_tracing(self, enabled):
+        get_tracer().enabled = enabled
+        self.trace_label.setVisible(enabled)
+        if enabled:
+            self.update_trace_summary()
+            self.trace_timer.start()
+        else:
+            self.trace_timer.stop()
+
+    def update_trace_summary(self):
+        tracer = get_tracer()
+        self.trace_label.setText(tracer.summary())
+        with tracer.lock:
+            lines = [
+                '%s: %s calls, %.1f ms max, %.1f ms total' % (name, stats.count, stats.max * 1000, stats.total * 1000)
+                for name, stats in sorted(tracer.stats.items())
+            ]
+        self.trace_label.setToolTip('\n'.join(lines))
+
+    def export_trace(self):
+        path = QFileDialog.getSaveFileName(
+            self, "Export Trace", os.path.expanduser("~/caribou-trace.json"), "Trace file (*.json)"
+        )[0]
+        if path:
+            get_tracer().export(path)
+            self.statusBar().showMessage('Trace saved to %s' % path, 3000)
+
+    def _show_error(self, text):
+        msgBox = QMessageBox()
+        msgBox.setText(text)
+        msgBox.exec_()
+
+    def _watch(self):
+        # editors that save by replacing the file drop it from the watcher
+        paths = self.workspace.watched_paths() if self.workspace is not None else [self.path]
+        watched = set(self.file_watcher.files() + self.file_watcher.directories())
+        missing = [path for path in paths if path not in watched and os.path.exists(path)]
+        if missing:
+            self.file_watcher.addPaths(missing)
+
+    def reload(self, path=None):
+        if self.workspace is not None:
+            # only the modules that were loaded and changed are executed again
+            errors = self.workspace.refresh()
+            if errors:
+                self._show_error('\n'.join(errors))
+            self._watch()
+            self._show_routes(self.workspace.routes(), self.workspace.sections())
+            return
 
-        assert path == self.path
+        self._watch()
         try:
             routes = load_file(self.path)
         except Exception as e:
-            msgBox = QMessageBox()
             if isinstance(e, CaribouException):
-                msgBox.setText(str(e))
+                self._show_error(str(e))
             else:
-                msgBox.setText(traceback.format_exc())
-            msgBox.exec_()
+                self._show_error(traceback.format_exc())
 
+            if self.routes is not None:
+                # keep the current routes until the file loads again
+                return
             routes = []
 
+        self._show_routes(routes)
+
+    def load_sections(self, names):
+        for name in names:
+            try:
+                self.workspace.load_module(name)
+            except Exception:
+                self._show_error(traceback.format_exc())
+        self._show_routes(self.workspace.routes(), self.workspace.sections())
+
+    def _show_routes(self, routes, sections=None):
+        if self.widget is not None and self.routes is not None:
+            # patch the existing widgets, unchanged routes keep their state
+            with span('apply_diff'):
+                self.widget.apply_diff(routes, diff_routes(self.routes, routes), sections)
+            self.routes = routes
+            return
+
+        current_route = self.widget.selected_route if self.widget is not None else None
+        current_search = self.widget.current_search() if self.widget is not None else None
+
         if self.widget:
             self.widget.setParent(None)
-        self.widget = MainWidget(routes)
+        self.widget = MainWidget(routes, sections)
+        self.widget.route_list_widget.route_list.load_sections_signal.connect(self.load_sections)
         self.setCentralWidget(self.widget)
+        self.routes = routes
 
         if current_route is not None:
-            self.widget.set_route_with_name(current_route.name)
+            self.widget.set_route_with_key(current_route.key)
         if current_search is not None:
             self.widget.set_search(current_search)
 
 
 def run(path=None):
     load_storage()
+    prune_spill_files()
 
     app = QApplication(sys.argv)
     form = MainWindow(path)
@@ -783,7 +2428,10 @@ def run(path=None):
     form.resize(width, height)
 
     form.show()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    get_transport().close()
+    get_engine().close()
+    sys.exit(exit_code)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,224 @@
+import io
+import os
+import time
+import uuid
+import mimetypes
+from urllib.parse import urlencode
+
+from .models import File
+from .exceptions import CaribouException
+from .response import PROGRESS_INTERVAL, format_size
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+
+def _encode(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+def guess_content_type(filename):
+    return mimetypes.guess_type(filename or '')[0] or DEFAULT_CONTENT_TYPE
+
+
+def source_size(source):
+    # bytes left to read, None when a file-like object can't tell
+    if isinstance(source, File):
+        try:
+            return os.path.getsize(source.path)
+        except OSError:
+            raise CaribouException('Upload file not found: %s' % source.path)
+    if isinstance(source, (bytes, str)):
+        return len(_encode(source))
+    try:
+        return os.fstat(source.fileno()).st_size - source.tell()
+    except (AttributeError, OSError):
+        pass
+    try:
+        position = source.tell()
+        end = source.seek(0, os.SEEK_END)
+        source.seek(position)
+        return end - position
+    except (AttributeError, OSError):
+        return None
+
+
+class UploadStream:
+    # a request body read part by part as it is sent: files are opened when
+    # reading reaches them and never loaded whole. requests and http.client
+    # take the length from `len` and read it in blocks.
+    def __init__(self, parts, on_progress=None):
+        self.parts = parts
+        sizes = [source_size(part) for part in parts]
+        if None in sizes:
+            raise CaribouException('Upload size is unknown, use caribou.File or a seekable file')
+        self.len = sum(sizes)
+        self.on_progress = on_progress
+        self.position = 0
+        self.index = 0
+        self.current = None
+        # where the caller's file objects started, to rewind them
+        self.starts = {}
+        self.last_progress = 0
+
+    def _open(self, part):
+        if isinstance(part, File):
+            return open(part.path, 'rb')
+        if isinstance(part, (bytes, str)):
+            return io.BytesIO(_encode(part))
+        self.starts.setdefault(self.index, part.tell() if hasattr(part, 'tell') else None)
+        return part
+
+    def _close_current(self):
+        if self.current is not None and self.current is not self.parts[self.index]:
+            self.current.close()
+        self.current = None
+
+    def _report(self):
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        if self.position >= self.len or now - self.last_progress >= PROGRESS_INTERVAL:
+            self.last_progress = now
+            self.on_progress(self.position, self.len)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.len - self.position
+        chunks = []
+        remaining = size
+        while remaining > 0 and self.index < len(self.parts):
+            if self.current is None:
+                self.current = self._open(self.parts[self.index])
+            chunk = self.current.read(min(remaining, UPLOAD_CHUNK_SIZE))
+            if not chunk:
+                self._close_current()
+                self.index += 1
+                continue
+            chunk = _encode(chunk)
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        data = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        self.position += len(data)
+        if data:
+            self._report()
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # only rewinding is supported, for redirects and retries
+        if offset != 0 or whence != os.SEEK_SET:
+            raise io.UnsupportedOperation('UploadStream can only be rewound')
+        if self.index < len(self.parts):
+            self._close_current()
+        for index, start in self.starts.items():
+            if start is None:
+                raise io.UnsupportedOperation('Upload file object can not be rewound')
+            self.parts[index].seek(start)
+        self.index = 0
+        self.position = 0
+        return 0
+
+    def close(self):
+        if self.index < len(self.parts):
+            self._close_current()
+
+
+def _quote(value):
+    return str(value).replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+def file_field(name, value):
+    # (filename, source, content type) of a multipart file
+    if isinstance(value, File):
+        filename = value.filename or os.path.basename(value.path)
+        return filename, value, value.content_type or guess_content_type(filename)
+    if isinstance(value, (bytes, str)):
+        return name, value, DEFAULT_CONTENT_TYPE
+    filename = os.path.basename(str(getattr(value, 'name', '') or '')) or name
+    return filename, value, guess_content_type(filename)
+
+
+def _form_items(fields):
+    for name, value in (fields or {}).items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for item in values:
+            yield name, item
+
+
+def multipart_parts(fields, files, boundary):
+    parts = []
+    for name, value in _form_items(fields):
+        head = '--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n' % (boundary, _quote(name))
+        parts.append(head.encode('utf-8') + _encode(value if isinstance(value, bytes) else str(value)) + b'\r\n')
+    for name, value in files.items():
+        filename, source, content_type = file_field(name, value)
+        head = '--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: %s\r\n\r\n' % (
+            boundary, _quote(name), _quote(filename), content_type
+        )
+        parts += [head.encode('utf-8'), source, b'\r\n']
+    parts.append(('--%s--\r\n' % boundary).encode('utf-8'))
+    return parts
+
+
+def upload_body(data, files, on_progress=None):
+    # returns (data for requests, content type), the content type is None
+    # when requests or the route's headers set it
+    if files:
+        if data is not None and not isinstance(data, dict):
+            raise CaribouException('Request data must be a dict of form fields when files are sent')
+        boundary = uuid.uuid4().hex
+        stream = UploadStream(multipart_parts(data, files, boundary), on_progress)
+        return stream, 'multipart/form-data; boundary=%s' % boundary
+    if data is None or isinstance(data, dict):
+        # form fields are urlencoded by requests
+        return data, None
+    if isinstance(data, File):
+        return UploadStream([data], on_progress), data.content_type or guess_content_type(data.path)
+    if not isinstance(data, (bytes, str)) and source_size(data) is None:
+        # a pipe or socket, sent with chunked encoding
+        return data, None
+    return UploadStream([data], on_progress), None
+
+
+def describe_source(source):
+    if isinstance(source, File):
+        try:
+            size = format_size(os.path.getsize(source.path))
+        except OSError:
+            size = 'not found'
+        return '<file %s, %s>' % (source.path, size)
+    size = source_size(source)
+    return '<%s, %s>' % (type(source).__name__, 'unknown size' if size is None else format_size(size))
+
+
+def describe_upload(data, files):
+    # a summary for the preview, files are never read
+    if files:
+        lines = []
+        total = 0
+        for name, value in _form_items(data):
+            lines.append('%s: %s' % (name, describe_source(value) if isinstance(value, bytes) else value))
+            total += len(value if isinstance(value, bytes) else str(value).encode('utf-8'))
+        for name, value in files.items():
+            filename, source, content_type = file_field(name, value)
+            try:
+                total += source_size(source) or 0
+            except CaribouException:
+                pass
+            lines.append('%s: %s %s (%s)' % (name, filename, describe_source(source), content_type))
+        return '\n'.join(['multipart/form-data, %s + headers' % format_size(total)] + lines)
+    if isinstance(data, dict):
+        return urlencode(list(_form_items(data)))
+    if isinstance(data, str):
+        return data
+    return describe_source(data)
@@ -8,6 +8,7 @@ setup(
         'pyside2',
         'Pygments',
         'requests',
+        'certifi',
         'packaging',
     ],
     entry_points='''